@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Engine benchmark - the cost of a one second tick for 10 to 100,000 tenants' timer sequences, with the sequence engine
+# against ticking every timer. Tenants start at times spread over a work timer, and go straight to their next timer
+# when one completes, so timers are completing throughout. Run from the src directory:
+#
+#   python -m benchmarks.engine --seconds 600 --output engine.json
+
+import argparse
+import json
+import logging
+import statistics
+import time
+
+import timers.engine as engine
+import timers.timer_seq as timer_seq
+
+SIZES = (10, 100, 1000, 10000, 100000)
+
+# Ticking every timer is only run up to this many tenants, beyond that it takes too long to be worth waiting for.
+NAIVE_MAX_SEQUENCES = 10000
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def time_source(self):
+        return self.now
+
+
+# Tick the engine once a simulated second and return the time each tick took, with the timers completed on each.
+def run_engine(sequences, seconds):
+    fake = FakeTime()
+    sequence_engine = engine.SequenceEngine(fake.time_source, auto_advance=True)
+
+    for tenant in range(sequences):
+        fake.now = tenant * 25 * 60 / sequences
+        sequence_engine.add_sequence(tenant, start=True)
+
+    tick_times = []
+    completions = []
+
+    for second in range(seconds):
+        fake.now = 25 * 60 + second
+
+        start = time.perf_counter()
+        completions.append(sequence_engine.tick())
+        tick_times.append(time.perf_counter() - start)
+
+    return tick_times, completions
+
+
+# Tick every timer once a simulated second, as the clock does for its one sequence.
+def run_naive(sequences, seconds):
+    timer_sequences = [timer_seq.TimerSequence() for tenant in range(sequences)]
+
+    for tenant, sequence in enumerate(timer_sequences):
+        sequence.current_timer.start()
+        sequence.advance(int(tenant * 25 * 60 / sequences))
+
+    tick_times = []
+
+    for second in range(seconds):
+        start = time.perf_counter()
+
+        for sequence in timer_sequences:
+            sequence.decrement_current_timer()
+
+            if sequence.current_timer.return_state() == 'complete':
+                sequence.next_timer()
+
+        tick_times.append(time.perf_counter() - start)
+
+    return tick_times
+
+
+def summarise(tick_times):
+    ordered = sorted(tick_times)
+    return {'mean_us': statistics.mean(ordered) * 1e6,
+            'p50_us': ordered[len(ordered) // 2] * 1e6,
+            'p99_us': ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1e6,
+            'max_us': ordered[-1] * 1e6}
+
+
+def run_size(sequences, seconds, naive_max):
+    tick_times, completions = run_engine(sequences, seconds)
+
+    # Ticks where nothing completed show the fixed cost of a tick.
+    idle_tick_times = [tick_time for tick_time, completed in zip(tick_times, completions) if completed == 0]
+    busy_time = sum(tick_time for tick_time, completed in zip(tick_times, completions) if completed)
+
+    result = {'sequences': sequences,
+              'seconds': seconds,
+              'engine': summarise(tick_times),
+              'engine_idle': summarise(idle_tick_times) if idle_tick_times else None,
+              'completions_per_tick': sum(completions) / seconds,
+              'us_per_completion': busy_time / sum(completions) * 1e6 if sum(completions) else 0.0,
+              'naive': None}
+
+    if sequences <= naive_max:
+        result['naive'] = summarise(run_naive(sequences, seconds))
+
+    return result
+
+
+def print_result(result):
+    idle = f"{result['engine_idle']['mean_us']:10.2f}us" if result['engine_idle'] else f"{'-':>12}"
+    naive = f"{result['naive']['mean_us']:12.1f}us" if result['naive'] else f"{'-':>14}"
+
+    print(f"{result['sequences']:>8} {result['engine']['mean_us']:10.2f}us {result['engine']['p99_us']:10.2f}us "
+          f"{idle} {result['completions_per_tick']:8.2f} {result['us_per_completion']:8.2f}us {naive}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the per tick cost of the sequence engine.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="numbers of sequences to run")
+    parser.add_argument('--seconds', type=int, default=600, help="simulated seconds to tick through")
+    parser.add_argument('--naive-max', type=int, default=NAIVE_MAX_SEQUENCES,
+                        help="largest number of sequences to tick every timer for")
+    parser.add_argument('--output', help="save the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Measure the engine rather than the log file - every next timer is logged.
+    logging.getLogger('raspidoroLogger').setLevel(logging.WARNING)
+
+    print(f"{'tenants':>8} {'tick mean':>12} {'tick p99':>12} {'idle mean':>12} {'done/tick':>8} "
+          f"{'per done':>10} {'every timer':>14}")
+
+    results = []
+    for sequences in args.sizes:
+        results.append(run_size(sequences, args.seconds, args.naive_max))
+        print_result(results[-1])
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Render benchmark - drives the off-screen display with synthetic clock data and reports frames per second and the time
+# taken by each stage of rendering. Frames are converted to the bytes the LCD would be sent, so the push stage includes
+# the RGB565 conversion. Run from the src directory, so the background images are found:
+#
+#   python -m benchmarks.render --frames 500 --font-path /usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf
+
+import argparse
+import datetime
+import statistics
+import time
+
+import display
+import timers.timer as timer
+
+WORK_INFO = display.TimerInfo('Work 1', 'Work', 25 * 60, timer.WORK_COLOUR, 'Work')
+BREAK_INFO = display.TimerInfo('Break 1', 'Short Break - Stretch', 5 * 60, timer.BREAK_COLOUR, 'Break')
+
+
+# Normal running - the countdown and clock move on one second per frame.
+def countdown_stream(frames, start=datetime.datetime(2026, 1, 1, 9, 0, 0)):
+    for frame in range(frames):
+        yield display.CurrentData(start + datetime.timedelta(seconds=frame),
+                                  display.CurrentTimerData(WORK_INFO, 25 * 60 - frame))
+
+
+# Timer overrun - negative countdown.
+def overrun_stream(frames, start=datetime.datetime(2026, 1, 1, 9, 0, 0)):
+    for frame in range(frames):
+        yield display.CurrentData(start + datetime.timedelta(seconds=frame),
+                                  display.CurrentTimerData(BREAK_INFO, -1 - frame))
+
+
+# Worst case - the timer changes every frame, so the static layer is rendered every frame.
+def timer_change_stream(frames, start=datetime.datetime(2026, 1, 1, 9, 0, 0)):
+    for frame in range(frames):
+        yield display.CurrentData(start + datetime.timedelta(seconds=frame),
+                                  display.CurrentTimerData(WORK_INFO if frame % 2 else BREAK_INFO, 300 - frame))
+
+
+STREAMS = {'countdown': countdown_stream,
+           'overrun': overrun_stream,
+           'timer_change': timer_change_stream}
+
+
+# Collects the stage timings reported by the display.
+class StageTimes:
+    def __init__(self):
+        self.times = {}
+
+    def record(self, stage, seconds):
+        self.times.setdefault(stage, []).append(seconds)
+
+
+# Render a stream of data on an off-screen display and return the frame rate and stage timings.
+def run_stream(stream_name, frames, font_path=display.FONT_PATH, dump_dir=None, native_rgb565=False):
+    stage_times = StageTimes()
+    offscreen = display.OffscreenDisplay(lambda: None, lambda: None, lambda: None, font_path=font_path,
+                                         on_stage=stage_times.record, dump_dir=dump_dir,
+                                         native_rgb565=native_rgb565, emulate_panel=True)
+
+    frame_times = []
+    for current_data in STREAMS[stream_name](frames):
+        start = time.perf_counter()
+        offscreen.current_data = current_data
+        offscreen.update_display()
+        frame_times.append(time.perf_counter() - start)
+
+    return {'stream': stream_name,
+            'frames': frames,
+            'rgb565': native_rgb565,
+            'fps': len(frame_times) / sum(frame_times),
+            'frame': summarise(frame_times),
+            'stages': {stage: summarise(times) for stage, times in stage_times.times.items()},
+            'image_cache': offscreen.image_manager.return_cache_stats()}
+
+
+# Return the mean, median, 95th percentile and max of a list of times, in milliseconds.
+def summarise(times):
+    ordered = sorted(times)
+    return {'mean_ms': statistics.mean(ordered) * 1000,
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000,
+            'max_ms': ordered[-1] * 1000}
+
+
+def print_result(result):
+    print(f"{result['stream']}{' (rgb565)' if result['rgb565'] else ''}: {result['frames']} frames, "
+          f"{result['fps']:.1f} fps, frame mean {result['frame']['mean_ms']:.3f}ms "
+          f"p95 {result['frame']['p95_ms']:.3f}ms")
+
+    for stage, summary in result['stages'].items():
+        print(f"    {stage:<10} mean {summary['mean_ms']:.3f}ms p50 {summary['p50_ms']:.3f}ms "
+              f"p95 {summary['p95_ms']:.3f}ms max {summary['max_ms']:.3f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the display render path without the hardware.")
+    parser.add_argument('--frames', type=int, default=300, help="frames to render per stream")
+    parser.add_argument('--stream', choices=list(STREAMS), action='append', help="stream(s) to run, default all")
+    parser.add_argument('--font-path', default=display.FONT_PATH, help="TrueType font to render with")
+    parser.add_argument('--dump-dir', help="save every rendered frame as a PNG in this directory")
+    parser.add_argument('--rgb565', action='store_true', help="render with the native RGB565 framebuffer")
+    args = parser.parse_args()
+
+    for name in args.stream or STREAMS:
+        print_result(run_stream(name, args.frames, args.font_path, args.dump_dir, args.rgb565))
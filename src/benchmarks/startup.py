@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Startup benchmark - starts the clock in a new process each run, with a stand in for the Display HAT Mini, and reports
+# how long each phase of the start up took and when the cached and real first frames were shown. The first run has no
+# cached frame. Exits with 1 if the first frame takes longer than the budget, so cold starts can be held to it. Run
+# from the src directory:
+#
+#   python -m benchmarks.startup --runs 5 --budget 3.0 --font-path /usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run in the new process - start the clock, wait for it to be ready and print the timings as JSON.
+CHILD = """
+import startup
+import json
+import os
+import sys
+import clock
+import timers.history as history
+
+startup_timer = startup.StartupTimer(budget_s=float(sys.argv[3]))
+phase_start = startup_timer.end_phase('imports', startup.IMPORT_TIME)
+
+# As the real driver, the stand in imports numpy.
+from benchmarks.stubs import StubDisplayHATMini
+phase_start = startup_timer.end_phase('import_driver', phase_start)
+
+clock_to_run = clock.Clock(displays=[], history=history.SessionHistory(':memory:'))
+startup_timer.end_phase('clock', phase_start)
+
+lcd_startup = startup.LcdStartup(clock_to_run, sys.argv[1], startup_timer, StubDisplayHATMini, font_path=sys.argv[2])
+lcd_startup.show_cached_frame()
+lcd_startup.start()
+lcd_startup.ready.wait()
+print(json.dumps(startup_timer.return_stats()), flush=True)
+
+# The LCD display keeps the clock running, so end the process once it has been timed.
+os._exit(0)
+"""
+
+
+# Start the clock in a new process and return its timings, with the time the process took to get to Python.
+def run_once(frame_cache_path, font_path, budget_s):
+    process_start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD, frame_cache_path, font_path, str(budget_s)],
+                            capture_output=True, text=True, check=True)
+    process_s = time.perf_counter() - process_start
+
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats['process_s'] = process_s
+
+    return stats
+
+
+def summarise(runs):
+    names = {name: None for run in runs for name in run['phases']}
+    milestones = {name: None for run in runs for name in run['milestones']}
+
+    return {'phases_ms': {name: statistics.median(run['phases'].get(name, 0.0) for run in runs) * 1000
+                          for name in names},
+            'milestones_s': {name: statistics.median(run['milestones'][name] for run in runs
+                                                     if name in run['milestones'])
+                             for name in milestones},
+            'process_s': statistics.median(run['process_s'] for run in runs)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the clock's start up.")
+    parser.add_argument('--runs', type=int, default=5, help="warm starts to run, after the cold one")
+    parser.add_argument('--budget', type=float, default=3.0, help="seconds allowed to the first frame")
+    parser.add_argument('--font-path', default='/usr/share/fonts/truetype/freefont/FreeSansBold.ttf')
+    parser.add_argument('--output', help="save the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        frame_cache_path = os.path.join(temp_dir, 'first_frame.rgb565')
+
+        cold = run_once(frame_cache_path, args.font_path, args.budget)
+        warm = [run_once(frame_cache_path, args.font_path, args.budget) for run in range(args.runs)]
+
+    results = {'cold': summarise([cold]), 'warm': summarise(warm), 'budget_s': args.budget}
+
+    for kind in ('cold', 'warm'):
+        summary = results[kind]
+        print(f"{kind}: process {summary['process_s']:.2f}s, " +
+              ', '.join(f"{name} at {seconds:.3f}s" for name, seconds in summary['milestones_s'].items()))
+        print('    ' + ', '.join(f"{name} {ms:.1f}ms" for name, ms in summary['phases_ms'].items()))
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    over_budget = [kind for kind in ('cold', 'warm')
+                   if results[kind]['milestones_s'].get('first_frame', float('inf')) > args.budget]
+
+    if over_budget:
+        print(f"First frame over the {args.budget:.2f}s budget: {', '.join(over_budget)}")
+        sys.exit(1)
@@ -0,0 +1,50 @@
+# Stand ins for the Display HAT Mini hardware, for benchmarking the LCD path without it. Only needs rgb565, so can be
+# used to time the start up without importing the displays first.
+
+import rgb565
+
+
+# Stand in for the ST7789 driver - converts frames the way the driver does, but sends them nowhere.
+class StubST7789:
+    def __init__(self, rotation=180):
+        self._rotation = rotation
+        self.bytes_sent = 0
+
+    def set_window(self):
+        pass
+
+    def data(self, data):
+        self.bytes_sent += len(data)
+
+    def display(self, image):
+        if rgb565.np is None:
+            self.data(image.tobytes())
+        else:
+            self.data(rgb565.Rgb565Framebuffer.from_image(image, self._rotation).to_panel_bytes())
+
+
+# Stand in for DisplayHATMini, with the same interface as far as LcdDisplay uses it.
+class StubDisplayHATMini:
+    WIDTH = 320
+    HEIGHT = 240
+
+    BUTTON_A = 5
+    BUTTON_B = 6
+    BUTTON_X = 16
+    BUTTON_Y = 24
+
+    def __init__(self, buffer, backlight_pwm=False):
+        self.buffer = buffer
+        self.st7789 = StubST7789()
+
+    def set_led(self, r=0, g=0, b=0):
+        pass
+
+    def on_button_pressed(self, callback):
+        pass
+
+    def read_button(self, pin):
+        return False
+
+    def display(self):
+        self.st7789.display(self.buffer)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Benchmark suite - times the timers, the timer sequence, the image manager and the LCD render path (with a stand in
+# for the Display HAT Mini), and saves the results as JSON so runs on different versions can be compared. Run from the
+# src directory, so the background images are found:
+#
+#   python -m benchmarks.suite --output results.json --font-path /usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf
+#   python -m benchmarks.suite --output new.json --compare results.json
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import display
+import rgb565
+import timers.timer as timer
+import timers.timer_seq as timer_seq
+from benchmarks import render
+from benchmarks.stubs import StubDisplayHATMini
+
+# Slower than the baseline by more than this fraction counts as a regression.
+REGRESSION_THRESHOLD = 0.10
+
+
+# Call a function number times per repeat and return the seconds per call of each repeat.
+def time_calls(function, number, repeat, setup=None):
+    per_call = []
+
+    for index in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        for call in range(number):
+            function()
+        per_call.append((time.perf_counter() - start) / number)
+
+    return per_call
+
+
+# Return the result of a benchmark from the seconds per call of each repeat. The minimum is the least noisy number, so
+# that is what comparisons use.
+def summarise(name, per_call, number, **extra):
+    result = {'name': name,
+              'calls': number * len(per_call),
+              'min_us': min(per_call) * 1e6,
+              'median_us': statistics.median(per_call) * 1e6,
+              'max_us': max(per_call) * 1e6}
+    result.update(extra)
+    return result
+
+
+def bench_timer_decrement(args):
+    work_timer = timer.WorkTimer('Work 1', 'Work', 25 * 60)
+
+    def setup():
+        work_timer.restart()
+        work_timer.start()
+
+    return [summarise('timer.decrement_time', time_calls(work_timer.decrement_time, 1500, args.repeat, setup), 1500)]
+
+
+# A whole 25 minute timer one second at a time, against one bulk advance.
+def bench_timer_advance(args):
+    work_timer = timer.WorkTimer('Work 1', 'Work', 25 * 60)
+
+    def setup():
+        work_timer.restart()
+        work_timer.start()
+
+    def decrement_all():
+        setup()
+        for second in range(25 * 60):
+            work_timer.decrement_time()
+
+    def advance_all():
+        setup()
+        work_timer.advance(25 * 60)
+
+    number = max(args.repeat // 5, 1)
+    return [summarise('timer.decrement_25min', time_calls(decrement_all, number, args.repeat), number),
+            summarise('timer.advance_25min', time_calls(advance_all, number, args.repeat), number)]
+
+
+def bench_next_timer(args):
+    sequence = timer_seq.TimerSequence()
+    return [summarise('timer_seq.next_timer', time_calls(sequence.next_timer, 200, args.repeat), 200)]
+
+
+# Frame fetches once cached (or memory mapped), and decoding every fetch with no cache.
+def bench_image_manager(args):
+    cached = display.ImageManager()
+    cached.set_image_series('moon')
+
+    uncached = display.ImageManager(cache_budget_bytes=0, asset_dir='')
+    uncached.set_image_series('moon', preload=False)
+
+    def fetch(image_manager):
+        return lambda: image_manager.get_frame(image_manager.get_current_image())
+
+    return [summarise('image_manager.get_frame_cached', time_calls(fetch(cached), 240, args.repeat), 240,
+                      cache=cached.return_cache_stats()),
+            summarise('image_manager.get_frame_decode', time_calls(fetch(uncached), 10, args.repeat), 10)]
+
+
+# LcdDisplay.update_display for each render benchmark stream, pushing to the stand in HAT.
+def bench_lcd_update_display(args):
+    results = []
+
+    for native_rgb565 in (False, True):
+        if native_rgb565 and rgb565.np is None:
+            continue
+
+        for stream_name, stream in render.STREAMS.items():
+            lcd = display.LcdDisplay(lambda: None, lambda: None, lambda: None, font_path=args.font_path,
+                                     native_rgb565=native_rgb565, hat_class=StubDisplayHATMini)
+            frames = list(stream(args.frames))
+            frame_iter = iter(frames)
+
+            def update():
+                lcd.current_data = next(frame_iter)
+                lcd.update_display()
+
+            # Each frame timed on its own, so the median and max show the frames that render the static layer.
+            per_frame = time_calls(update, 1, args.frames)
+            results.append(summarise(f"lcd.update_display.{stream_name}{'.rgb565' if native_rgb565 else ''}",
+                                     per_frame, 1))
+
+    return results
+
+
+BENCHMARKS = {'timer_decrement': bench_timer_decrement,
+              'timer_advance': bench_timer_advance,
+              'next_timer': bench_next_timer,
+              'image_manager': bench_image_manager,
+              'lcd_update_display': bench_lcd_update_display}
+
+
+# Return the commit the benchmarks are run on, if in a git repository.
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, args):
+    return {'created': datetime.datetime.now().isoformat(),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'results': [result for name in names for result in BENCHMARKS[name](args)]}
+
+
+# Compare results with a baseline run. Returns the names of the benchmarks that regressed.
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    baseline_results = {result['name']: result for result in baseline['results']}
+    regressions = []
+
+    print(f"Compared with {baseline.get('commit')} ({baseline.get('created')})")
+
+    for result in results['results']:
+        base = baseline_results.get(result['name'])
+        if base is None:
+            print(f"    {result['name']:<45} {result['min_us']:>12.3f}us  (new)")
+            continue
+
+        change = result['min_us'] / base['min_us'] - 1 if base['min_us'] else 0.0
+        flag = ''
+
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(result['name'])
+
+        print(f"    {result['name']:<45} {result['min_us']:>12.3f}us  {change * 100:+7.1f}%{flag}")
+
+    return regressions
+
+
+def print_results(results):
+    for result in results['results']:
+        print(f"{result['name']:<45} min {result['min_us']:>12.3f}us  median {result['median_us']:>12.3f}us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the timers, timer sequence, images and rendering.")
+    parser.add_argument('--benchmark', choices=list(BENCHMARKS), action='append',
+                        help="benchmark(s) to run, default all")
+    parser.add_argument('--repeat', type=int, default=20, help="times to repeat each timing")
+    parser.add_argument('--frames', type=int, default=200, help="frames to render per stream")
+    parser.add_argument('--font-path', default=display.FONT_PATH, help="TrueType font to render with")
+    parser.add_argument('--output', help="save the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="fraction slower than the earlier run that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.benchmark or list(BENCHMARKS), args)
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+
+        # Fail, so a script or CI job running the benchmarks notices.
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,389 @@
+import queue
+import threading
+import time
+
+import metrics
+
+# Gestures a button can make. A pin only waits to tell gestures apart if it has an action for the long or double press,
+# otherwise the short press action is run as soon as the button goes down.
+GESTURES = ('short', 'long', 'double')
+
+DEBOUNCE_S = 0.05
+LONG_PRESS_S = 1.0
+DOUBLE_PRESS_S = 0.35
+
+
+# Latency measurements, from the button being pressed.
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total_s += latency
+        self.max_s = max(self.max_s, latency)
+
+    def return_stats(self):
+        return {'count': self.count,
+                'mean_s': self.total_s / self.count if self.count else 0.0,
+                'max_s': self.max_s}
+
+
+# State of one button.
+class ButtonState:
+    def __init__(self):
+        self.pressed = False
+        self.last_edge_time = None
+
+        # When to read the button again, after an edge was ignored as it came within the debounce time.
+        self.settle_deadline = None
+
+        # Time the current gesture started, and whether its action has already been run.
+        self.press_time = None
+        self.handled = False
+
+        # Released after a short press, waiting to see if it is a double press.
+        self.waiting_for_double = False
+
+        # When the gesture has to be decided by if the button doesn't change, and what it is then.
+        self.deadline = None
+        self.deadline_gesture = None
+
+
+# Button input, debounced per pin and turned into short, long and double presses. The GPIO callback only timestamps
+# the edge and queues it, the actions are run on this thread, so a slow action never holds up the GPIO callbacks.
+# Times are from the monotonic clock, so changes to the wall clock (e.g. NTP) don't affect the debounce.
+class ButtonInput(threading.Thread):
+    # action_for(pin, gesture) returns the function to run, or None if there isn't one for that gesture.
+    # is_pressed(pin) reads whether a button is down. on_action(pin, gesture) is called after each action is run.
+    def __init__(self, pins, action_for, is_pressed, on_action=None, debounce_s=DEBOUNCE_S,
+                 long_press_s=LONG_PRESS_S, double_press_s=DOUBLE_PRESS_S, clock=time.monotonic):
+        super().__init__(daemon=True)
+        self.action_for = action_for
+        self.is_pressed = is_pressed
+        self.on_action = on_action
+        self.debounce_s = debounce_s
+        self.long_press_s = long_press_s
+        self.double_press_s = double_press_s
+        self.clock = clock
+
+        self._states = {pin: ButtonState() for pin in pins}
+        self._edges = queue.SimpleQueue()
+
+        # Where on_edge() sends each (pin, pressed, time) edge - this thread's queue, unless something else (e.g. the
+        # asyncio runtime) handles the edges.
+        self.edge_sink = self._edges.put
+
+        # Press times of actions that have been run but not shown on the display yet, with when the action started.
+        # The action may publish the state it changes itself, so anything published after it started shows it.
+        self._lock = threading.Lock()
+        self._awaiting_render = []
+
+        self.edges_ignored = 0
+        self.gesture_counts = {gesture: 0 for gesture in GESTURES}
+        self.press_to_action = LatencyStats()
+        self.press_to_render = LatencyStats()
+
+        registry = metrics.get_registry()
+        self._press_to_action_histogram = registry.histogram('buttons.press_to_action_s')
+        self._press_to_render_histogram = registry.histogram('buttons.press_to_render_s')
+        registry.gauge('buttons.edge_queue_depth', self._edges.qsize)
+
+    # GPIO callback for either edge of a button. Only reads and queues the edge, so it returns straight away.
+    def on_edge(self, pin):
+        self.edge_sink((pin, self.is_pressed(pin), self.clock()))
+
+    # Handle an edge, ignoring bounces - edges within the debounce time of the last one on the same pin, or that don't
+    # change whether the button is down. The button is read again once the debounce time is over, so a real change
+    # within it (e.g. a quick tap's release) isn't lost.
+    def handle_edge(self, pin, pressed, edge_time):
+        state = self._states[pin]
+
+        if state.last_edge_time is not None and edge_time - state.last_edge_time < self.debounce_s:
+            self.edges_ignored += 1
+            state.settle_deadline = state.last_edge_time + self.debounce_s
+            return
+
+        if pressed == state.pressed:
+            self.edges_ignored += 1
+            return
+
+        self._change(pin, state, pressed, edge_time)
+
+    def _change(self, pin, state, pressed, edge_time):
+        state.pressed = pressed
+        state.last_edge_time = edge_time
+        state.settle_deadline = None
+
+        if pressed:
+            self._handle_press(pin, state, edge_time)
+        else:
+            self._handle_release(pin, state, edge_time)
+
+    def _handle_press(self, pin, state, press_time):
+        state.handled = False
+
+        if state.waiting_for_double:
+            state.waiting_for_double = False
+            state.deadline = None
+            state.press_time = press_time
+            state.handled = True
+            self._dispatch(pin, 'double', press_time)
+
+        elif self.action_for(pin, 'long') is None and self.action_for(pin, 'double') is None:
+            state.press_time = press_time
+            state.handled = True
+            self._dispatch(pin, 'short', press_time)
+
+        else:
+            state.press_time = press_time
+
+            if self.action_for(pin, 'long') is not None:
+                state.deadline = press_time + self.long_press_s
+                state.deadline_gesture = 'long'
+
+    def _handle_release(self, pin, state, release_time):
+        state.deadline = None
+
+        if state.handled:
+            return
+
+        if self.action_for(pin, 'double') is not None:
+            state.waiting_for_double = True
+            state.deadline = release_time + self.double_press_s
+            state.deadline_gesture = 'short'
+        else:
+            state.handled = True
+            self._dispatch(pin, 'short', state.press_time)
+
+    # Run the gestures that have been decided by now - held long enough, or not pressed again in time. Returns the time
+    # of the next deadline, or None if there isn't one.
+    def update(self, now):
+        next_deadline = None
+
+        for pin, state in self._states.items():
+            if state.settle_deadline is not None:
+                if now < state.settle_deadline:
+                    next_deadline = state.settle_deadline if next_deadline is None else \
+                        min(next_deadline, state.settle_deadline)
+                else:
+                    state.settle_deadline = None
+                    pressed = self.is_pressed(pin)
+
+                    if pressed != state.pressed:
+                        self._change(pin, state, pressed, now)
+
+            if state.deadline is None:
+                continue
+
+            if now < state.deadline:
+                next_deadline = state.deadline if next_deadline is None else min(next_deadline, state.deadline)
+                continue
+
+            gesture = state.deadline_gesture
+            state.deadline = None
+
+            if gesture == 'long':
+                # Check the button is still down, in case the release edge was lost.
+                if not self.is_pressed(pin):
+                    self.handle_edge(pin, False, now)
+                    continue
+
+                state.handled = True
+            else:
+                state.waiting_for_double = False
+
+            self._dispatch(pin, gesture, state.press_time)
+
+        return next_deadline
+
+    # Run the action for a gesture. A long or double press on a pin with no action for it runs the short press action.
+    def _dispatch(self, pin, gesture, press_time):
+        action = self.action_for(pin, gesture) or self.action_for(pin, 'short')
+        self.gesture_counts[gesture] += 1
+
+        if action is None:
+            return
+
+        action_start = self.clock()
+        action()
+        press_to_action = self.clock() - press_time
+        self.press_to_action.add(press_to_action)
+        self._press_to_action_histogram.observe(press_to_action)
+
+        with self._lock:
+            self._awaiting_render.append((press_time, action_start))
+
+        if self.on_action is not None:
+            self.on_action(pin, gesture)
+
+    # Called by the display after rendering data published at publish_time. Actions started before then are shown.
+    def notify_rendered(self, publish_time, render_time=None):
+        if render_time is None:
+            render_time = self.clock()
+
+        with self._lock:
+            if not self._awaiting_render:
+                return
+
+            still_waiting = []
+
+            for press_time, action_start in self._awaiting_render:
+                if action_start <= publish_time:
+                    self.press_to_render.add(render_time - press_time)
+                    self._press_to_render_histogram.observe(render_time - press_time)
+                else:
+                    still_waiting.append((press_time, action_start))
+
+            self._awaiting_render = still_waiting
+
+    # Handle queued edges as they arrive and the gestures as they are decided.
+    def run(self):
+        next_deadline = None
+
+        while True:
+            timeout = None if next_deadline is None else max(0.0, next_deadline - self.clock())
+
+            try:
+                self.handle_edge(*self._edges.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            next_deadline = self.update(self.clock())
+
+    # Return the gesture counts and latencies.
+    def return_stats(self):
+        return {'gestures': dict(self.gesture_counts),
+                'edges_ignored': self.edges_ignored,
+                'press_to_action': self.press_to_action.return_stats(),
+                'press_to_render': self.press_to_render.return_stats()}
+
+
+# Tests
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+
+    class FakeClock:
+        def __init__(self):
+            self.now = 100.0
+
+        def clock(self):
+            return self.now
+
+    fake = FakeClock()
+    calls = []
+    down = set()
+
+    actions = {('A', 'short'): lambda: calls.append('A'),
+               ('B', 'short'): lambda: calls.append('B'),
+               ('Y', 'short'): lambda: calls.append('Y'),
+               ('Y', 'long'): lambda: calls.append('Y long'),
+               ('Y', 'double'): lambda: calls.append('Y double')}
+
+    buttons = ButtonInput(['A', 'B', 'Y'], lambda pin, gesture: actions.get((pin, gesture)), lambda pin: pin in down,
+                          clock=fake.clock)
+
+    def edge(pin, pressed, at):
+        fake.now = at
+        if pressed:
+            down.add(pin)
+        else:
+            down.discard(pin)
+        buttons.handle_edge(pin, pressed, at)
+        buttons.update(at)
+
+    # Bouncing contacts - one press. A press on another button straight after isn't lost.
+    edge('A', True, 100.0)
+    edge('A', False, 100.005)
+    edge('A', True, 100.01)
+    edge('B', True, 100.02)
+    edge('A', False, 100.2)
+    edge('B', False, 100.2)
+
+    if calls == ['A', 'B'] and buttons.edges_ignored == 2:
+        tests.append(Test(__file__, "Debounce per pin", "passed"))
+    else:
+        tests.append(Test(__file__, "Debounce per pin", "failed", f"{calls} ignored {buttons.edges_ignored}"))
+
+    # Long press runs when the hold time is reached, without waiting for the release.
+    calls.clear()
+    edge('Y', True, 101.0)
+    edge('Y', True, 101.0 + LONG_PRESS_S)
+    held_calls = list(calls)
+    edge('Y', False, 103.0)
+
+    if held_calls == ['Y long'] and calls == ['Y long']:
+        tests.append(Test(__file__, "Long press", "passed"))
+    else:
+        tests.append(Test(__file__, "Long press", "failed", f"{calls}"))
+
+    # Double press, then a short press once the double press time is up.
+    calls.clear()
+    edge('Y', True, 104.0)
+    edge('Y', False, 104.1)
+    edge('Y', True, 104.2)
+    edge('Y', False, 104.3)
+    edge('Y', True, 105.0)
+    edge('Y', False, 105.1)
+    fake.now = 105.1 + DOUBLE_PRESS_S
+    buttons.update(fake.now)
+
+    if calls == ['Y double', 'Y']:
+        tests.append(Test(__file__, "Double press", "passed"))
+    else:
+        tests.append(Test(__file__, "Double press", "failed", f"{calls}"))
+
+    # Latency to the display showing the action - renders of data published before the action don't count.
+    buttons.notify_rendered(105.0, 105.5)
+    rendered_before = buttons.press_to_render.count
+    buttons.notify_rendered(105.5, 105.6)
+    stats = buttons.return_stats()
+
+    if rendered_before == 4 and stats['press_to_render']['count'] == 5 and \
+            abs(stats['press_to_render']['max_s'] - 5.5) < 1e-9:
+        tests.append(Test(__file__, "Press to render latency", "passed", f"{stats}"))
+    else:
+        tests.append(Test(__file__, "Press to render latency", "failed", f"{stats}"))
+
+    # A tap shorter than the debounce time - the release is ignored as a bounce, then read once the debounce time is
+    # over, so the next press isn't lost.
+    calls.clear()
+    edge('A', True, 110.0)
+    edge('A', False, 110.02)
+    fake.now = 110.0 + DEBOUNCE_S
+    buttons.update(fake.now)
+    edge('A', True, 111.0)
+    edge('A', False, 111.1)
+
+    edge('Y', True, 112.0)
+    edge('Y', False, 112.02)
+    next_deadline = buttons.update(112.02)
+    fake.now = next_deadline
+    next_deadline = buttons.update(fake.now)
+    fake.now = next_deadline
+    buttons.update(fake.now)
+
+    if calls == ['A', 'A', 'Y']:
+        tests.append(Test(__file__, "Tap shorter than debounce", "passed"))
+    else:
+        tests.append(Test(__file__, "Tap shorter than debounce", "failed", f"{calls}"))
+
+    # Actions run on the input thread, not the one the edge arrived on.
+    action_threads = []
+    threaded = ButtonInput(['A'], lambda pin, gesture: (lambda: action_threads.append(threading.current_thread()))
+                           if gesture == 'short' else None, lambda pin: True)
+    threaded.start()
+    threaded.on_edge('A')
+    time.sleep(0.1)
+
+    if action_threads == [threaded]:
+        tests.append(Test(__file__, "Actions off the callback thread", "passed"))
+    else:
+        tests.append(Test(__file__, "Actions off the callback thread", "failed", f"{action_threads}"))
+
+    for test in tests:
+        print(test.return_result())
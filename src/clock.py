@@ -1,68 +1,245 @@
-#!/usr/bin/python3
-
-import datetime
-import threading
-
-import time
-import test
-import display
-import timers.timer_seq as timer_seq
-
-
-# Main class for the clock
-class Clock(threading.Thread):
-    def __init__(self, timer_speed=1):
-        super().__init__()
-        self.timer_speed = timer_speed
-        self.timer_seq_mgr = timer_seq.TimerSequenceManager(speed=self.timer_speed)
-        self.current_time = datetime.datetime.now()
-        self.current_timer_seq = self.timer_seq_mgr.timer_seq
-
-        # Set up and get the LCD running.
-        self.lcd_display = display.LcdDisplay(self.timer_seq_mgr.timer_seq.toggle_pause_current_timer,
-                                              self.timer_seq_mgr.timer_seq.restart_current_timer,
-                                              self.timer_seq_mgr.timer_seq.next_timer)
-        
-        # self.lcd_display.setDaemon(True)
-        self.current_data = display.CurrentData()
-        self.current_data.current_timer_data = display.CurrentTimerData(
-            self.current_timer_seq.current_timer.name,
-            self.current_timer_seq.current_timer.description,
-            self.current_timer_seq.current_timer.length_sec,
-            self.current_timer_seq.current_timer.return_colour())
-        self.lcd_display.start()
-
-    # Decrements the current timer and returns the data
-    def decrement_current_timer(self):
-        current_timer_data = display.CurrentTimerData(self.current_timer_seq.current_timer.name,
-                                                      self.current_timer_seq.current_timer.description,
-                                                      self.current_timer_seq.current_timer.length_sec,
-                                                      self.current_timer_seq.current_timer.return_colour())
-
-        self.current_timer_seq.decrement_current_timer()
-
-        if self.current_timer_seq.current_timer.time_remaining == 0:
-            current_timer_data.remaining_timer_s = self.current_timer_seq.current_timer.overrun_time
-        else:
-            current_timer_data.remaining_timer_s = self.current_timer_seq.current_timer.time_remaining
-
-        return current_timer_data
-
-    # Main function that runs as part of the thread. Ticks time down and gets current time for display as needed.
-    def run(self):
-        while True:
-            self.current_data.current_datetime = datetime.datetime.now()
-            self.current_data.current_timer_data = self.decrement_current_timer()
-            self.lcd_display.current_data_queue.put_nowait(self.current_data)
-
-            # print(f"Queue {lcd_display.current_data_queue.get_nowait()}")
-            # Once counted down to zero, send the overrun time.
-            # print(self.current_timer_seq.current_timer.return_state_str())
-            time.sleep(1)
-
-
-if __name__ == '__main__':
-    clock = Clock()
-    clock.current_timer_seq.current_timer.start()
-    clock.setDaemon(True)
-    clock.start()
+#!/usr/bin/python3
+
+import argparse
+import atexit
+import signal
+import sys
+import threading
+
+# First, so the start up is timed from as early as possible.
+import startup
+
+import test
+import logsetup
+import metrics
+import publisher
+import scheduler
+import snapshots
+import timers.history as history
+import timers.timer_seq as timer_seq
+from timebase import REAL_TIMEBASE
+
+
+# Main class for the clock
+class Clock(threading.Thread):
+    def __init__(self, timer_speed=1, lazy_timers=False, displays=None, history=None, timebase=None):
+        super().__init__()
+        self.timer_speed = timer_speed
+
+        # Where the time comes from - the system clocks, or virtual time for simulations.
+        self.timebase = timebase if timebase is not None else REAL_TIMEBASE
+
+        # Ticks are scheduled against absolute deadlines so the time taken by each tick doesn't build up.
+        self.scheduler = scheduler.TickScheduler(interval=1.0, clock=self.timebase.monotonic,
+                                                 sleep=self.timebase.sleep, wall_clock=self.timebase.time)
+
+        # Lazy timers time themselves from the tick deadlines and are only read when the data is sent to the display,
+        # rather than being decremented on every tick. They count the same seconds as decremented timers would.
+        self.lazy_timers = lazy_timers
+        self.history = history
+        self.timer_seq_mgr = timer_seq.TimerSequenceManager(speed=self.timer_speed,
+                                                            time_source=self.scheduler.tick_clock if lazy_timers
+                                                            else None,
+                                                            history=history)
+        self.current_time = self.timebase.now()
+        self.current_timer_seq = self.timer_seq_mgr.timer_seq
+
+        # Held while the timers are changed and the new state published, by the tick and by the button functions.
+        self._state_lock = threading.Lock()
+
+        # Snapshots sent to the displays. The timer info and timer data are reused until they change.
+        self._timer_info_for = None
+        self._timer_info = None
+        self._current_timer_data = None
+        self.current_data = snapshots.CurrentData(self.timebase.now(), self.return_current_timer_data())
+
+        # Every display subscribes to the publisher, which sends each snapshot to all of them.
+        self.publisher = publisher.StatePublisher(self.timebase.monotonic, self.timebase.call_later)
+
+        # Set up and get the LCD running, unless other displays are given.
+        self.lcd_display = None
+
+        if displays is None:
+            # The displays import PIL and load fonts, so are only imported when one is made.
+            import display
+
+            self.lcd_display = display.LcdDisplay(*self.return_control_functions(), timebase=self.timebase)
+            displays = [self.lcd_display]
+
+        for display_to_add in displays:
+            self.add_display(display_to_add)
+
+    # Return the functions the displays use to control the timers - toggle pause, restart and next.
+    def return_control_functions(self):
+        return (self.control_function(self.current_timer_seq.toggle_pause_current_timer),
+                self.control_function(self.current_timer_seq.restart_current_timer),
+                self.control_function(self.current_timer_seq.next_timer))
+
+    # Wrap a function that controls the timers, so the displays are sent the new state as soon as it has run rather
+    # than on the next tick.
+    def control_function(self, function):
+        def control_and_publish():
+            with self._state_lock:
+                function()
+                self.publish_current_data()
+
+        return control_and_publish
+
+    # Send a new snapshot of the current state to the displays.
+    def publish_current_data(self, ticks=0):
+        # A new snapshot each time - the displays may still be using the last one.
+        self.current_data = snapshots.CurrentData(self.timebase.now(), self.decrement_current_timer(ticks))
+        self.publisher.publish(self.current_data)
+
+    # Add a display, with its own maximum refresh rate and mode if wanted, and start it if it isn't running.
+    def add_display(self, display_to_add, max_rate_hz=None, mode=None):
+        subscription = self.publisher.subscribe(display_to_add, max_rate_hz, mode)
+        display_to_add.publish(self.current_data)
+
+        if not display_to_add.is_alive():
+            # self.lcd_display.setDaemon(True)
+            display_to_add.start()
+
+        return subscription
+
+    # Return the snapshot of the current timer, reusing the last one if nothing has changed.
+    def return_current_timer_data(self):
+        current_timer = self.current_timer_seq.current_timer
+
+        # The name, description, etc. of a timer don't change, so only need making when the timer changes.
+        if current_timer is not self._timer_info_for:
+            self._timer_info = snapshots.TimerInfo.from_timer(current_timer)
+            self._timer_info_for = current_timer
+
+        # Read once, as a lazy timer can move on between reads. Once counted down to zero, send the overrun time.
+        remaining_timer_s = current_timer.time_remaining
+
+        if remaining_timer_s == 0:
+            remaining_timer_s = current_timer.overrun_time
+
+        if self._current_timer_data is None or self._current_timer_data.timer_info is not self._timer_info or \
+                self._current_timer_data.remaining_timer_s != remaining_timer_s:
+            self._current_timer_data = snapshots.CurrentTimerData(self._timer_info, remaining_timer_s)
+
+        return self._current_timer_data
+
+    # Decrements the current timer by the number of ticks that are due and returns the data
+    def decrement_current_timer(self, ticks=1):
+        # Catch up any ticks that were missed in one step. Nothing to do for lazy timers, which are read below.
+        self.current_timer_seq.advance(ticks)
+
+        return self.return_current_timer_data()
+
+    # Main function that runs as part of the thread. Ticks time down and gets current time for display as needed.
+    # The scheduler starts on the first wait, unless a lazy timer has already started it.
+    def run(self):
+        while True:
+            ticks = self.scheduler.wait()
+
+            with self._state_lock:
+                self.publish_current_data(ticks)
+
+            self.flush_history()
+
+            # print(self.current_timer_seq.current_timer.return_state_str())
+            # print(self.scheduler.return_stats_str())
+
+    # Return the tick scheduler's jitter, lag and drift measurements.
+    def return_tick_stats(self):
+        return self.scheduler.return_stats()
+
+    # Write the history's pending events once its flush interval has passed, even if no more events are recorded.
+    def flush_history(self):
+        if self.history is not None:
+            self.history.flush_if_due()
+
+    # Write the history's pending events and close it.
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+
+
+# Close the clock when the process ends, so the history's pending events are written - when the displays end, on Ctrl-C
+# or when stopped as a service (SIGTERM, which otherwise ends the process without running atexit functions).
+def close_at_exit(clock_to_close):
+    atexit.register(clock_to_close.close)
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
+
+# Add the command line options for the metrics.
+def add_metrics_arguments(parser):
+    parser.add_argument('--stats-port', type=int, help="serve metrics as JSON on this local port")
+    parser.add_argument('--stats-file', help="write metrics as JSON to this file every --stats-interval seconds")
+    parser.add_argument('--stats-interval', type=float, default=60.0)
+
+
+# Add the command line options for the web and terminal displays.
+def add_display_arguments(parser):
+    parser.add_argument('--web-port', type=int, help="serve the clock to browsers on this port")
+    parser.add_argument('--web-host', default='0.0.0.0', help="address to serve the clock to browsers on")
+    parser.add_argument('--terminal', action='store_true',
+                        help="show the clock in this terminal instead of on the LCD")
+    parser.add_argument('--frame-cache', default=startup.FRAME_CACHE_PATH,
+                        help="file the first frame is kept in, to show straight away on the next start")
+    parser.add_argument('--startup-budget', type=float, default=startup.STARTUP_BUDGET_S,
+                        help="seconds allowed to the first frame, a warning is logged if it takes longer")
+
+
+# Enable the metrics and start reporting them if asked to by the command line options. Done before anything is made,
+# so it is all measured.
+def start_metrics(args):
+    if args.stats_port is None and args.stats_file is None:
+        return
+
+    registry = metrics.enable()
+
+    # Registered once here rather than by each clock, as gauges of the same name are added together.
+    registry.gauge('logging.queue_depth', logsetup.return_queue_depth)
+    registry.gauge('logging.dropped', lambda: sum(logsetup.return_dropped_counts().values()))
+
+    if args.stats_port is not None:
+        metrics.StatsServer(registry, args.stats_port).start()
+
+    if args.stats_file is not None:
+        metrics.StatsDumper(registry, args.stats_file, args.stats_interval).start()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Pomodoro clock")
+    add_metrics_arguments(arg_parser)
+    add_display_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    startup_timer = startup.StartupTimer(budget_s=args.startup_budget)
+    phase_start = startup_timer.end_phase('imports', startup.IMPORT_TIME)
+
+    logsetup.configure_logging()
+    start_metrics(args)
+    phase_start = startup_timer.end_phase('logging', phase_start)
+
+    clock = Clock(displays=[], history=history.SessionHistory())
+    close_at_exit(clock)
+    startup_timer.end_phase('clock', phase_start)
+    lcd_startup = None
+
+    # The other displays are only imported if they are used.
+    if args.terminal:
+        import terminal_display
+        clock.add_display(terminal_display.TerminalDisplay(*clock.return_control_functions()))
+    else:
+        # Show the last first frame while the LCD display is loaded in the background.
+        lcd_startup = startup.LcdStartup(clock, args.frame_cache, startup_timer)
+        lcd_startup.show_cached_frame()
+        lcd_startup.start()
+
+    if args.web_port is not None:
+        import web_display
+        clock.add_display(web_display.WebDisplay(*clock.return_control_functions(), args.web_host, args.web_port))
+
+    clock.current_timer_seq.current_timer.start()
+    clock.setDaemon(True)
+    clock.start()
+
+    # The LCD display's thread keeps the clock running, once the background loading has started it.
+    if lcd_startup is not None:
+        lcd_startup.ready.wait()
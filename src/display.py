@@ -1,313 +1,880 @@
-from __future__ import annotations
-
-import time
-import datetime
-from abc import ABC, abstractmethod
-import threading
-import queue
-from PIL import Image, ImageDraw, ImageFont
-from displayhatmini import DisplayHATMini
-
-
-# Class used to transmit timer data to the diplays.
-class CurrentTimerData:
-    def __init__(self, name, description, length_sec, colour):
-        self.name = name
-        self.description = description
-        self.length_sec = length_sec
-        self.remaining_timer_s = None
-        self.timer_colour = colour
-
-
-# Class to transmit timer and current timer to displays.
-class CurrentData:
-    def __init__(self):
-        self.current_datetime = None
-        self.current_timer_data = None
-
-
-# Class to manage the background images, which are rotated.
-class ImageManager:
-    def __init__(self):
-        self.image_array = None
-        self.image_list = {'moon': [
-            'image0.jpg',
-            'image1.jpg',
-            'image2.jpg',
-            'image3.jpg',
-            'image4.jpg',
-            'image5.jpg',
-            'image6.jpg',
-            'image7.jpg',
-            'image8.jpg',
-            'image9.jpg',
-            'image10.jpg',
-            'image11.jpg',
-            'image12.jpg',
-            'image13.jpg',
-            'image14.jpg',
-            'image15.jpg',
-            'image16.jpg',
-            'image17.jpg',
-            'image18.jpg',
-            'image19.jpg',
-            'image20.jpg',
-            'image21.jpg',
-            'image22.jpg',
-            'image23.jpg'
-        ]}
-
-    # Set the image series to use
-    def set_image_series(self, series_name):
-        self.image_array = self.image_list[series_name]
-
-    # Return the current image and wrap it to the end.
-    def get_current_image(self):
-        curr_image = self.image_array.pop(0)
-        self.image_array.append(curr_image)
-        return curr_image
-
-
-# Abstract base class for displaying the clock via various displays as desired. This provides a way to have multiple
-# displays such as on the screen as well as a small LCD.
-class Display(ABC, threading.Thread):
-
-    # Width and length is desired display size or desired window size depending on the type of display.
-    def __init__(self, width, height, toggle_pause_function, restart_function, next_function, pins=None):
-        super().__init__()
-        self.width = width
-        self.height = height
-        self.pomodoro_time_state = None
-        self.pins = pins
-        self._modes = ['clock', 'pomodoro']
-        self._curr_mode = None
-        self.toggle_pause_function = toggle_pause_function
-        self.restart_function = restart_function
-        self.next_function = next_function
-        self.pomodoro_time_state = None
-        self.current_data_queue = queue.Queue()
-        self.current_data = CurrentData()
-        self.current_image = None
-
-    # Change modes
-    @abstractmethod
-    def change_mode(self):
-
-        # If current mode is None, then set to the first mode - initialisation.
-        # If not none, circulate through the modes.
-        if self._curr_mode is None:
-            self._curr_mode = self._modes.pop(0)
-        else:
-            self._modes.append(self._curr_mode)
-            self._curr_mode = self._modes.pop(0)
-
-        print(f"Current mode {self._curr_mode}")
-
-    def run(self):
-        while True:
-            while not self.current_data_queue.empty():
-                self.current_data = self.current_data_queue.get_nowait()
-
-            if self.current_data.current_datetime is not None:
-                self.update_display()
-
-            time.sleep(0.5)
-
-    @abstractmethod
-    def update_display(self):
-        pass
-
-
-# Class for LCD - in this case the DisplayHatMini
-class LcdDisplay(Display):
-    def __init__(self, toggle_pause_function, restart_function, next_function):
-        self.buffer = Image.new("RGB", (DisplayHATMini.WIDTH, DisplayHATMini.HEIGHT,), "BLACK")
-
-        self.fonts = {'main': ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSansBold.ttf', 75),
-                      'sub': ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSansBold.ttf', 25)}
-
-        self.display = DisplayHATMini(self.buffer, backlight_pwm=True)
-        self.display.set_led(0.0, 0.0, 0.0)
-
-        pins = [self.display.BUTTON_A, self.display.BUTTON_B, self.display.BUTTON_X, self.display.BUTTON_Y]
-
-        super().__init__(self.display.WIDTH, self.display.HEIGHT, toggle_pause_function,
-                         restart_function, next_function, pins)
-
-        # Set the current mode
-        self.change_mode()
-
-        # Mapping to mode to buttons and functions.
-        self.function_dict = {'clock': {self.display.BUTTON_A: self.change_mode,
-                                        self.display.BUTTON_X: self.toggle_pause_function,
-                                        self.display.BUTTON_B: self.restart_function,
-                                        self.display.BUTTON_Y: self.next_function},
-                              'pomodoro': {self.display.BUTTON_A: self.change_mode,
-                                           self.display.BUTTON_X: self.toggle_pause_function,
-                                           self.display.BUTTON_B: self.restart_function,
-                                           self.display.BUTTON_Y: self.next_function}}
-
-        self.image_manager = ImageManager()
-        self.image_manager.set_image_series('moon')
-
-        # Set the last button press to current time.
-        self.last_button_press = datetime.datetime.now()
-
-        # Register function to deal with button presses
-        self.display.on_button_pressed(self.button_press)
-
-    # Rotate through the modes.
-    def change_mode(self):
-        super().change_mode()
-
-    # Function to deal with the button presses by calling the appropriate function.
-    def button_press(self, pin):
-        # print(f"sec button {(datetime.datetime.now() - self.last_button_press).total_seconds()}")
-        if (datetime.datetime.now() - self.last_button_press).total_seconds() > 2:
-            # Call the function that matches the button
-            self.function_dict[self._curr_mode][pin]()
-            self.last_button_press = datetime.datetime.now()
-
-    # Draw the icons on the screen according to the mode
-    # ToDo Icons should be different based on mode.
-    def draw_icons(self, buffer):
-        print(f"icons current mode {self._curr_mode}")
-        if self._curr_mode == 'clock':
-            buffer.paste(Image.open("icons/eject.png"), (0, 60), 0)
-            buffer.paste(Image.open("icons/pause.png"), (280, 40), 0)
-            buffer.paste(Image.open("icons/back-button.png"), (0, 200), 0)
-            buffer.paste(Image.open("icons/next-button.png"), (280, 200), 0)
-        elif self._curr_mode == 'pomodoro':
-            buffer.paste(Image.open("icons/eject.png"), (0, 60), 0)
-            buffer.paste(Image.open("icons/pause.png"), (280, 40), 0)
-            buffer.paste(Image.open("icons/back-button.png"), (0, 200), 0)
-            buffer.paste(Image.open("icons/next-button.png"), (280, 200), 0)
-        else:
-            raise TypeError
-
-    # Write the text at the desired location, with the font colour and the bac_fill_colour.
-    @staticmethod
-    def write_text(draw, text, location, font, font_colour, border=0, back_fill_colour=None):
-
-        left, top, right, bottom = draw.textbbox(location, text, font=font)
-
-        # If a back_fill_colour is defined, then draw a text box around it with the requested background colour.
-        if back_fill_colour is not None:
-            draw.rectangle((left - border, top - border, right + border, bottom + border), fill=back_fill_colour)
-        else:
-            pass
-
-        draw.text(location, text, font=font, fill=font_colour)
-
-    # Update the display to show the latest state.
-    # TODO: add different modes
-    def update_display(self):
-        # print(f"{self.current_data.current_datetime}, {self.current_data.current_timer_data.remaining_timer_s}")
-        # self.buffer = Image.new("RGB", (DisplayHATMini.WIDTH, DisplayHATMini.HEIGHT,), "BLACK")
-
-        self.buffer.paste(0, (0, 0, DisplayHATMini.WIDTH - 1, DisplayHATMini.HEIGHT - 1))
-
-        disp_date = self.current_data.current_datetime.strftime("%d-%m-%Y")
-        disp_time = self.current_data.current_datetime.strftime("%H:%M:%S")
-
-        # Determining the sign to display (minus means the current timer is exceeded)
-        if self.current_data.current_timer_data.remaining_timer_s < 0:
-            sign = '-'
-            self.display.set_led(0.0, 0.0, 0.0)
-            time.sleep(0.1)
-            self.display.set_led(0.5, 0.0, 0.0)
-            time.sleep(0.1)
-            self.display.set_led(0.0, 0.0, 0.0)
-        else:
-            sign = ''
-
-        # Pomodoro timer string to be displayed.
-        pomodoro_time_str = (f"{sign}{abs(int(self.current_data.current_timer_data.remaining_timer_s / 60)):0>2}:"
-                             f"{abs(self.current_data.current_timer_data.remaining_timer_s) % 60:0>2}")
-
-        # Background image
-        # Start of time
-        if self.current_image is None:
-            self.current_image = self.image_manager.get_current_image()
-
-        # Go to the next image every minute
-        elif self.current_data.current_timer_data.remaining_timer_s % 60 == 0:
-            self.current_image = self.image_manager.get_current_image()
-            # self.draw_icons(self.buffer)
-
-        else:  # no change
-            self.current_image = self.current_image
-
-        with Image.open(self.current_image) as img:
-            # print(f"image size {img.size} display size {self.display.WIDTH} {self.display.HEIGHT}")
-            # self.buffer.paste(img, (int((DisplayHATMini.WIDTH - DisplayHATMini.HEIGHT) / 2), 0))
-            # print(f"x = {int((self.display.WIDTH - img.size[0])/2)} y = {int((self.display.HEIGHT - img.size[1])/2)}")
-            self.buffer.paste(img, (int((self.display.WIDTH - img.size[0]) / 2),
-                                    int((self.display.HEIGHT - img.size[1]) / 2)))
-
-            # self.draw_icons(self.buffer)
-
-            draw = ImageDraw.Draw(self.buffer)
-            # self.draw_icons(self.buffer)
-
-            draw.text((5, 0), f"{disp_date}", font=self.fonts['sub'])
-            draw.text((200, 0), f"{disp_time}", font=self.fonts['sub'])
-
-            pomodoro_str_size = self.fonts['main'].getsize(pomodoro_time_str)
-
-            # Large display item
-            self.write_text(draw, pomodoro_time_str,
-                            (int((self.display.WIDTH - pomodoro_str_size[0]) / 2), 60), self.fonts['main'],
-                            self.current_data.current_timer_data.timer_colour, border=2,
-                            back_fill_colour='black')
-
-            # ToDo: need to deal with different modes for font sizes.
-            timer_name_size = self.fonts['sub'].getsize(self.current_data.current_timer_data.name)
-
-            self.write_text(draw, self.current_data.current_timer_data.name,
-                            ((self.display.WIDTH - timer_name_size[0]) / 2, 140),
-                            self.fonts['sub'], self.current_data.current_timer_data.timer_colour,
-                            border=2, back_fill_colour='black')
-
-            timer_description_size = self.fonts['sub'].getsize(self.current_data.current_timer_data.description)
-
-            self.write_text(draw, self.current_data.current_timer_data.description,
-                            ((self.display.WIDTH - timer_description_size[0]) / 2, 170),
-                            self.fonts['sub'], self.current_data.current_timer_data.timer_colour,
-                            border=2, back_fill_colour='black')
-
-            # ToDo: need to deal with different modes for font sizes.
-
-            self.display.display()
-
-
-if __name__ == '__main__':
-    def toggle_pause_fnc():
-        print("toggle pause function test")
-
-
-    def back_fnc():
-        print("back function test")
-
-
-    def next_fnc():
-        print("next function test")
-
-
-    # print("here before run")
-    lcd_display = LcdDisplay(toggle_pause_fnc, back_fnc, next_fnc)
-    lcd_display.setDaemon(True)
-    lcd_display.start()
-    # print("here after run")
-    current_data = CurrentData()
-    current_timer_data = CurrentTimerData("work", "work timer", "1500", '#FF00FF')
-    current_data.current_timer_data = current_timer_data
-
-    current_data.current_timer_data.remaining_timer_s = 600
-    while True:
-        current_data.current_datetime = datetime.datetime.now()
-        lcd_display.current_data_queue.put_nowait(current_data)
-
-        # print(f"Queue {lcd_display.current_data_queue.get_nowait()}")
-        current_data.current_timer_data.remaining_timer_s -= 1
-        time.sleep(.1)
+from __future__ import annotations
+
+import os
+import time
+import datetime
+from abc import ABC, abstractmethod
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageFont
+import buttons
+import frame_atlas
+import glyphs
+import handoff
+import led
+import metrics
+import rgb565
+import timers.timer as timer
+from snapshots import TimerInfo, CurrentTimerData, CurrentData
+from timebase import REAL_TIMEBASE
+
+# The Display HAT Mini library is only needed for the LCD, so the other displays can be used without the hardware.
+try:
+    from displayhatmini import DisplayHATMini
+except ImportError:
+    DisplayHATMini = None
+
+
+# Class to manage the background images, which are rotated. If a series has been built into a packed frame file (see
+# moon.py) the file is memory mapped and its frames used directly. Otherwise images are decoded once and kept in an LRU
+# cache limited by a memory budget, so steady state rendering doesn't need to read and decode a JPEG from the SD card.
+class ImageManager:
+    # Enough for a full series of 320x240 RGB frames.
+    DEFAULT_CACHE_BYTES = 8 * 1024 * 1024
+
+    # Where the packed frame files are, as <series name>.frames.
+    ASSET_DIR = 'assets'
+
+    def __init__(self, cache_budget_bytes=DEFAULT_CACHE_BYTES, asset_dir=ASSET_DIR):
+        self.image_array = None
+
+        # Frames from packed frame files, keyed by the names used in image_array.
+        self.asset_dir = asset_dir
+        self._atlases = {}
+        self._atlas_frames = {}
+
+        # Decoded frames keyed by file name, least recently used first.
+        self.cache_budget_bytes = cache_budget_bytes
+        self.cache_bytes = 0
+        self._frame_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+
+        # Frames can be preloaded on another thread while the display is rendering.
+        self._cache_lock = threading.Lock()
+
+        self.image_list = {'moon': [
+            'image0.jpg',
+            'image1.jpg',
+            'image2.jpg',
+            'image3.jpg',
+            'image4.jpg',
+            'image5.jpg',
+            'image6.jpg',
+            'image7.jpg',
+            'image8.jpg',
+            'image9.jpg',
+            'image10.jpg',
+            'image11.jpg',
+            'image12.jpg',
+            'image13.jpg',
+            'image14.jpg',
+            'image15.jpg',
+            'image16.jpg',
+            'image17.jpg',
+            'image18.jpg',
+            'image19.jpg',
+            'image20.jpg',
+            'image21.jpg',
+            'image22.jpg',
+            'image23.jpg'
+        ]}
+
+    # Set the image series to use. Uses the series' frame file if it has been built, otherwise the JPEG files, decoding
+    # them up front if requested (and they fit in the cache budget).
+    def set_image_series(self, series_name, preload=True):
+        if self.load_atlas(series_name):
+            self.image_array = [f"{series_name}/{index}" for index in range(len(self._atlases[series_name]))]
+            return
+
+        self.image_array = self.image_list[series_name]
+
+        if preload:
+            self.preload()
+
+    # Decode every image of the series that isn't cached yet, e.g. in the background once the first frame is shown.
+    def preload(self):
+        for image in list(self.image_array):
+            self.get_frame(image)
+
+    # Return the current image and wrap it to the end.
+    def get_current_image(self):
+        curr_image = self.image_array.pop(0)
+        self.image_array.append(curr_image)
+        return curr_image
+
+    # Memory map the series' frame file, if it has been built. Returns True if it is available.
+    def load_atlas(self, series_name):
+        if series_name in self._atlases:
+            return True
+
+        path = os.path.join(self.asset_dir, f"{series_name}.frames")
+        if not os.path.exists(path):
+            return False
+
+        atlas = frame_atlas.FrameAtlas(path)
+        self._atlases[series_name] = atlas
+
+        for index in range(len(atlas)):
+            self._atlas_frames[f"{series_name}/{index}"] = atlas.frame(index)
+
+        return True
+
+    # Return the decoded image, ready to paste, from the frame file or the cache if possible.
+    def get_frame(self, image_name):
+        frame = self._atlas_frames.get(image_name)
+
+        if frame is not None:
+            self.cache_hits += 1
+            return frame
+
+        with self._cache_lock:
+            frame = self._frame_cache.get(image_name)
+
+            if frame is not None:
+                self.cache_hits += 1
+                self._frame_cache.move_to_end(image_name)
+                return frame
+
+            self.cache_misses += 1
+
+            with Image.open(image_name) as img:
+                frame = img.convert('RGB')
+
+            frame_bytes = frame.width * frame.height * len(frame.getbands())
+
+            # Too big to ever fit, so don't throw out everything else for it.
+            if frame_bytes > self.cache_budget_bytes:
+                return frame
+
+            while self.cache_bytes + frame_bytes > self.cache_budget_bytes:
+                evicted_name, evicted = self._frame_cache.popitem(last=False)
+                self.cache_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+                self.cache_evictions += 1
+
+            self._frame_cache[image_name] = frame
+            self.cache_bytes += frame_bytes
+
+        return frame
+
+    # Return the cache counters - once all the frames are cached, misses should stop going up.
+    def return_cache_stats(self):
+        return {'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'evictions': self.cache_evictions,
+                'frames': len(self._frame_cache),
+                'mapped_frames': len(self._atlas_frames),
+                'bytes': self.cache_bytes,
+                'budget_bytes': self.cache_budget_bytes}
+
+
+# Abstract base class for displaying the clock via various displays as desired. This provides a way to have multiple
+# displays such as on the screen as well as a small LCD.
+class Display(ABC, threading.Thread):
+
+    # Width and length is desired display size or desired window size depending on the type of display.
+    def __init__(self, width, height, toggle_pause_function, restart_function, next_function, pins=None,
+                 timebase=None):
+        super().__init__()
+
+        # Where the display gets the time for its latency measurements, LED patterns and buttons.
+        self.timebase = timebase if timebase is not None else REAL_TIMEBASE
+        self.width = width
+        self.height = height
+        self.pomodoro_time_state = None
+        self.pins = pins
+        self._modes = ['clock', 'pomodoro']
+        self._curr_mode = None
+        self.toggle_pause_function = toggle_pause_function
+        self.restart_function = restart_function
+        self.next_function = next_function
+        self.pomodoro_time_state = None
+        self.current_data = CurrentData()
+        self.current_image = None
+
+        # The clock publishes the latest data into the slot, which wakes this thread to render it.
+        self.current_data_slot = handoff.LatestValueSlot(self.timebase.monotonic)
+        self._rendered_key = None
+
+        # Button input of the display, if it has buttons. Told when each frame is rendered, to measure the latency from
+        # a button press to the display showing it.
+        self.button_input = None
+
+        # Called with the display after each frame is rendered.
+        self._render_listeners = []
+
+        # Render statistics - skipped frames are data that was replaced before it could be rendered, or that didn't
+        # change what is shown. Latency is from the data being published to it being rendered.
+        self.frames_rendered = 0
+        self.frames_unchanged = 0
+        self.render_latency_total_s = 0.0
+        self.render_latency_max_s = 0.0
+
+        # Metrics, shared by the displays of the same type. Nothing is kept unless metrics are enabled.
+        self.metrics = metrics.get_registry()
+        self.metrics_prefix = f"display.{type(self).__name__}"
+        self._render_latency_histogram = self.metrics.histogram(f"{self.metrics_prefix}.render_latency_s")
+        self.metrics.gauge(f"{self.metrics_prefix}.pending_frames", self.current_data_slot.pending_count)
+        self.metrics.gauge(f"{self.metrics_prefix}.frames_coalesced", lambda: self.current_data_slot.coalesced_count)
+
+    # Change modes
+    @abstractmethod
+    def change_mode(self):
+
+        # If current mode is None, then set to the first mode - initialisation.
+        # If not none, circulate through the modes.
+        if self._curr_mode is None:
+            self._curr_mode = self._modes.pop(0)
+        else:
+            self._modes.append(self._curr_mode)
+            self._curr_mode = self._modes.pop(0)
+
+        print(f"Current mode {self._curr_mode}")
+
+    # Go straight to a mode, keeping the order of the rotation.
+    def set_mode(self, mode):
+        if mode != self._curr_mode and mode not in self._modes:
+            raise ValueError(f"Unrecognised mode {mode}")
+
+        while self._curr_mode != mode:
+            self.change_mode()
+
+    # Publish the latest data to the display. Never blocks, any data that hasn't been rendered yet is replaced.
+    def publish(self, current_data):
+        self.current_data_slot.publish(current_data)
+
+    # Return what the rendered frame depends on, so data that wouldn't change the frame isn't rendered.
+    # Snapshots are immutable, so they can be compared directly.
+    def render_key(self, current_data):
+        return current_data, self._curr_mode
+
+    # Wait for data to be published, and render it as soon as it is.
+    def run(self):
+        while True:
+            self.render(*self.current_data_slot.wait_for_new())
+
+    # Render data taken from the slot, if it changes the display.
+    def render(self, current_data, publish_time):
+        if current_data.current_datetime is None:
+            return
+
+        render_key = self.render_key(current_data)
+        if render_key == self._rendered_key:
+            self.frames_unchanged += 1
+            return
+
+        self.current_data = current_data
+        self.update_display()
+        self._rendered_key = render_key
+
+        render_time = self.current_data_slot.clock()
+        latency = render_time - publish_time
+        self.frames_rendered += 1
+        self.render_latency_total_s += latency
+        self.render_latency_max_s = max(self.render_latency_max_s, latency)
+        self._render_latency_histogram.observe(latency)
+
+        if self.button_input is not None:
+            self.button_input.notify_rendered(publish_time, render_time)
+
+        for listener in self._render_listeners:
+            listener(self)
+
+    # Call a function with the display after each frame is rendered.
+    def add_render_listener(self, listener):
+        self._render_listeners.append(listener)
+
+    # Return the counts of frames rendered and skipped, and the publish to render latency.
+    def return_render_stats(self):
+        return {'frames_rendered': self.frames_rendered,
+                'frames_skipped': self.current_data_slot.coalesced_count + self.frames_unchanged,
+                'frames_coalesced': self.current_data_slot.coalesced_count,
+                'frames_unchanged': self.frames_unchanged,
+                'mean_latency_s': self.render_latency_total_s / self.frames_rendered if self.frames_rendered else 0.0,
+                'max_latency_s': self.render_latency_max_s}
+
+    @abstractmethod
+    def update_display(self):
+        pass
+
+
+# Size of the Display HAT Mini panel, which the other framebuffer displays match.
+PANEL_WIDTH = 320
+PANEL_HEIGHT = 240
+
+FONT_PATH = '/usr/share/fonts/truetype/freefont/FreeSansBold.ttf'
+
+
+# Return the countdown as shown on the displays, minutes and seconds. Minus means the current timer is exceeded.
+def format_countdown(remaining_timer_s):
+    if remaining_timer_s < 0:
+        sign = '-'
+    else:
+        sign = ''
+
+    return f"{sign}{abs(int(remaining_timer_s / 60)):0>2}:{abs(remaining_timer_s) % 60:0>2}"
+
+
+# Display that draws the clock into a PIL framebuffer. This is the drawing pipeline shared by the LCD and the
+# off-screen display, which only differ in where the finished frame goes (push_frame) and what the LED is (set_led).
+class FramebufferDisplay(Display):
+    def __init__(self, toggle_pause_function, restart_function, next_function, width=PANEL_WIDTH,
+                 height=PANEL_HEIGHT, pins=None, buffer=None, font_path=FONT_PATH,
+                 image_cache_bytes=ImageManager.DEFAULT_CACHE_BYTES, on_stage=None, native_rgb565=False,
+                 panel_rotation=0, timebase=None, preload_images=True):
+        if buffer is None:
+            buffer = Image.new("RGB", (width, height), "BLACK")
+        self.buffer = buffer
+
+        super().__init__(width, height, toggle_pause_function, restart_function, next_function, pins, timebase)
+
+        # Called with the name and duration in seconds of each stage of loading the display and of rendering a frame,
+        # for profiling.
+        self.on_stage = on_stage
+        self._stage_histograms = {}
+        stage_start = time.perf_counter()
+
+        self.fonts = {'main': ImageFont.truetype(font_path, 75),
+                      'sub': ImageFont.truetype(font_path, 25)}
+        stage_start = self._end_stage('load_fonts', stage_start)
+
+        # Text other than the digits (e.g. the timer name and description) is laid out and drawn once, then pasted.
+        self.text_layouts = glyphs.TextLayoutCache()
+
+        # Set the current mode
+        self.change_mode()
+
+        # Decoding every background image can be left until after the first frame, which only needs the first one -
+        # see ImageManager.preload().
+        self.image_manager = ImageManager(image_cache_bytes)
+        self.image_manager.set_image_series('moon', preload_images)
+        stage_start = self._end_stage('load_images', stage_start)
+
+        # Layers - the static layer holds the background image and timer labels and is only rendered again when one of
+        # those changes. The dynamic items (date, time, countdown) are drawn over it, and each frame only the items
+        # whose text changed are restored from the static layer and redrawn.
+        self._static_layer = None
+        self._static_key = None
+        self._drawn_items = {}
+        self._restored_boxes = []
+        self._drawn_boxes = []
+
+        # Optionally keep the frame in the panel's native RGB565 as well, updating only the changed areas, so a whole
+        # frame doesn't need converting every time it is sent.
+        self.framebuffer_rgb565 = None
+        self._static_rgb565 = None
+
+        self.panel_rotation = panel_rotation
+
+        if native_rgb565:
+            self.framebuffer_rgb565 = rgb565.Rgb565Framebuffer(width, height, panel_rotation)
+
+        # Glyph atlases for the digit strings, per font and colour - the date and time in white and the countdown in
+        # each of the timer colours. Others are made when first needed.
+        self.glyph_atlases = {}
+        self.get_glyph_atlas('sub', 'white')
+        for colour in timer.TIMER_COLOURS:
+            self.get_glyph_atlas('main', colour)
+        self._end_stage('load_glyphs', stage_start)
+
+        # LED patterns run on their own thread, so blinking doesn't hold up the frames.
+        self.led_animator = led.LedAnimator(self.set_led, self.timebase.monotonic)
+
+    # Start the LED thread along with the render thread. Neither is started when the asyncio runtime drives the display.
+    def start(self):
+        self.led_animator.start()
+        super().start()
+
+    # Rotate through the modes.
+    def change_mode(self):
+        super().change_mode()
+
+    # Send the finished frame in the buffer to wherever it is shown.
+    @abstractmethod
+    def push_frame(self):
+        pass
+
+    # Return the frame as the bytes sent to the panel, or None if there is no numpy to convert it with.
+    def return_panel_bytes(self):
+        if self.framebuffer_rgb565 is not None:
+            return self.framebuffer_rgb565.to_panel_bytes()
+
+        if rgb565.np is None:
+            return None
+
+        return rgb565.Rgb565Framebuffer.from_image(self.buffer, self.panel_rotation).to_panel_bytes()
+
+    # Set the colour of the LED, each of r, g, b from 0.0 to 1.0.
+    @abstractmethod
+    def set_led(self, r, g, b):
+        pass
+
+    # Report how long a stage of rendering took, to anything listening and the metrics. Returns the time now, to start
+    # the next stage.
+    def _end_stage(self, stage, stage_start):
+        now = time.perf_counter()
+
+        if self.on_stage is not None:
+            self.on_stage(stage, now - stage_start)
+
+        stage_histogram = self._stage_histograms.get(stage)
+        if stage_histogram is None:
+            stage_histogram = self.metrics.histogram(f"{self.metrics_prefix}.{stage}_s")
+            self._stage_histograms[stage] = stage_histogram
+        stage_histogram.observe(now - stage_start)
+
+        return now
+
+    # Draw the icons on the screen according to the mode
+    # ToDo Icons should be different based on mode.
+    def draw_icons(self, buffer):
+        print(f"icons current mode {self._curr_mode}")
+        if self._curr_mode == 'clock':
+            buffer.paste(Image.open("icons/eject.png"), (0, 60), 0)
+            buffer.paste(Image.open("icons/pause.png"), (280, 40), 0)
+            buffer.paste(Image.open("icons/back-button.png"), (0, 200), 0)
+            buffer.paste(Image.open("icons/next-button.png"), (280, 200), 0)
+        elif self._curr_mode == 'pomodoro':
+            buffer.paste(Image.open("icons/eject.png"), (0, 60), 0)
+            buffer.paste(Image.open("icons/pause.png"), (280, 40), 0)
+            buffer.paste(Image.open("icons/back-button.png"), (0, 200), 0)
+            buffer.paste(Image.open("icons/next-button.png"), (280, 200), 0)
+        else:
+            raise TypeError
+
+    # Write the text at the desired location, with the font colour and the bac_fill_colour.
+    # Returns the box that was drawn on.
+    @staticmethod
+    def write_text(draw, text, location, font, font_colour, border=0, back_fill_colour=None):
+
+        left, top, right, bottom = draw.textbbox(location, text, font=font)
+
+        # If a back_fill_colour is defined, then draw a text box around it with the requested background colour.
+        if back_fill_colour is not None:
+            left, top, right, bottom = left - border, top - border, right + border, bottom + border
+            draw.rectangle((left, top, right, bottom), fill=back_fill_colour)
+        else:
+            pass
+
+        draw.text(location, text, font=font, fill=font_colour)
+
+        return left, top, right, bottom
+
+    # Render the static layer - the background image with the timer name and description.
+    def render_static_layer(self, img, timer_data):
+        layer = Image.new("RGB", (self.width, self.height), "BLACK")
+
+        # print(f"image size {img.size} display size {self.display.WIDTH} {self.display.HEIGHT}")
+        layer.paste(img, (int((self.width - img.size[0]) / 2), int((self.height - img.size[1]) / 2)))
+
+        # self.draw_icons(layer)
+
+        # ToDo: need to deal with different modes for font sizes.
+        # The name and description only change with the timer, so are drawn from the text layout cache when the
+        # background image changes under them.
+        for text, top in ((timer_data.name, 140), (timer_data.description, 170)):
+            text_width = self.text_layouts.text_size(text, self.fonts['sub'])[0]
+            location = ((self.width - text_width) / 2, top)
+            self.text_layouts.get(text, self.fonts['sub'], timer_data.timer_colour, 2, 'black', location).draw(
+                layer, location)
+
+        return layer
+
+    # Return the glyph atlas for the font and colour, creating it if needed.
+    def get_glyph_atlas(self, font_name, colour):
+        atlas = self.glyph_atlases.get((font_name, colour))
+
+        if atlas is None:
+            atlas = glyphs.GlyphAtlas(self.fonts[font_name], colour)
+            self.glyph_atlases[(font_name, colour)] = atlas
+
+        return atlas
+
+    # Return the size of the text in the font, from the glyph atlas if it has all the characters.
+    def text_size(self, text, font_name, colour):
+        atlas = self.get_glyph_atlas(font_name, colour)
+
+        if atlas.can_render(text):
+            return atlas.text_size(text)
+
+        return self.text_layouts.text_size(text, self.fonts[font_name])
+
+    # Write the text as write_text() does, pasting glyphs from the atlas if it has all the characters.
+    # Returns the box that was drawn on.
+    def write_atlas_text(self, draw, text, location, font_name, font_colour, border=0, back_fill_colour=None):
+        atlas = self.get_glyph_atlas(font_name, font_colour)
+
+        if not atlas.can_render(text):
+            return self.text_layouts.get(text, self.fonts[font_name], font_colour, border, back_fill_colour,
+                                         location).draw(self.buffer, location)
+
+        left, top, right, bottom = atlas.text_bbox(location, text)
+
+        if back_fill_colour is not None:
+            left, top, right, bottom = left - border, top - border, right + border, bottom + border
+            draw.rectangle((left, top, right, bottom), fill=back_fill_colour)
+
+        atlas.draw_text(self.buffer, location, text)
+
+        return left, top, right, bottom
+
+    # Convert an inclusive box, as drawn by ImageDraw, to an exclusive one clipped to the buffer. Returns None if
+    # nothing is left.
+    def clip_box(self, box):
+        box = (max(int(box[0]), 0), max(int(box[1]), 0),
+               min(int(box[2]) + 1, self.width), min(int(box[3]) + 1, self.height))
+
+        if box[0] < box[2] and box[1] < box[3]:
+            return box
+        return None
+
+    # Restore the area under a drawn item from the static layer. Box is inclusive, as drawn by ImageDraw.
+    def restore_static(self, box):
+        box = self.clip_box(box)
+
+        if box is not None:
+            self.buffer.paste(self._static_layer.crop(box), box[:2])
+
+    # Draw the dynamic items that have changed since the last frame onto the buffer, restoring the static layer
+    # under their old position first. Items are (text, location, font name, colour, border, back_fill_colour), keyed
+    # by name. Returns True if anything was drawn.
+    def update_dynamic_items(self, items):
+        changed = {key for key, item in items.items()
+                   if key not in self._drawn_items or self._drawn_items[key][0] != item}
+
+        if not changed:
+            return False
+
+        # Restoring an old box can wipe part of an unchanged item that overlaps it, so that gets redrawn too.
+        restored = [self._drawn_items[key][1] for key in changed if key in self._drawn_items]
+
+        for key, (item, box) in self._drawn_items.items():
+            if key not in changed and any(self.boxes_overlap(box, restore_box) for restore_box in restored):
+                changed.add(key)
+                restored.append(box)
+
+        for box in restored:
+            self.restore_static(box)
+
+        draw = ImageDraw.Draw(self.buffer)
+
+        for key in changed:
+            text, location, font_name, colour, border, back_fill_colour = items[key]
+            box = self.write_atlas_text(draw, text, location, font_name, colour, border, back_fill_colour)
+            self._drawn_items[key] = (items[key], box)
+            self._drawn_boxes.append(box)
+
+        self._restored_boxes.extend(restored)
+
+        return True
+
+    # Bring the RGB565 framebuffer up to date with the buffer. Restored areas are copied from the pre-converted static
+    # layer, and only the newly drawn boxes are converted.
+    def update_rgb565(self, static_changed):
+        if static_changed:
+            self._static_rgb565 = rgb565.image_to_rgb565(self._static_layer)
+            self.framebuffer_rgb565.set_layer(self._static_rgb565)
+
+        for box in self._restored_boxes:
+            box = self.clip_box(box)
+            if box is not None:
+                self.framebuffer_rgb565.copy_region(self._static_rgb565, box)
+
+        for box in self._drawn_boxes:
+            box = self.clip_box(box)
+            if box is not None:
+                self.framebuffer_rgb565.update_region(self.buffer, box)
+
+    # Return True if two inclusive boxes overlap.
+    @staticmethod
+    def boxes_overlap(box1, box2):
+        return box1[0] <= box2[2] and box2[0] <= box1[2] and box1[1] <= box2[3] and box2[1] <= box1[3]
+
+    # Update the display to show the latest state.
+    # TODO: add different modes
+    def update_display(self):
+        # print(f"{self.current_data.current_datetime}, {self.current_data.current_timer_data.remaining_timer_s}")
+        timer_data = self.current_data.current_timer_data
+
+        disp_date = self.current_data.current_datetime.strftime("%d-%m-%Y")
+        disp_time = self.current_data.current_datetime.strftime("%H:%M:%S")
+
+        # Blink or pulse the LED to match the timer.
+        self.led_animator.set_pattern(led.pattern_for_timer(timer_data))
+
+        # Pomodoro timer string to be displayed.
+        pomodoro_time_str = format_countdown(timer_data.remaining_timer_s)
+
+        # Background image
+        # Start of time
+        if self.current_image is None:
+            self.current_image = self.image_manager.get_current_image()
+
+        # Go to the next image every minute
+        elif timer_data.remaining_timer_s % 60 == 0:
+            self.current_image = self.image_manager.get_current_image()
+            # self.draw_icons(self.buffer)
+
+        else:  # no change
+            self.current_image = self.current_image
+
+        stage_start = time.perf_counter()
+
+        # Static layer only needs rendering when the background image or the timer changes. Then the whole buffer is
+        # replaced, so every dynamic item is drawn again.
+        static_key = (self.current_image, timer_data.name, timer_data.description, timer_data.timer_colour)
+
+        static_changed = static_key != self._static_key
+
+        if static_changed:
+            self._static_layer = self.render_static_layer(self.image_manager.get_frame(self.current_image), timer_data)
+            self._static_key = static_key
+            self.buffer.paste(self._static_layer)
+            self._drawn_items = {}
+
+        stage_start = self._end_stage('composite', stage_start)
+
+        pomodoro_str_size = self.text_size(pomodoro_time_str, 'main', timer_data.timer_colour)
+
+        dynamic_items = {'date': (disp_date, (5, 0), 'sub', 'white', 0, None),
+                         'time': (disp_time, (200, 0), 'sub', 'white', 0, None),
+                         # Large display item
+                         'pomodoro': (pomodoro_time_str, (int((self.width - pomodoro_str_size[0]) / 2), 60),
+                                      'main', timer_data.timer_colour, 2, 'black')}
+
+        # ToDo: need to deal with different modes for font sizes.
+
+        # Only send the frame if something changed.
+        self._restored_boxes = []
+        self._drawn_boxes = []
+        changed = self.update_dynamic_items(dynamic_items)
+        stage_start = self._end_stage('text', stage_start)
+
+        if self.framebuffer_rgb565 is not None and (changed or static_changed):
+            self.update_rgb565(static_changed)
+            stage_start = self._end_stage('convert', stage_start)
+
+        if changed:
+            self.push_frame()
+            self._end_stage('push', stage_start)
+
+
+# Class for LCD - in this case the DisplayHatMini
+class LcdDisplay(FramebufferDisplay):
+    def __init__(self, toggle_pause_function, restart_function, next_function,
+                 image_cache_bytes=ImageManager.DEFAULT_CACHE_BYTES, font_path=FONT_PATH, on_stage=None,
+                 native_rgb565=False, hat_class=None, timebase=None, hat=None, preload_images=True):
+        # The Display HAT Mini driver class, can be replaced (e.g. by a stand in for benchmarking without the hardware).
+        if hat_class is None:
+            hat_class = DisplayHATMini if hat is None else type(hat)
+
+        if hat_class is None:
+            raise ImportError("LcdDisplay needs the displayhatmini library, use OffscreenDisplay without the hardware")
+
+        buffer = Image.new("RGB", (hat_class.WIDTH, hat_class.HEIGHT,), "BLACK")
+
+        # The driver may already have been set up (e.g. to show the cached first frame while starting), then it is
+        # given the buffer to draw from.
+        if hat is None:
+            self.display = hat_class(buffer, backlight_pwm=True)
+        else:
+            self.display = hat
+            self.display.buffer = buffer
+        self.display.set_led(0.0, 0.0, 0.0)
+
+        pins = [self.display.BUTTON_A, self.display.BUTTON_B, self.display.BUTTON_X, self.display.BUTTON_Y]
+
+        super().__init__(toggle_pause_function, restart_function, next_function, self.display.WIDTH,
+                         self.display.HEIGHT, pins, buffer, font_path, image_cache_bytes, on_stage, native_rgb565,
+                         getattr(self.display.st7789, '_rotation', 180), timebase, preload_images)
+
+        # Mapping to mode to buttons and functions. A button can instead be given a dict of functions for its short,
+        # long and double presses.
+        self.function_dict = {'clock': {self.display.BUTTON_A: self.change_mode,
+                                        self.display.BUTTON_X: self.toggle_pause_function,
+                                        self.display.BUTTON_B: self.restart_function,
+                                        self.display.BUTTON_Y: self.next_function},
+                              'pomodoro': {self.display.BUTTON_A: self.change_mode,
+                                           self.display.BUTTON_X: self.toggle_pause_function,
+                                           self.display.BUTTON_B: self.restart_function,
+                                           self.display.BUTTON_Y: self.next_function}}
+
+        # Buttons are debounced per pin and their functions run on the button input thread, not the GPIO callback.
+        self.button_input = buttons.ButtonInput(pins, self.action_for, self.display.read_button,
+                                                on_action=self.show_action, clock=self.timebase.monotonic)
+
+        # Register function to deal with button presses
+        self.display.on_button_pressed(self.button_input.on_edge)
+
+    # Start the button input thread along with the render and LED threads.
+    def start(self):
+        self.button_input.start()
+        super().start()
+
+    # Push the buffer to the LCD. In RGB565 mode the frame goes straight to the panel over SPI, skipping the driver's
+    # conversion of the whole RGB buffer.
+    def push_frame(self):
+        if self.framebuffer_rgb565 is None:
+            self.display.display()
+        else:
+            self.display.st7789.set_window()
+            self.display.st7789.data(self.framebuffer_rgb565.to_panel_bytes())
+
+    def set_led(self, r, g, b):
+        self.display.set_led(r, g, b)
+
+    # Return the function for a button press in the current mode, or None if there isn't one for the gesture.
+    def action_for(self, pin, gesture):
+        action = self.function_dict[self._curr_mode].get(pin)
+
+        if isinstance(action, dict):
+            return action.get(gesture)
+
+        return action if gesture == 'short' else None
+
+    # Render the latest data again after a button press, so a mode change is shown without waiting for the next tick.
+    def show_action(self, pin, gesture):
+        latest_data = self.current_data_slot.peek()
+
+        if latest_data is not None:
+            self.publish(latest_data)
+
+    # Return the button gesture counts and latencies.
+    def return_button_stats(self):
+        return self.button_input.return_stats()
+
+
+# Display that renders into an in-memory framebuffer, with the same drawing pipeline as the LCD. Allows rendering to be
+# run, checked and profiled without the hardware. Frames can be saved as PNG files.
+class OffscreenDisplay(FramebufferDisplay):
+    def __init__(self, toggle_pause_function, restart_function, next_function, width=PANEL_WIDTH,
+                 height=PANEL_HEIGHT, font_path=FONT_PATH, image_cache_bytes=ImageManager.DEFAULT_CACHE_BYTES,
+                 on_stage=None, dump_dir=None, native_rgb565=False, emulate_panel=False, timebase=None):
+        super().__init__(toggle_pause_function, restart_function, next_function, width, height,
+                         font_path=font_path, image_cache_bytes=image_cache_bytes, on_stage=on_stage,
+                         native_rgb565=native_rgb565, timebase=timebase)
+
+        # If set, every pushed frame is saved as a PNG in this directory.
+        self.dump_dir = dump_dir
+
+        # If set, each pushed frame is converted to the bytes the LCD would be sent, so benchmarks include that cost.
+        self.emulate_panel = emulate_panel
+        self.panel_bytes = None
+        self.frames_pushed = 0
+        self.led_colour = (0.0, 0.0, 0.0)
+
+    # Count the frame and save it if dumping frames.
+    def push_frame(self):
+        self.frames_pushed += 1
+
+        if self.emulate_panel:
+            if self.framebuffer_rgb565 is None:
+                self.panel_bytes = rgb565.Rgb565Framebuffer.from_image(self.buffer).to_panel_bytes()
+            else:
+                self.panel_bytes = self.framebuffer_rgb565.to_panel_bytes()
+
+        if self.dump_dir is not None:
+            self.dump_png(os.path.join(self.dump_dir, f"frame{self.frames_pushed:06d}.png"))
+
+    def set_led(self, r, g, b):
+        self.led_colour = (r, g, b)
+
+    # Save the current framebuffer as a PNG.
+    def dump_png(self, path):
+        self.buffer.save(path, 'PNG')
+
+
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+
+    # Decoded images are kept within the budget, the least recently used thrown out first. There's no frame file in
+    # the asset directory, so the JPEGs are decoded.
+    frame_bytes = PANEL_WIDTH * PANEL_HEIGHT * 3
+    image_manager = ImageManager(cache_budget_bytes=3 * frame_bytes + 1000, asset_dir='no assets')
+    image_manager.set_image_series('moon', preload=False)
+    over_budget = []
+
+    for image_name in image_manager.image_array:
+        image_manager.get_frame(image_name)
+
+        if image_manager.cache_bytes > image_manager.cache_budget_bytes:
+            over_budget.append(image_name)
+
+    # The last three are cached. Using one moves it to the end, so the next miss throws out the oldest of the others.
+    image_manager.get_frame('image21.jpg')
+    image_manager.get_frame('image0.jpg')
+    stats = image_manager.return_cache_stats()
+
+    if not over_budget and stats['frames'] == 3 and stats['bytes'] == 3 * frame_bytes and \
+            stats['misses'] == 25 and stats['hits'] == 1 and stats['evictions'] == 22 and \
+            list(image_manager._frame_cache) == ['image23.jpg', 'image21.jpg', 'image0.jpg']:
+        tests.append(Test(__file__, "Image cache within budget", "passed", f"{stats}"))
+    else:
+        tests.append(Test(__file__, "Image cache within budget", "failed", f"{over_budget} {stats}"))
+
+    # Redrawing only the changed items gives the same frame, and panel bytes, as drawing the whole frame every time.
+    # The countdown goes through minute boundaries (a new background), overrun and a timer change.
+    font_path = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+    def no_action():
+        pass
+
+    changed_regions = OffscreenDisplay(no_action, no_action, no_action, font_path=font_path, native_rgb565=True)
+    full_redraw = OffscreenDisplay(no_action, no_action, no_action, font_path=font_path)
+    work = TimerInfo('Work', 'Time to work', 1500, timer.TIMER_COLOURS[0], 'Work')
+    short_break = TimerInfo('Break', 'Have a rest', 300, timer.TIMER_COLOURS[1], 'Break')
+    start = datetime.datetime(2026, 1, 1, 9, 59, 50)
+    frames = [(start + datetime.timedelta(seconds=second), work, 62 - second) for second in range(70)]
+    frames += [(start + datetime.timedelta(seconds=70 + second), short_break, 300 - second) for second in range(3)]
+    different = []
+
+    for current_datetime, timer_info, remaining_timer_s in frames:
+        current_data = CurrentData(current_datetime, CurrentTimerData(timer_info, remaining_timer_s))
+        changed_regions.render(current_data, 0.0)
+        full_redraw._static_key = None
+        full_redraw.render(current_data, 0.0)
+
+        if changed_regions.buffer.tobytes() != full_redraw.buffer.tobytes() or \
+                changed_regions.return_panel_bytes() != \
+                rgb565.Rgb565Framebuffer.from_image(full_redraw.buffer).to_panel_bytes():
+            different.append(remaining_timer_s)
+
+    if not different and changed_regions.frames_pushed == len(frames):
+        tests.append(Test(__file__, "Changed regions match full redraw", "passed", f"{len(frames)} frames"))
+    else:
+        tests.append(Test(__file__, "Changed regions match full redraw", "failed", f"{different}"))
+
+    for test in tests:
+        print(test.return_result())
+
+    # Show a countdown on the LCD, if this is running with the Display HAT Mini.
+    if DisplayHATMini is None:
+        raise SystemExit
+
+    def toggle_pause_fnc():
+        print("toggle pause function test")
+
+
+    def back_fnc():
+        print("back function test")
+
+
+    def next_fnc():
+        print("next function test")
+
+
+    # print("here before run")
+    lcd_display = LcdDisplay(toggle_pause_fnc, back_fnc, next_fnc)
+    lcd_display.setDaemon(True)
+    lcd_display.start()
+    # print("here after run")
+    timer_info = TimerInfo("work", "work timer", "1500", '#FF00FF')
+    remaining_timer_s = 600
+
+    while True:
+        lcd_display.publish(CurrentData(datetime.datetime.now(), CurrentTimerData(timer_info, remaining_timer_s)))
+
+        remaining_timer_s -= 1
+        time.sleep(.1)
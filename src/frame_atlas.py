@@ -0,0 +1,179 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+# Packed frame file - a header, an index of frame offsets, then the raw pixels of every frame. Pixels are stored as
+# RGBA, the way PIL holds RGB images in memory, so frames can be used straight from the memory mapped file.
+MAGIC = b'PFRM'
+VERSION = 1
+MODE = 'RGBA'
+BYTES_PER_PIXEL = 4
+
+# Magic, version, offset of the pixel data, frame count, width, height, hash of what the frames were built from.
+HEADER = struct.Struct('<4sHIIHH32s')
+INDEX_ENTRY = struct.Struct('<Q')
+
+# Pixel data starts on a page boundary.
+DATA_ALIGNMENT = 4096
+
+
+# Return the hash of the source file and the parameters used to build frames from it, to tell if a rebuild is needed.
+def source_hash(source_path, *build_params):
+    digest = hashlib.sha256()
+
+    with open(source_path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+
+    digest.update(repr((VERSION, build_params)).encode())
+    return digest.digest()
+
+
+# Return the source hash stored in a frame file, or None if there isn't a valid one.
+def read_source_hash(path):
+    try:
+        with open(path, 'rb') as frame_file:
+            header = frame_file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+
+    if len(header) < HEADER.size:
+        return None
+
+    magic, version, data_offset, count, width, height, frames_hash = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    return frames_hash
+
+
+# Write a list of same sized images to a frame file.
+def write_frames(path, frames, frames_hash):
+    if not frames:
+        raise ValueError("No frames to write")
+
+    width, height = frames[0].size
+    frame_bytes = width * height * BYTES_PER_PIXEL
+
+    index_end = HEADER.size + INDEX_ENTRY.size * len(frames)
+    data_offset = (index_end + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+    # Write to a temporary file and rename, so a half written file is never used.
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as frame_file:
+        frame_file.write(HEADER.pack(MAGIC, VERSION, data_offset, len(frames), width, height, frames_hash))
+
+        for index in range(len(frames)):
+            frame_file.write(INDEX_ENTRY.pack(data_offset + index * frame_bytes))
+
+        frame_file.write(b'\0' * (data_offset - index_end))
+
+        for frame in frames:
+            if frame.size != (width, height):
+                raise ValueError(f"Frames must all be the same size, {frame.size} isn't {(width, height)}")
+            frame_file.write(frame.convert(MODE).tobytes())
+
+    os.replace(temp_path, path)
+
+
+# Read only, memory mapped frame file. Frames are PIL images that use the mapped memory directly, so getting a frame
+# doesn't decode or copy anything - the pages are read from the file by the OS when first used.
+class FrameAtlas:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as frame_file:
+            self._mmap = mmap.mmap(frame_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, data_offset, count, width, height, frames_hash = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} isn't a version {VERSION} frame file")
+
+        self.size = (width, height)
+        self.frames_hash = frames_hash
+        self._frame_bytes = width * height * BYTES_PER_PIXEL
+        self._offsets = [INDEX_ENTRY.unpack_from(self._mmap, HEADER.size + index * INDEX_ENTRY.size)[0]
+                         for index in range(count)]
+
+        if self._offsets and self._offsets[-1] + self._frame_bytes > len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated")
+
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    # Return a frame as an image using the mapped memory.
+    def frame(self, index):
+        offset = self._offsets[index]
+        return Image.frombuffer(MODE, self.size, self._view[offset:offset + self._frame_bytes], 'raw', MODE, 0, 1)
+
+    # Unmap the file. Only call once none of the frames are in use.
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    import moon
+    from timers.test import Test
+
+    tests = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = os.path.join(temp_dir, 'moon.png')
+        frames_path = os.path.join(temp_dir, 'moon.frames')
+
+        # A source image the size of the moon phases image, different all over.
+        source_size = (1250, 1850)
+        source = Image.merge('RGB', (Image.linear_gradient('L').resize(source_size),
+                                     Image.radial_gradient('L').resize(source_size),
+                                     Image.effect_noise(source_size, 64)))
+        source.save(source_path)
+
+        built = [moon.build(source_path, frames_path)]
+        built.append(moon.build(source_path, frames_path))
+
+        # Change the source - its hash no longer matches the one in the frame file, so the frames are rebuilt.
+        source.paste((255, 255, 255), moon.IMG_CROP[3])
+        source.save(source_path)
+        built.append(moon.build(source_path, frames_path))
+
+        if built == [True, False, True] and \
+                read_source_hash(frames_path) == source_hash(source_path, moon.IMG_CROP, moon.FRAME_SIZE):
+            tests.append(Test(__file__, "Rebuilt when the source changes", "passed"))
+        else:
+            tests.append(Test(__file__, "Rebuilt when the source changes", "failed", f"{built}"))
+
+        # The mapped frames are the same as decoding and resizing the source again.
+        atlas = FrameAtlas(frames_path)
+        decoded = moon.build_frames(source_path)
+        different = [index for index in range(len(atlas))
+                     if atlas.frame(index).convert('RGB').tobytes() != decoded[index].convert('RGB').tobytes()]
+
+        if len(atlas) == len(decoded) and not different:
+            tests.append(Test(__file__, "Mapped frames match decoded", "passed"))
+        else:
+            tests.append(Test(__file__, "Mapped frames match decoded", "failed", f"{len(atlas)} {different}"))
+
+        atlas.close()
+
+        # A file that isn't a frame file is refused.
+        with open(frames_path, 'wb') as frame_file:
+            frame_file.write(b'not a frame file' * 10)
+
+        try:
+            FrameAtlas(frames_path)
+            tests.append(Test(__file__, "Bad file refused", "failed"))
+        except ValueError:
+            tests.append(Test(__file__, "Bad file refused", "passed"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,229 @@
+import math
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+# Characters used by the date, time and countdown strings.
+DIGIT_CHARSET = '0123456789:-'
+
+# Text layouts kept - the timer names and descriptions of a sequence and a few others.
+TEXT_LAYOUT_ENTRIES = 64
+
+
+# Pre-rendered glyphs for one font and colour. Strings made only of the atlas characters are drawn by pasting the cached
+# glyph bitmaps, with the layout worked out from the cached advances, so FreeType isn't used for every frame.
+class GlyphAtlas:
+    def __init__(self, font, colour, charset=DIGIT_CHARSET):
+        self.font = font
+        self.colour = colour
+
+        # Character -> (colour image, mask, x offset, y offset, advance)
+        self.glyphs = {}
+
+        for char in charset:
+            left, top, right, bottom = font.getbbox(char)
+            mask = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+            ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=255)
+
+            self.glyphs[char] = (Image.new('RGB', mask.size, colour), mask, left, top, font.getlength(char))
+
+    # Return True if every character of the text is in the atlas.
+    def can_render(self, text):
+        return len(text) > 0 and all(char in self.glyphs for char in text)
+
+    # Return the x position of each character relative to the start of the text.
+    def _layout(self, text):
+        positions = []
+        pen = 0.0
+
+        for char in text:
+            positions.append(int(pen))
+            pen += self.glyphs[char][4]
+
+        return positions
+
+    # Return the box (left, top, right, bottom) the text covers if drawn at location, matching ImageDraw.textbbox.
+    def text_bbox(self, location, text):
+        positions = self._layout(text)
+        left = top = right = bottom = None
+
+        for char, x in zip(text, positions):
+            image, mask, offset_x, offset_y, advance = self.glyphs[char]
+            glyph_box = (x + offset_x, offset_y, x + offset_x + mask.width, offset_y + mask.height)
+
+            if left is None:
+                left, top, right, bottom = glyph_box
+            else:
+                left, top = min(left, glyph_box[0]), min(top, glyph_box[1])
+                right, bottom = max(right, glyph_box[2]), max(bottom, glyph_box[3])
+
+        return location[0] + left, location[1] + top, location[0] + right, location[1] + bottom
+
+    # Return the size of the text, matching the font's getsize.
+    def text_size(self, text):
+        left, top, right, bottom = self.text_bbox((0, 0), text)
+        return right, bottom
+
+    # Draw the text onto the buffer with its origin at location, as ImageDraw.text would.
+    def draw_text(self, buffer, location, text):
+        for char, x in zip(text, self._layout(text)):
+            image, mask, offset_x, offset_y, advance = self.glyphs[char]
+            buffer.paste(image, (int(location[0]) + x + offset_x, int(location[1]) + offset_y), mask)
+
+
+# A string laid out and drawn once - its size, the box it covers and the bitmap of the text on its back fill.
+class TextLayout:
+    def __init__(self, size, box, image, mask):
+        # Size as the font's getsize gives it, for positioning the text.
+        self.size = size
+
+        # Box covered when drawn at the origin (inclusive, as ImageDraw gives it), and the bitmap with the mask to
+        # paste it with, from the top left of the box rounded down.
+        self.box = box
+        self.image = image
+        self.mask = mask
+
+    # Paste the text onto the buffer at location, as write_text would draw it. Returns the box that was drawn on.
+    def draw(self, buffer, location):
+        x, y = math.floor(location[0]), math.floor(location[1])
+        left, top, right, bottom = self.box
+
+        buffer.paste(self.image, (x + math.floor(left), y + math.floor(top)), self.mask)
+
+        return x + left, y + top, x + right, y + bottom
+
+
+# Strings laid out and rasterised once, keyed by (text, font, colour, border, back fill colour), so text is only drawn
+# with FreeType when a string changes - e.g. the timer name and description when the background image changes under
+# them. Least recently used layouts are dropped once there are max_entries.
+class TextLayoutCache:
+    def __init__(self, max_entries=TEXT_LAYOUT_ENTRIES):
+        self.max_entries = max_entries
+        self._layouts = OrderedDict()
+
+        # Sizes of text that is measured without being drawn, keyed by (text, font).
+        self._sizes = OrderedDict()
+        self._scratch = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Return the layout of the text. Text is rasterised from where it starts within a pixel, so the part of the
+    # location after the decimal point is part of the key.
+    def get(self, text, font, colour, border=0, back_fill_colour=None, location=(0, 0)):
+        offset = (location[0] - math.floor(location[0]), location[1] - math.floor(location[1]))
+        key = (text, font, colour, border, back_fill_colour, offset)
+        layout = self._layouts.get(key)
+
+        if layout is not None:
+            self.hits += 1
+            self._layouts.move_to_end(key)
+            return layout
+
+        self.misses += 1
+        layout = self._layout(text, font, colour, border, back_fill_colour, offset)
+        self._layouts[key] = layout
+
+        if len(self._layouts) > self.max_entries:
+            self._layouts.popitem(last=False)
+            self.evictions += 1
+
+        return layout
+
+    # Return the size of the text as the font's getsize gives it, from a layout if there is one.
+    def text_size(self, text, font):
+        key = (text, font)
+        size = self._sizes.get(key)
+
+        if size is not None:
+            self.hits += 1
+            self._sizes.move_to_end(key)
+            return size
+
+        self.misses += 1
+        size = self._sizes[key] = font.getsize(text)
+
+        if len(self._sizes) > self.max_entries:
+            self._sizes.popitem(last=False)
+            self.evictions += 1
+
+        return size
+
+    # Lay out and draw the text as write_text does - its box, with the back fill grown by the border, then the text.
+    def _layout(self, text, font, colour, border, back_fill_colour, offset):
+        left, top, right, bottom = self._scratch.textbbox(offset, text, font=font)
+
+        if back_fill_colour is not None:
+            left, top, right, bottom = left - border, top - border, right + border, bottom + border
+
+        # Drawn into a bitmap whose top left is the box's, moved by whole pixels so it is rasterised the same.
+        origin_x, origin_y = math.floor(left), math.floor(top)
+        size = (max(math.ceil(right) - origin_x + 1, 1), max(math.ceil(bottom) - origin_y + 1, 1))
+        location = (offset[0] - origin_x, offset[1] - origin_y)
+        box = (left - origin_x, top - origin_y, right - origin_x, bottom - origin_y)
+
+        image = Image.new('RGB', size, colour)
+        mask = Image.new('L', size, 0)
+        image_draw = ImageDraw.Draw(image)
+        mask_draw = ImageDraw.Draw(mask)
+
+        # With a back fill the whole box is pasted, otherwise the text is pasted in its colour through its coverage.
+        if back_fill_colour is not None:
+            image_draw.rectangle(box, fill=back_fill_colour)
+            image_draw.text(location, text, font=font, fill=colour)
+            mask_draw.rectangle(box, fill=255)
+
+        mask_draw.text(location, text, font=font, fill=255)
+
+        return TextLayout(font.getsize(text), (left, top, right, bottom), image, mask)
+
+    # Return the counts of layouts reused, made and dropped.
+    def return_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'layouts': len(self._layouts),
+                'sizes': len(self._sizes)}
+
+
+# Tests
+if __name__ == '__main__':
+    from PIL import ImageChops, ImageFont
+    from display import FramebufferDisplay
+    from timers.test import Test
+
+    tests = []
+    font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 25)
+    background = Image.open('image0.jpg').convert('RGB')
+    cache = TextLayoutCache(max_entries=4)
+    differences = []
+
+    # Pasting the cached text draws the same pixels as write_text, wherever it starts within a pixel.
+    for location in ((10, 140), (37.5, 170), (12.25, 3.75)):
+        for border, back_fill_colour in ((2, 'black'), (0, None)):
+            drawn = background.copy()
+            pasted = background.copy()
+            drawn_box = FramebufferDisplay.write_text(ImageDraw.Draw(drawn), 'Long break', location, font, '#FF0000',
+                                                      border, back_fill_colour)
+            cached_text = cache.get('Long break', font, '#FF0000', border, back_fill_colour, location)
+            pasted_box = cached_text.draw(pasted, location)
+
+            if ImageChops.difference(drawn, pasted).getbbox() is not None or tuple(drawn_box) != pasted_box:
+                differences.append((location, border, back_fill_colour))
+
+    if not differences:
+        tests.append(Test(__file__, "Same as write_text", "passed"))
+    else:
+        tests.append(Test(__file__, "Same as write_text", "failed", f"{differences}"))
+
+    # Six layouts were made, the oldest two dropped. The newest is reused.
+    cache.get('Long break', font, '#FF0000', 0, None, (12.25, 3.75))
+
+    if cache.return_stats() == {'hits': 1, 'misses': 6, 'evictions': 2, 'layouts': 4, 'sizes': 0}:
+        tests.append(Test(__file__, "Least recently used dropped", "passed"))
+    else:
+        tests.append(Test(__file__, "Least recently used dropped", "failed", f"{cache.return_stats()}"))
+
+    for test in tests:
+        print(test.return_result())
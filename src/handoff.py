@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+# Single slot that holds only the latest published value. Publishing never blocks or builds up a backlog - a newer value
+# just replaces one that hasn't been taken yet - and the reader wakes as soon as something is published.
+class LatestValueSlot:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._value = None
+        self._publish_time = None
+        self._version = 0
+        self._taken_version = 0
+
+        # Values published, and values replaced before they were taken.
+        self.published_count = 0
+        self.coalesced_count = 0
+
+        # Functions called after each publish, for readers that can't wait on the condition (e.g. asyncio).
+        self._listeners = []
+
+    # Call a function, with no arguments, after every publish. It is called on the publishing thread.
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Publish a new value, replacing any that hasn't been taken, and wake the reader.
+    def publish(self, value):
+        with self._condition:
+            if self._version != self._taken_version:
+                self.coalesced_count += 1
+
+            self._value = value
+            self._publish_time = self.clock()
+            self._version += 1
+            self.published_count += 1
+            self._condition.notify_all()
+
+        for listener in self._listeners:
+            listener()
+
+    # Wait until there is a value that hasn't been taken and return it with the time it was published.
+    # Returns None if the timeout runs out first.
+    def wait_for_new(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._version != self._taken_version, timeout):
+                return None
+
+            self._taken_version = self._version
+            return self._value, self._publish_time
+
+    # Return the number of values waiting to be taken - 0 or 1.
+    def pending_count(self):
+        return int(self._version != self._taken_version)
+
+    # Return the latest value without waiting, whether or not it has been taken.
+    def peek(self):
+        with self._condition:
+            return self._value
+
+
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+
+    # Values published before the reader takes one are replaced - only the latest is taken.
+    slot = LatestValueSlot(clock=lambda: 5.0)
+    listened = []
+    slot.add_listener(lambda: listened.append(slot.peek()))
+
+    for value in range(5):
+        slot.publish(value)
+
+    pending = slot.pending_count()
+    taken = slot.wait_for_new(timeout=0)
+
+    if taken == (4, 5.0) and pending == 1 and slot.pending_count() == 0 and slot.coalesced_count == 4 and \
+            listened == [0, 1, 2, 3, 4]:
+        tests.append(Test(__file__, "Latest value only", "passed"))
+    else:
+        tests.append(Test(__file__, "Latest value only", "failed", f"{taken} {pending} {slot.coalesced_count}"))
+
+    # Nothing new once taken, so waiting times out.
+    if slot.wait_for_new(timeout=0.01) is None:
+        tests.append(Test(__file__, "Nothing new", "passed"))
+    else:
+        tests.append(Test(__file__, "Nothing new", "failed"))
+
+    # A reader waiting on another thread wakes when a value is published.
+    woken = []
+    reader = threading.Thread(target=lambda: woken.append(slot.wait_for_new(timeout=5.0)))
+    reader.start()
+    time.sleep(0.05)
+    slot.publish('new')
+    reader.join()
+
+    if woken == [('new', 5.0)]:
+        tests.append(Test(__file__, "Reader woken", "passed"))
+    else:
+        tests.append(Test(__file__, "Reader woken", "failed", f"{woken}"))
+
+    for test in tests:
+        print(test.return_result())
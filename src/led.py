@@ -0,0 +1,152 @@
+import threading
+import time
+
+# Seconds before the end of a break that the break ending pulse starts.
+BREAK_ENDING_WARNING_S = 60
+
+
+# Make a pulse pattern - the colour fades up and back down over the period, in a number of steps each way.
+def make_pulse(colour, period_s, steps=10):
+    pattern = []
+    step_s = period_s / (2 * steps)
+
+    for step in list(range(steps + 1)) + list(range(steps - 1, 0, -1)):
+        pattern.append((step_s, tuple(level * step / steps for level in colour)))
+
+    return pattern
+
+
+# LED patterns, as a list of (duration in seconds, (r, g, b)) steps that loop. None means the LED is off.
+PATTERNS = {'off': None,
+            'overrun_blink': [(0.1, (0.5, 0.0, 0.0)), (0.4, (0.0, 0.0, 0.0))],
+            'break_ending_pulse': make_pulse((0.0, 0.5, 0.0), 2.0)}
+
+
+# Return the pattern to show for the timer data sent by the clock.
+def pattern_for_timer(timer_data):
+    if timer_data.remaining_timer_s < 0:
+        return 'overrun_blink'
+    elif timer_data.timer_type == 'Break' and 0 < timer_data.remaining_timer_s <= BREAK_ENDING_WARNING_S:
+        return 'break_ending_pulse'
+    else:
+        return 'off'
+
+
+# Runs the LED patterns on its own thread, so they never hold up rendering. Timing is from a monotonic clock, and the
+# LED is only set when its colour changes.
+class LedAnimator(threading.Thread):
+    def __init__(self, set_led, clock=time.monotonic):
+        super().__init__(daemon=True)
+        self.set_led = set_led
+        self.clock = clock
+
+        self.pattern_name = 'off'
+        self._pattern_start = None
+        self._colour = None
+        self._condition = threading.Condition()
+
+    # Change the pattern. Setting the pattern that is already running does nothing, so this can be called every frame.
+    def set_pattern(self, pattern_name):
+        if pattern_name not in PATTERNS:
+            raise ValueError(f"Unrecognised LED pattern {pattern_name}")
+
+        with self._condition:
+            if pattern_name != self.pattern_name:
+                self.pattern_name = pattern_name
+                self._pattern_start = None
+                self._condition.notify()
+
+    # Set the LED for the time now and return the time of the next change, or None if there won't be one.
+    def update(self, now):
+        pattern = PATTERNS[self.pattern_name]
+
+        if pattern is None:
+            self._show((0.0, 0.0, 0.0))
+            return None
+
+        if self._pattern_start is None:
+            self._pattern_start = now
+
+        # Find the step in the current loop of the pattern.
+        period = sum(duration for duration, colour in pattern)
+        phase = (now - self._pattern_start) % period
+
+        for duration, colour in pattern:
+            if phase < duration:
+                self._show(colour)
+                return now + duration - phase
+            phase -= duration
+
+        # Only reached through rounding at the very end of the loop.
+        self._show(pattern[0][1])
+        return now + pattern[0][0]
+
+    # Set the LED, if it has changed.
+    def _show(self, colour):
+        if colour != self._colour:
+            self._colour = colour
+            self.set_led(*colour)
+
+    def run(self):
+        with self._condition:
+            while True:
+                next_change = self.update(self.clock())
+
+                # Sleep until the next step is due, or the pattern is changed.
+                if next_change is None:
+                    self._condition.wait()
+                else:
+                    self._condition.wait(max(next_change - self.clock(), 0))
+
+
+if __name__ == '__main__':
+    from snapshots import CurrentTimerData, TimerInfo
+    from timers.test import Test
+
+    tests = []
+
+    # The pattern follows the timer - blinking once overrun, pulsing near the end of a break.
+    work = TimerInfo('Work', '', 1500, (255, 0, 0), 'Work')
+    short_break = TimerInfo('Break', '', 300, (0, 255, 0), 'Break')
+    patterns = [pattern_for_timer(CurrentTimerData(timer_info, remaining_timer_s))
+                for timer_info, remaining_timer_s in ((work, 30), (work, -5), (short_break, 200), (short_break, 30),
+                                                      (short_break, 0), (short_break, -1))]
+    expected = ['off', 'overrun_blink', 'off', 'break_ending_pulse', 'off', 'overrun_blink']
+
+    if patterns == expected:
+        tests.append(Test(__file__, "Pattern for timer", "passed"))
+    else:
+        tests.append(Test(__file__, "Pattern for timer", "failed", f"{patterns}"))
+
+    # Blinks on its deadlines, only setting the LED when it changes, then stops once the pattern is off.
+    colours = []
+    animator = LedAnimator(lambda r, g, b: colours.append((r, g, b)), clock=lambda: 0.0)
+    animator.set_pattern('overrun_blink')
+    deadlines = [round(animator.update(now), 6) for now in (10.0, 10.05, 10.25, 10.5)]
+    animator.set_pattern('off')
+    stopped = animator.update(10.6)
+
+    if deadlines == [10.1, 10.1, 10.5, 10.6] and stopped is None and \
+            colours == [(0.5, 0.0, 0.0), (0.0, 0.0, 0.0), (0.5, 0.0, 0.0), (0.0, 0.0, 0.0)]:
+        tests.append(Test(__file__, "Blink then stop", "passed"))
+    else:
+        tests.append(Test(__file__, "Blink then stop", "failed", f"{deadlines} {stopped} {colours}"))
+
+    # On its thread, the LED stops changing once the pattern is off.
+    colours = []
+    animator = LedAnimator(lambda r, g, b: colours.append((r, g, b)))
+    animator.set_pattern('overrun_blink')
+    animator.start()
+    time.sleep(1.2)
+    animator.set_pattern('off')
+    time.sleep(0.1)
+    changes_when_off = len(colours)
+    time.sleep(0.6)
+
+    if changes_when_off >= 5 and len(colours) == changes_when_off and colours[-1] == (0.0, 0.0, 0.0):
+        tests.append(Test(__file__, "Thread stops when off", "passed", f"{changes_when_off} changes"))
+    else:
+        tests.append(Test(__file__, "Thread stops when off", "failed", f"{colours}"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,198 @@
+import atexit
+import contextlib
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import sys
+
+# The logging config file beside this module, so logging is set up the same whatever directory the clock is run from.
+LOGGING_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logging.conf')
+
+# Loggers used by the project, which are switched to log through a queue.
+PROJECT_LOGGERS = ('raspidoroLogger',)
+
+# Queue listeners writing the queued records, so they can be stopped and flushed on shutdown.
+_listeners = []
+_atexit_registered = False
+
+
+# Queue handler with a bounded queue. Logging only costs putting the record on the queue. If the queue is full the
+# record is dropped, after waiting up to block_timeout_s for space if that is set (backpressure), and counted.
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, block_timeout_s=0.0):
+        super().__init__(log_queue)
+        self.block_timeout_s = block_timeout_s
+        self.dropped_count = 0
+
+    def enqueue(self, record):
+        try:
+            if self.block_timeout_s > 0:
+                self.queue.put(record, timeout=self.block_timeout_s)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+# Queue listener that can always be stopped - the stop marker waits for space on a full queue, rather than failing.
+class FlushingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+# Load the logging config file, then move the project loggers' handlers (e.g. the rotating log file) onto a
+# background thread, fed through a bounded queue, so logging from the button callbacks and timers never waits for the
+# SD card or a log rollover.
+def configure_logging(config_path=LOGGING_CONF, queue_size=1000, block_timeout_s=0.0, loggers=PROJECT_LOGGERS):
+    global _atexit_registered
+
+    # Reconfiguring replaces the handlers, so stop the old listeners first.
+    shutdown_logging()
+
+    logging.config.fileConfig(config_path, disable_existing_loggers=False)
+
+    for logger_name in loggers:
+        logger = logging.getLogger(logger_name)
+        handlers = list(logger.handlers)
+
+        if not handlers:
+            continue
+
+        log_queue = queue.Queue(maxsize=queue_size)
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(DroppingQueueHandler(log_queue, block_timeout_s))
+
+        listener = FlushingQueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+
+
+# Write everything still queued and stop the background threads. Registered to run on exit.
+def shutdown_logging():
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+
+        for handler in listener.handlers:
+            handler.flush()
+
+
+# Return the number of records waiting to be written, over all the queues.
+def return_queue_depth():
+    return sum(listener.queue.qsize() for listener in _listeners)
+
+
+# Return the number of records dropped because a queue was full, per logger.
+def return_dropped_counts(loggers=PROJECT_LOGGERS):
+    counts = {}
+
+    for logger_name in loggers:
+        for handler in logging.getLogger(logger_name).handlers:
+            if isinstance(handler, DroppingQueueHandler):
+                counts[logger_name] = counts.get(logger_name, 0) + handler.dropped_count
+
+    return counts
+
+
+# Return the handlers writing to the console (stdout or stderr), on the root and project loggers and their queues.
+def return_console_handlers(loggers=PROJECT_LOGGERS):
+    handlers = list(logging.getLogger().handlers)
+
+    for logger_name in loggers:
+        handlers.extend(logging.getLogger(logger_name).handlers)
+
+    for listener in _listeners:
+        handlers.extend(listener.handlers)
+
+    console_handlers = []
+
+    for handler in handlers:
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler) and \
+                handler.stream in (sys.stdout, sys.stderr) and handler not in console_handlers:
+            console_handlers.append(handler)
+
+    return console_handlers
+
+
+# Send what the console handlers write to another stream while in the with block, e.g. while curses has the terminal.
+@contextlib.contextmanager
+def redirect_console(stream, loggers=PROJECT_LOGGERS):
+    handlers = return_console_handlers(loggers)
+    old_streams = [handler.setStream(stream) for handler in handlers]
+
+    try:
+        yield
+    finally:
+        for handler, old_stream in zip(handlers, old_streams):
+            handler.setStream(old_stream)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    from timers.test import Test
+
+    tests = []
+
+    # A full queue drops and counts records, rather than waiting for space.
+    full_queue = queue.Queue(maxsize=3)
+    dropping_handler = DroppingQueueHandler(full_queue)
+    dropping_logger = logging.getLogger('logsetupTestDropping')
+    dropping_logger.propagate = False
+    dropping_logger.addHandler(dropping_handler)
+
+    for number in range(10):
+        dropping_logger.warning("record %d", number)
+
+    if full_queue.qsize() == 3 and dropping_handler.dropped_count == 7 and \
+            return_dropped_counts(('logsetupTestDropping',)) == {'logsetupTestDropping': 7}:
+        tests.append(Test(__file__, "Full queue drops", "passed"))
+    else:
+        tests.append(Test(__file__, "Full queue drops", "failed", f"{dropping_handler.dropped_count}"))
+
+    # Shutting down writes every queued record to the log file. The queue is big enough that nothing is dropped.
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_path = os.path.join(temp_dir, 'test.log')
+        config_path = os.path.join(temp_dir, 'logging.conf')
+
+        with open(config_path, 'w') as config_file:
+            config_file.write("[loggers]\nkeys=root,testLogger\n\n"
+                              "[handlers]\nkeys=fileHandler\n\n"
+                              "[formatters]\nkeys=\n\n"
+                              "[logger_root]\nhandlers=\n\n"
+                              "[logger_testLogger]\nlevel=DEBUG\nhandlers=fileHandler\nqualname=logsetupTest\n"
+                              "propagate=0\n\n"
+                              f"[handler_fileHandler]\nclass=FileHandler\nargs=({log_path!r},)\n")
+
+        configure_logging(config_path, queue_size=1000, loggers=('logsetupTest',))
+        test_logger = logging.getLogger('logsetupTest')
+
+        file_handlers = [handler for listener in _listeners for handler in listener.handlers]
+
+        for number in range(500):
+            test_logger.info("record %d", number)
+
+        shutdown_logging()
+
+        with open(log_path) as log_file:
+            lines = log_file.read().splitlines()
+
+        if lines == [f"record {number}" for number in range(500)] and not _listeners:
+            tests.append(Test(__file__, "Shutdown flushes", "passed"))
+        else:
+            tests.append(Test(__file__, "Shutdown flushes", "failed", f"{len(lines)} lines"))
+
+        # Close the file before the directory is removed.
+        for handler in file_handlers:
+            handler.close()
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,263 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds, doubling from 100us to about 6.5s. Anything longer goes in the last bucket.
+LATENCY_BOUNDS_S = tuple(0.0001 * 2 ** exponent for exponent in range(17))
+
+
+# Histogram of values in fixed buckets, with the count, total, min and max. A histogram can be shared by several
+# threads (e.g. every display of a type adds to the same render histograms), so values are added under a lock.
+class Histogram:
+    def __init__(self, bounds=LATENCY_BOUNDS_S):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.bounds, value)
+
+        with self._lock:
+            self.bucket_counts[bucket] += 1
+            self.count += 1
+            self.total += value
+
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    # Return the value the fraction of values are at or below, as the upper bound of its bucket.
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0.0
+
+        target = fraction * self.count
+        seen = 0
+
+        for index, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+
+        return self.max
+
+    def return_stats(self):
+        with self._lock:
+            return {'count': self.count,
+                    'mean': self.total / self.count if self.count else 0.0,
+                    'min': self.min if self.min is not None else 0.0,
+                    'p50': self.percentile(0.5),
+                    'p95': self.percentile(0.95),
+                    'p99': self.percentile(0.99),
+                    'max': self.max if self.max is not None else 0.0,
+                    'buckets': {f"le_{bound:g}": bucket_count
+                                for bound, bucket_count in zip(self.bounds + (float('inf'),), self.bucket_counts)
+                                if bucket_count}}
+
+
+# Histogram that ignores what it is given, used while metrics are disabled.
+class NullHistogram:
+    def observe(self, value):
+        pass
+
+
+NULL_HISTOGRAM = NullHistogram()
+
+
+# Named histograms and gauges. Gauges are functions read when the stats are taken (e.g. a queue's depth) - if several
+# are registered under one name (e.g. one per display of a type), their values are added together.
+class Registry:
+    enabled = True
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start_time = clock()
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._gauges = {}
+
+    # Return the histogram with the name, making it if it doesn't exist yet.
+    def histogram(self, name, bounds=LATENCY_BOUNDS_S):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(bounds)
+            return self._histograms[name]
+
+    def gauge(self, name, read_value):
+        with self._lock:
+            self._gauges.setdefault(name, []).append(read_value)
+
+    # Return the stats of every histogram and the value of every gauge.
+    def return_stats(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            gauges = {name: list(read_values) for name, read_values in self._gauges.items()}
+
+        return {'uptime_s': self.clock() - self.start_time,
+                'histograms': {name: histogram.return_stats() for name, histogram in sorted(histograms.items())},
+                'gauges': {name: sum(read_value() for read_value in read_values)
+                           for name, read_values in sorted(gauges.items())}}
+
+
+# Registry used while metrics are disabled - hands out the null histogram and keeps nothing, so instrumented code costs
+# a call to a method that does nothing.
+class NullRegistry:
+    enabled = False
+
+    def histogram(self, name, bounds=LATENCY_BOUNDS_S):
+        return NULL_HISTOGRAM
+
+    def gauge(self, name, read_value):
+        pass
+
+    def return_stats(self):
+        return {}
+
+
+_registry = NullRegistry()
+
+
+# Return the registry the instrumented code uses.
+def get_registry():
+    return _registry
+
+
+# Turn metrics on. Must be called before the clock and displays are made, as they get their histograms when made.
+def enable():
+    global _registry
+
+    if not _registry.enabled:
+        _registry = Registry()
+
+    return _registry
+
+
+# Local HTTP endpoint serving the stats as JSON, on its own thread.
+class StatsServer(threading.Thread):
+    def __init__(self, registry, port=8765, host='127.0.0.1'):
+        super().__init__(daemon=True)
+
+        # Only imported when serving, it is slow to import on a Pi Zero.
+        import http.server
+
+        class StatsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/stats'):
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(registry.return_stats(), indent=2).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # Don't print every request.
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), StatsHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Writes the stats as JSON to a file every interval, on its own thread. The file is replaced in one go, so a reader
+# never sees it half written.
+class StatsDumper(threading.Thread):
+    def __init__(self, registry, path, interval_s=60.0):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval_s = interval_s
+        self._stopped = threading.Event()
+
+    def dump(self):
+        temp_path = f"{self.path}.tmp"
+
+        with open(temp_path, 'w') as stats_file:
+            json.dump(self.registry.return_stats(), stats_file, indent=2)
+
+        os.replace(temp_path, self.path)
+
+    def run(self):
+        while not self._stopped.wait(self.interval_s):
+            self.dump()
+
+    def stop(self):
+        self._stopped.set()
+        self.dump()
+
+
+# Tests
+if __name__ == '__main__':
+    import urllib.request
+    from timers.test import Test
+
+    tests = []
+
+    histogram = Histogram()
+    for value in [0.001] * 90 + [0.05] * 10:
+        histogram.observe(value)
+
+    stats = histogram.return_stats()
+
+    if 0.001 <= stats['p50'] < 0.002 and 0.05 <= stats['p99'] < 0.1 and stats['max'] == 0.05:
+        tests.append(Test(__file__, "Histogram percentiles", "passed"))
+    else:
+        tests.append(Test(__file__, "Histogram percentiles", "failed", f"{stats}"))
+
+    # Values added from several threads at once are all counted.
+    shared_histogram = Histogram()
+    observers = [threading.Thread(target=lambda: [shared_histogram.observe(0.001) for value in range(100000)])
+                 for thread in range(4)]
+    for observer in observers:
+        observer.start()
+    for observer in observers:
+        observer.join()
+
+    if shared_histogram.return_stats()['count'] == 400000 and sum(shared_histogram.bucket_counts) == 400000:
+        tests.append(Test(__file__, "Shared between threads", "passed"))
+    else:
+        tests.append(Test(__file__, "Shared between threads", "failed", f"{shared_histogram.return_stats()}"))
+
+    # Disabled metrics keep nothing.
+    get_registry().histogram('unused').observe(1.0)
+
+    if get_registry().return_stats() == {}:
+        tests.append(Test(__file__, "Disabled", "passed"))
+    else:
+        tests.append(Test(__file__, "Disabled", "failed", f"{get_registry().return_stats()}"))
+
+    registry = enable()
+    registry.histogram('tick_lateness_s').observe(0.002)
+    registry.gauge('queue_depth', lambda: 2)
+    registry.gauge('queue_depth', lambda: 3)
+
+    stats_server = StatsServer(registry, port=0)
+    stats_server.start()
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{stats_server.server.server_address[1]}/stats") as response:
+        served = json.load(response)
+
+    stats_server.stop()
+
+    if served['gauges'] == {'queue_depth': 5} and served['histograms']['tick_lateness_s']['count'] == 1:
+        tests.append(Test(__file__, "Stats endpoint", "passed"))
+    else:
+        tests.append(Test(__file__, "Stats endpoint", "failed", f"{served}"))
+
+    for test in tests:
+        print(test.return_result())
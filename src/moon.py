@@ -1,66 +1,31 @@
 #!/usr/bin/env python3
-import time
-# import pigpio
-from displayhatmini import DisplayHATMini
+# Build the moon phase frames for the background. Each phase is cropped from Moon_phases.jpg, resized and all of them
+# are written to one packed frame file, which ImageManager memory maps at runtime. The frames are only rebuilt when the
+# source image or the build settings change.
+#
+#   python moon.py [--force] [--output assets/moon.frames]
 
-try:
-    from PIL import Image, ImageDraw, ImageFont
-except ImportError:
-    print("""This example requires PIL/Pillow, try:
+import argparse
+import os
 
-sudo apt install python3-pil
+from PIL import Image
 
-""")
+import frame_atlas
 
-width = DisplayHATMini.WIDTH
-height = DisplayHATMini.HEIGHT
-buffer = Image.new("RGB", (width, height), "BLACK")
+SOURCE_IMAGE = 'Moon_phases.jpg'
+OUTPUT_PATH = 'assets/moon.frames'
 
-font = ImageFont.load_default()
+# Frames are square, the height of the display.
+FRAME_SIZE = 240
 
-displayhatmini = DisplayHATMini(buffer, backlight_pwm=True)
-displayhatmini.set_led(0.05, 0.05, 0.05)
-
-brightness = 1.0
-
-
-# Plumbing to convert Display HAT Mini button presses into pygame events
-def button_callback(pin):
-    global brightness
-
-    # Only handle presses
-    if not displayhatmini.read_button(pin):
-        return
-
-    if pin == displayhatmini.BUTTON_A:
-        brightness += 0.1
-        brightness = min(1, brightness)
-        print("A Button")
-
-    if pin == displayhatmini.BUTTON_B:
-        brightness -= 0.1
-        brightness = max(0, brightness)
-        print("B Button")
-
-
-displayhatmini.on_button_pressed(button_callback)
-
-def draw_icons(buffer):
-    buffer.paste(Image.open("icons/eject.png"),(0, 60), 0)
-    buffer.paste(Image.open("icons/pause.png"),(280, 40), 0)
-    buffer.paste(Image.open("icons/back-button.png"),(0, 200), 0)
-    buffer.paste(Image.open("icons/next-button.png"),(280, 200), 0)
-
-
-with Image.open("Moon_phases.jpg") as org_img:  #
-
-    img_crop  = [
+# Position of each phase in the source image (left, top, right, bottom).
+IMG_CROP = [
     (35, 50, 325, 340),  # 0
     (335, 50, 625, 340),
     (635, 50, 925, 340),
     (935, 50, 1225, 340),  # 3
     (33, 350, 323, 640),
-    (330, 350, 620, 640 ),
+    (330, 350, 620, 640),
     (638, 355, 918, 635),  # 6
     (940, 355, 1220, 635),
     (45, 660, 315, 930),
@@ -80,27 +45,39 @@ with Image.open("Moon_phases.jpg") as org_img:  #
     (640, 1550, 930, 1840),
     (950, 1550, 1240, 1840)]
 
-    for i in range(len(img_crop)):
-        img = org_img.crop(img_crop[i])
-        #print(f"Image size {img.size}")
-        img.save(f"preimage{i}.jpg")
-        img = img.resize((int(DisplayHATMini.HEIGHT), int(DisplayHATMini.HEIGHT)), Image.LANCZOS)
-        #img.show()
-        buffer.paste(img, (int((DisplayHATMini.WIDTH - DisplayHATMini.HEIGHT)/2), 0))
-        buffer.save(f"image{i}.jpg")
-        #buffer.paste(img, (0, 0))
-        draw = ImageDraw.Draw(buffer)
-        # draw_icons(buffer)
-
-        displayhatmini.display()
-        input(f"Image {i} x {img_crop[i][2]-img_crop[i][0]} y {img_crop[i][3]-img_crop[i][1]} press enter")
-
-
-#pi = pigpio.pi()
-#pi.set_pull_up_down(19, pigpio.PUD_UP)
-
-while True:
-    displayhatmini.display()
-    displayhatmini.set_backlight(brightness)
-    #print(f"Old A 5 {pi.read(5)},New A 19 {pi.read(19)}, B 6 {pi.read(6)}, X 16 {pi.read(16)},Y 24 {pi.read(24)}")
-    time.sleep(1.0/30)
+
+# Crop and resize each phase from the source image.
+def build_frames(source_path):
+    frames = []
+
+    with Image.open(source_path) as org_img:
+        for crop in IMG_CROP:
+            img = org_img.crop(crop)
+            frames.append(img.resize((FRAME_SIZE, FRAME_SIZE), Image.LANCZOS))
+
+    return frames
+
+
+# Build the frame file, unless it is already up to date. Returns True if it was built.
+def build(source_path=SOURCE_IMAGE, output_path=OUTPUT_PATH, force=False):
+    frames_hash = frame_atlas.source_hash(source_path, IMG_CROP, FRAME_SIZE)
+
+    if not force and frame_atlas.read_source_hash(output_path) == frames_hash:
+        return False
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    frame_atlas.write_frames(output_path, build_frames(source_path), frames_hash)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the packed moon phase frames.")
+    parser.add_argument('--source', default=SOURCE_IMAGE, help="source image of the moon phases")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="frame file to write")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the frames are up to date")
+    args = parser.parse_args()
+
+    if build(args.source, args.output, args.force):
+        print(f"Built {len(IMG_CROP)} frames into {args.output}")
+    else:
+        print(f"{args.output} is up to date")
@@ -0,0 +1,180 @@
+import threading
+import time
+
+from timebase import REAL_TIMEBASE
+
+
+# A display's subscription to the clock's state, with its own maximum refresh rate.
+class Subscription:
+    def __init__(self, display, max_rate_hz=None, call_later=REAL_TIMEBASE.call_later):
+        if max_rate_hz is not None and max_rate_hz <= 0:
+            raise ValueError(f"Maximum refresh rate must be greater than 0 max_rate_hz={max_rate_hz}")
+
+        self.display = display
+        self.max_rate_hz = max_rate_hz
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz is not None else 0.0
+
+        # Runs the delivery of a held back snapshot once the interval is up.
+        self.call_later = call_later
+
+        # Held while delivering, as a held back snapshot is delivered from the timer rather than the publisher.
+        self._lock = threading.Lock()
+        self._last_delivery = None
+        self._held = None
+        self._delivery_scheduled = False
+        self.delivered_count = 0
+        self.rate_limited_count = 0
+
+    # Deliver the snapshot to the display unless that would be faster than its maximum rate. A held back snapshot is
+    # kept, replacing any held back before it, and delivered once the interval is up unless a newer one is by then.
+    def offer(self, snapshot, now):
+        with self._lock:
+            if self._is_due(now):
+                self._held = None
+                self._deliver(snapshot, now)
+            else:
+                self.rate_limited_count += 1
+                self._hold(snapshot, now)
+
+    def _is_due(self, now):
+        return self._last_delivery is None or now - self._last_delivery >= self.min_interval
+
+    def _deliver(self, snapshot, now):
+        self._last_delivery = now
+        self.delivered_count += 1
+        self.display.publish(snapshot)
+
+    # Keep the snapshot, and deliver it when the interval since the last delivery is up.
+    def _hold(self, snapshot, now):
+        self._held = snapshot
+
+        if not self._delivery_scheduled:
+            self._delivery_scheduled = True
+            due = self._last_delivery + self.min_interval
+            self.call_later(due - now, lambda: self._deliver_held(due))
+
+    # Deliver the held back snapshot, or wait again if another snapshot has been delivered since it was held back.
+    def _deliver_held(self, now):
+        with self._lock:
+            self._delivery_scheduled = False
+
+            if self._held is None:
+                return
+
+            if self._is_due(now):
+                snapshot, self._held = self._held, None
+                self._deliver(snapshot, now)
+            else:
+                self._hold(self._held, now)
+
+
+# Fans each state snapshot out to any number of displays. Snapshots are immutable, so every display is given the same
+# object rather than a copy. Delivering only puts the snapshot in the display's latest value slot, which never blocks,
+# so a slow display (e.g. a network client) can't hold up the others.
+class StatePublisher:
+    def __init__(self, clock=time.monotonic, call_later=REAL_TIMEBASE.call_later):
+        self.clock = clock
+        self.call_later = call_later
+        self._lock = threading.Lock()
+
+        # Replaced rather than changed, so publish() can go through it without holding the lock.
+        self._subscriptions = ()
+
+    # Subscribe a display, optionally limiting how often it is sent data and setting the mode it shows.
+    def subscribe(self, display, max_rate_hz=None, mode=None):
+        if mode is not None:
+            display.set_mode(mode)
+
+        subscription = Subscription(display, max_rate_hz, self.call_later)
+
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+
+        return subscription
+
+    # Stop sending data to a display.
+    def unsubscribe(self, display):
+        with self._lock:
+            self._subscriptions = tuple(subscription for subscription in self._subscriptions
+                                        if subscription.display is not display)
+
+    # Return the subscribed displays.
+    def return_displays(self):
+        return [subscription.display for subscription in self._subscriptions]
+
+    # Send a snapshot to every subscribed display.
+    def publish(self, snapshot):
+        now = self.clock()
+
+        for subscription in self._subscriptions:
+            subscription.offer(snapshot, now)
+
+    # Return the delivery counts for each display.
+    def return_stats(self):
+        return [{'display': type(subscription.display).__name__,
+                 'max_rate_hz': subscription.max_rate_hz,
+                 'delivered': subscription.delivered_count,
+                 'rate_limited': subscription.rate_limited_count} for subscription in self._subscriptions]
+
+
+if __name__ == '__main__':
+    from timebase import VirtualTimebase
+    from timers.test import Test
+
+    # Keeps every snapshot it is sent.
+    class FakeDisplay:
+        def __init__(self):
+            self.received = []
+
+        def publish(self, snapshot):
+            self.received.append(snapshot)
+
+    tests = []
+    virtual = VirtualTimebase()
+    state_publisher = StatePublisher(virtual.monotonic, virtual.call_later)
+    unlimited = FakeDisplay()
+    limited = FakeDisplay()
+    state_publisher.subscribe(unlimited)
+    state_publisher.subscribe(limited, max_rate_hz=2)
+
+    # Published every 0.125s for 1.25s - the limited display is sent at most one every 0.5s, the newest held back
+    # once the interval is up, so it is left with the last one.
+    for snapshot in range(10):
+        state_publisher.publish(snapshot)
+        virtual.sleep(0.125)
+
+    virtual.sleep(1.0)
+    stats = state_publisher.return_stats()
+
+    if unlimited.received == list(range(10)):
+        tests.append(Test(__file__, "Unlimited gets every snapshot", "passed"))
+    else:
+        tests.append(Test(__file__, "Unlimited gets every snapshot", "failed", f"{unlimited.received}"))
+
+    if limited.received == [0, 3, 7, 9] and stats[1]['delivered'] == 4 and stats[1]['rate_limited'] == 9:
+        tests.append(Test(__file__, "Rate limited", "passed", f"{stats[1]}"))
+    else:
+        tests.append(Test(__file__, "Rate limited", "failed", f"{limited.received} {stats[1]}"))
+
+    # A snapshot held back is delivered when the interval since the last one is up, not before.
+    limited.received.clear()
+    state_publisher.publish('last delivered')
+    virtual.sleep(0.125)
+    state_publisher.publish('held back')
+    virtual.sleep(0.25)
+    before_interval = list(limited.received)
+    virtual.sleep(0.125)
+
+    if before_interval == ['last delivered'] and limited.received == ['last delivered', 'held back']:
+        tests.append(Test(__file__, "Held back snapshot delivered", "passed"))
+    else:
+        tests.append(Test(__file__, "Held back snapshot delivered", "failed", f"{before_interval} {limited.received}"))
+
+    try:
+        state_publisher.subscribe(FakeDisplay(), max_rate_hz=0)
+        tests.append(Test(__file__, "Zero rate refused", "failed"))
+    except ValueError:
+        tests.append(Test(__file__, "Zero rate refused", "passed"))
+
+    for test in tests:
+        print(test.return_result())
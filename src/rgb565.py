@@ -0,0 +1,95 @@
+# Native RGB565 framebuffer for the ST7789 panel. Keeping the frame in the panel's 16 bit format means only the parts
+# of the frame that change need converting, rather than the driver converting the whole RGB image for every frame.
+
+# NumPy is only needed for the RGB565 path.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Convert a PIL image (RGB or RGBA) to an array of RGB565 pixels.
+def image_to_rgb565(image):
+    pixels = np.asarray(image, dtype=np.uint16)
+
+    return ((pixels[:, :, 0] & 0xF8) << 8) | ((pixels[:, :, 1] & 0xFC) << 3) | (pixels[:, :, 2] >> 3)
+
+
+# Frame in RGB565, composited from pre-converted layers and converted regions, ready to send to the panel over SPI.
+class Rgb565Framebuffer:
+    def __init__(self, width, height, rotation=0):
+        if np is None:
+            raise ImportError("The RGB565 framebuffer needs numpy")
+
+        self.width = width
+        self.height = height
+
+        # Rotation of the panel in degrees, the frame is rotated to match when it is sent.
+        self.rotation = rotation
+        self.pixels = np.zeros((height, width), dtype=np.uint16)
+
+    # Make a framebuffer holding an RGB image, converting all of it - what the driver does for every frame.
+    @classmethod
+    def from_image(cls, image, rotation=0):
+        framebuffer = cls(image.width, image.height, rotation)
+        framebuffer.set_layer(image_to_rgb565(image))
+        return framebuffer
+
+    # Replace the whole frame with a layer that is already RGB565.
+    def set_layer(self, layer):
+        np.copyto(self.pixels, layer)
+
+    # Copy part of a layer that is already RGB565 into the frame. Box is (left, top, right, bottom), right and bottom
+    # exclusive.
+    def copy_region(self, layer, box):
+        left, top, right, bottom = box
+        self.pixels[top:bottom, left:right] = layer[top:bottom, left:right]
+
+    # Convert part of an RGB image into the frame. Box as for copy_region.
+    def update_region(self, image, box):
+        left, top, right, bottom = box
+        self.pixels[top:bottom, left:right] = image_to_rgb565(image.crop(box))
+
+    # Return the frame as big endian bytes, rotated for the panel.
+    def to_panel_bytes(self):
+        return np.rot90(self.pixels, self.rotation // 90).astype('>u2').tobytes()
+
+
+if __name__ == '__main__':
+    import random
+
+    from PIL import Image
+
+    from timers.test import Test
+
+    # The ST7789 driver's conversion, used if the driver is installed. Otherwise the same steps as its image_to_data.
+    try:
+        from st7789 import ST7789
+
+        def driver_image_to_data(image, rotation):
+            return ST7789.image_to_data(None, image, rotation)
+    except ImportError:
+        def driver_image_to_data(image, rotation):
+            pb = np.rot90(np.array(image.convert('RGB')), rotation // 90).astype('uint16')
+            result = ((pb[..., [0]] & 0xf8) << 8) | ((pb[..., [1]] & 0xfc) << 3) | ((pb[..., [2]] & 0xf8) >> 3)
+            return result.byteswap().tobytes()
+
+    tests = []
+    random.seed(1)
+    image = Image.frombytes('RGB', (32, 24), bytes(random.randrange(256) for _ in range(32 * 24 * 3)))
+
+    # Converting the whole frame, or region by region, sends the panel the same bytes as the driver would.
+    for rotation in (0, 90, 180, 270):
+        whole = Rgb565Framebuffer.from_image(image, rotation).to_panel_bytes()
+        by_region = Rgb565Framebuffer(image.width, image.height, rotation)
+        by_region.copy_region(image_to_rgb565(image), (0, 0, 32, 12))
+        by_region.update_region(image, (0, 12, 32, 24))
+        by_region.update_region(image.convert('RGBA'), (5, 15, 20, 20))
+
+        if whole == by_region.to_panel_bytes() == driver_image_to_data(image, rotation):
+            tests.append(Test(__file__, f"Same bytes as driver rotated {rotation}", "passed"))
+        else:
+            tests.append(Test(__file__, f"Same bytes as driver rotated {rotation}", "failed"))
+
+    for test in tests:
+        print(test.return_result())
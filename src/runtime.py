@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+import argparse
+import asyncio
+import concurrent.futures
+
+import clock
+import display
+import logsetup
+import terminal_display
+import timers.history as history
+import web_display
+
+
+# Runs the clock and its displays as coroutines on one asyncio event loop, in place of the clock, display, LED and
+# button threads. Ticks, LED patterns and button gestures all wait on the loop for their next deadline, so nothing is
+# woken up just to poll. Timer changes, from ticks and buttons, all happen on the loop, and each display renders the
+# latest state after them, in order.
+#
+# Rendering (including decoding background images) and pushing frames over SPI block, so each display renders on its
+# own worker thread - one frame at a time, in the order they were published - and a slow display never holds up the
+# LCD's frames.
+class Runtime:
+    def __init__(self, clock_to_run):
+        self.clock = clock_to_run
+
+        # The render thread of each display, made when the runtime starts.
+        self.executors = []
+
+        self.displays = []
+        self._coroutines = []
+        self._loop = None
+
+    # Add a display, with its own maximum refresh rate and mode if wanted. Its threads aren't started - the runtime
+    # renders it, runs its LED and handles its buttons.
+    def add_display(self, display_to_add, max_rate_hz=None, mode=None):
+        subscription = self.clock.publisher.subscribe(display_to_add, max_rate_hz, mode)
+        display_to_add.publish(self.clock.current_data)
+        self.displays.append(display_to_add)
+
+        return subscription
+
+    # Add another coroutine to run on the loop, e.g. a network front end. Given as a function returning the coroutine,
+    # called when the runtime starts.
+    def add_coroutine(self, coroutine_function):
+        self._coroutines.append(coroutine_function)
+
+    # Tick the timers on the scheduler's deadlines and publish the new state.
+    async def tick(self):
+        # Started by the first take_due_ticks, unless a lazy timer has already started it.
+        scheduler = self.clock.scheduler
+
+        while True:
+            ticks = scheduler.take_due_ticks()
+
+            while ticks == 0:
+                await asyncio.sleep(scheduler.time_to_deadline())
+                ticks = scheduler.take_due_ticks()
+
+            # The button functions can run on other threads (e.g. the terminal display's), and change the timers under
+            # the same lock.
+            with self.clock._state_lock:
+                self.clock.publish_current_data(ticks)
+
+            self.clock.flush_history()
+
+    # Render the latest data published to a display, whenever new data is published, on the display's own thread.
+    async def render(self, display_to_render, rendered):
+        published = asyncio.Event()
+        thread_name_prefix = f"render-{type(display_to_render).__name__}"
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name_prefix)
+        self.executors.append(executor)
+
+        # Data can be published from other threads (e.g. a button handled by a thread), so wake the loop thread safely.
+        display_to_render.current_data_slot.add_listener(lambda: self._loop.call_soon_threadsafe(published.set))
+
+        while True:
+            # Data published when the display was added is rendered straight away, rather than on the first tick.
+            taken = display_to_render.current_data_slot.wait_for_new(timeout=0)
+
+            if taken is None:
+                await published.wait()
+                published.clear()
+                continue
+
+            await self._loop.run_in_executor(executor, display_to_render.render, *taken)
+
+            # The LED pattern is set when rendering.
+            rendered.set()
+
+    # Step the display's LED pattern, sleeping until the next change or until a frame may have changed the pattern.
+    async def animate_led(self, led_animator, rendered):
+        while True:
+            next_change = led_animator.update(led_animator.clock())
+            timeout = None if next_change is None else max(next_change - led_animator.clock(), 0.0)
+
+            try:
+                await asyncio.wait_for(rendered.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            rendered.clear()
+
+    # Handle the display's button edges, and run the gestures as they are decided. The GPIO callback only queues the
+    # edges onto the loop, and the button functions are run here.
+    async def handle_input(self, button_input):
+        edges = asyncio.Queue()
+        button_input.edge_sink = lambda edge: self._loop.call_soon_threadsafe(edges.put_nowait, edge)
+        next_deadline = None
+
+        while True:
+            timeout = None if next_deadline is None else max(next_deadline - button_input.clock(), 0.0)
+
+            try:
+                button_input.handle_edge(*await asyncio.wait_for(edges.get(), timeout))
+            except asyncio.TimeoutError:
+                pass
+
+            next_deadline = button_input.update(button_input.clock())
+
+    # Run everything until cancelled.
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        tasks = [self.tick()]
+
+        for display_to_run in self.displays:
+            rendered = asyncio.Event()
+            tasks.append(self.render(display_to_run, rendered))
+
+            if getattr(display_to_run, 'led_animator', None) is not None:
+                tasks.append(self.animate_led(display_to_run.led_animator, rendered))
+
+            if display_to_run.button_input is not None:
+                tasks.append(self.handle_input(display_to_run.button_input))
+
+        tasks.extend(coroutine_function() for coroutine_function in self._coroutines)
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for executor in self.executors:
+                executor.shutdown(wait=False)
+            self.clock.close()
+
+
+# Run the runtime with an offscreen display for a few ticks, with buttons pressed on another thread as it ticks.
+def run_self_tests():
+    import threading
+    import time
+
+    from timers.test import Test
+
+    font_path = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+    tests = []
+
+    clock_to_run = clock.Clock(displays=[], history=history.SessionHistory(':memory:'))
+    toggle_pause, restart, next_timer = clock_to_run.return_control_functions()
+    offscreen = display.OffscreenDisplay(toggle_pause, restart, next_timer, font_path=font_path)
+    runtime = Runtime(clock_to_run)
+    runtime.add_display(offscreen)
+    clock_to_run.current_timer_seq.current_timer.start()
+
+    # Pressed as the timers tick - an odd number of times, so the timer ends up paused.
+    def press_buttons():
+        for _ in range(201):
+            toggle_pause()
+            time.sleep(0.005)
+
+    async def run_for(seconds):
+        try:
+            await asyncio.wait_for(runtime.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    presser = threading.Thread(target=press_buttons)
+    presser.start()
+    asyncio.run(run_for(2.5))
+    presser.join()
+
+    if offscreen.frames_rendered >= 3:
+        tests.append(Test(__file__, "Frames rendered", "passed", f"{offscreen.frames_rendered} frames"))
+    else:
+        tests.append(Test(__file__, "Frames rendered", "failed", f"{offscreen.frames_rendered} frames"))
+
+    # The display shows the last state published, after the last press.
+    current_timer = clock_to_run.current_timer_seq.current_timer
+
+    if current_timer.return_state() == 'paused' and offscreen.current_data is clock_to_run.current_data:
+        tests.append(Test(__file__, "Buttons pressed as it ticks", "passed"))
+    else:
+        tests.append(Test(__file__, "Buttons pressed as it ticks", "failed",
+                          f"{current_timer.return_state_str()} {offscreen.current_data}"))
+
+    for test in tests:
+        print(test.return_result())
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Pomodoro clock on an asyncio event loop")
+    clock.add_metrics_arguments(arg_parser)
+    clock.add_display_arguments(arg_parser)
+    arg_parser.add_argument('--self-test', action='store_true', help="run the runtime's self-tests, not the clock")
+    args = arg_parser.parse_args()
+
+    if args.self_test:
+        run_self_tests()
+        raise SystemExit
+    logsetup.configure_logging()
+    clock.start_metrics(args)
+
+    clock_to_run = clock.Clock(displays=[], history=history.SessionHistory())
+    clock.close_at_exit(clock_to_run)
+    runtime = Runtime(clock_to_run)
+
+    # Curses can only be used from one thread, so the terminal display renders and reads keys on its own thread.
+    terminal = None
+
+    if args.terminal:
+        terminal = terminal_display.TerminalDisplay(*clock_to_run.return_control_functions())
+        clock_to_run.add_display(terminal)
+    else:
+        runtime.add_display(display.LcdDisplay(*clock_to_run.return_control_functions()))
+
+    # The web display's server runs on the same loop, and its frames are worked out on its render thread.
+    if args.web_port is not None:
+        web = web_display.WebDisplay(*clock_to_run.return_control_functions(), args.web_host, args.web_port)
+        runtime.add_display(web)
+        runtime.add_coroutine(lambda: web.serve(render=False))
+
+    clock_to_run.current_timer_seq.current_timer.start()
+
+    # The terminal display's thread would keep the process running once the runtime has stopped.
+    try:
+        asyncio.run(runtime.run())
+    finally:
+        if terminal is not None:
+            terminal.stop()
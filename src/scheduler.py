@@ -0,0 +1,196 @@
+import time
+
+import metrics
+
+
+# Deadline based tick scheduler. Ticks fire on absolute boundaries (start + n * interval) of a monotonic clock, so the
+# time spent doing the work for a tick is not added to the period and the countdown can't drift behind wall time.
+# If the caller is late by more than an interval, the missed ticks are counted and returned so they can be caught up.
+class TickScheduler:
+    def __init__(self, interval=1.0, clock=time.monotonic, sleep=time.sleep, wall_clock=time.time, align=True):
+        if interval <= 0:
+            raise ValueError(f"Tick interval must be greater than 0 seconds interval={interval}")
+
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.wall_clock = wall_clock
+
+        # Align the first tick to the next whole interval of wall time, so the seconds change in step with the time.
+        self.align = align
+
+        self.start_time = None
+        self.next_deadline = None
+
+        # Statistics - lag is how late a wake up was against its deadline, jitter is how far the period between two
+        # wake ups was from the interval.
+        self.tick_count = 0
+        self.wake_count = 0
+        self.missed_ticks = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.max_jitter = 0.0
+        self._lag_total = 0.0
+        self._jitter_total = 0.0
+        self._last_wake = None
+
+        self._lag_histogram = metrics.get_registry().histogram('tick.lateness_s')
+        metrics.get_registry().gauge('tick.missed_ticks', lambda: self.missed_ticks)
+
+    # Set the time of the first deadline. Called automatically by wait() if not called beforehand.
+    def start(self):
+        self.start_time = self.clock()
+
+        if self.align:
+            self.start_time += self.interval - (self.wall_clock() % self.interval)
+        else:
+            self.start_time += self.interval
+
+        self.next_deadline = self.start_time
+
+    # Sleep until the next deadline and return the number of ticks that are due - normally 1, more if ticks were missed.
+    def wait(self):
+        ticks = self.take_due_ticks()
+
+        while ticks == 0:
+            self.sleep(self.time_to_deadline())
+            ticks = self.take_due_ticks()
+
+        return ticks
+
+    # Seconds until the next deadline, 0 if it has passed. For callers that do their own sleeping (e.g. asyncio).
+    def time_to_deadline(self):
+        if self.next_deadline is None:
+            self.start()
+
+        return max(self.next_deadline - self.clock(), 0.0)
+
+    # Return the number of ticks that are due without sleeping - 0 if the next deadline hasn't been reached yet.
+    def take_due_ticks(self):
+        if self.next_deadline is None:
+            self.start()
+
+        now = self.clock()
+        if now < self.next_deadline:
+            return 0
+
+        lag = now - self.next_deadline
+        ticks = int(lag // self.interval) + 1
+
+        self._record(now, lag, ticks)
+        self.next_deadline += ticks * self.interval
+
+        return ticks
+
+    # Update the lag and jitter statistics for a wake up.
+    def _record(self, now, lag, ticks):
+        self.wake_count += 1
+        self.tick_count += ticks
+        self.missed_ticks += ticks - 1
+
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_total += lag
+        self._lag_histogram.observe(lag)
+
+        if self._last_wake is not None:
+            jitter = abs((now - self._last_wake) - ticks * self.interval)
+            self.max_jitter = max(self.max_jitter, jitter)
+            self._jitter_total += jitter
+
+        self._last_wake = now
+
+    # Return the time of the latest tick deadline that has passed, in seconds from the first deadline (-interval before
+    # it). Used as the time source of lazy timers, so they count on the same boundaries as decremented timers. Starts
+    # the scheduler if it hasn't been started, so the deadlines don't move once a timer is counting from them.
+    def tick_clock(self):
+        if self.next_deadline is None:
+            self.start()
+
+        return (self.clock() - self.start_time) // self.interval * self.interval
+
+    # Time the clock has actually been running for since the first deadline.
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return self.clock() - self.start_time
+
+    # How far the real time of the latest wake up is behind the time the ticks so far account for. With fixed sleeps
+    # this grows every tick; here it stays at the lag of the latest wake up, e.g. a 25 minute timer really takes 25
+    # minutes.
+    def drift(self):
+        if self._last_wake is None:
+            return 0.0
+        return (self._last_wake - self.start_time) - (self.tick_count - 1) * self.interval
+
+    # Return the scheduler statistics.
+    def return_stats(self):
+        return {'ticks': self.tick_count,
+                'wakes': self.wake_count,
+                'missed_ticks': self.missed_ticks,
+                'last_lag_s': self.last_lag,
+                'max_lag_s': self.max_lag,
+                'mean_lag_s': self._lag_total / self.wake_count if self.wake_count else 0.0,
+                'max_jitter_s': self.max_jitter,
+                'mean_jitter_s': self._jitter_total / (self.wake_count - 1) if self.wake_count > 1 else 0.0,
+                'elapsed_s': self.elapsed(),
+                'drift_s': self.drift()}
+
+    # Return the scheduler statistics as a string for printing/logging.
+    def return_stats_str(self):
+        stats = self.return_stats()
+        return f"ticks: {stats['ticks']} missed: {stats['missed_ticks']} "\
+               f"lag: {stats['last_lag_s'] * 1000:.1f}ms (max {stats['max_lag_s'] * 1000:.1f}ms) "\
+               f"jitter: {stats['mean_jitter_s'] * 1000:.1f}ms (max {stats['max_jitter_s'] * 1000:.1f}ms) "\
+               f"drift: {stats['drift_s'] * 1000:.1f}ms"
+
+
+# Tests
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+
+    # Simulated clock, where sleeping moves time on - lets missed ticks be created on demand.
+    class FakeClock:
+        def __init__(self):
+            self.now = 100.0
+
+        def clock(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.now += seconds
+
+    fake = FakeClock()
+    scheduler = TickScheduler(clock=fake.clock, sleep=fake.sleep, align=False)
+
+    ticks = [scheduler.wait() for i in range(5)]
+
+    if ticks == [1, 1, 1, 1, 1] and fake.now == 105.0:
+        tests.append(Test(__file__, "On time ticks", "passed"))
+    else:
+        tests.append(Test(__file__, "On time ticks", "failed", f"ticks {ticks} now {fake.now}"))
+
+    # Work takes 2.5s, so a tick is missed and must be caught up on the next wake up.
+    fake.now += 2.5
+    ticks = scheduler.wait()
+
+    if ticks == 2 and scheduler.missed_ticks == 1 and scheduler.next_deadline == 108.0:
+        tests.append(Test(__file__, "Missed ticks", "passed"))
+    else:
+        tests.append(Test(__file__, "Missed ticks", "failed", f"ticks {ticks} deadline {scheduler.next_deadline}"))
+
+    # Real clock - work time should not accumulate.
+    scheduler = TickScheduler(interval=0.05)
+    for i in range(20):
+        scheduler.wait()
+        time.sleep(0.02)
+
+    if abs(scheduler.drift()) < scheduler.interval:
+        tests.append(Test(__file__, "No drift", "passed", scheduler.return_stats_str()))
+    else:
+        tests.append(Test(__file__, "No drift", "failed", scheduler.return_stats_str()))
+
+    for test in tests:
+        print(test.return_result())
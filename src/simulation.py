@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# Simulation harness - runs the real clock, timers, timer sequence, button debouncing and display render path in virtual
+# time, so a day of ticks and button presses takes moments and always ends in the same state. Run from the src
+# directory:
+#
+#   python simulation.py --hours 24 --seed 1
+
+import argparse
+import random
+import time
+
+import buttons
+import clock
+import display
+import timers.history as history
+import timebase
+
+# Buttons, named as on the Display HAT Mini - A changes mode, X pauses, B restarts and Y goes to the next timer.
+PINS = ('A', 'B', 'X', 'Y')
+
+
+# Display that keeps what it would show instead of drawing it - the frames rendered and the timers shown in order.
+class RecordingDisplay(display.Display):
+    def __init__(self, toggle_pause_function, restart_function, next_function, timebase=None):
+        super().__init__(display.PANEL_WIDTH, display.PANEL_HEIGHT, toggle_pause_function, restart_function,
+                         next_function, list(PINS), timebase)
+        self.change_mode()
+        self.timers_shown = []
+
+    def change_mode(self):
+        super().change_mode()
+
+    def update_display(self):
+        timer_name = self.current_data.current_timer_data.name
+
+        if not self.timers_shown or self.timers_shown[-1] != timer_name:
+            self.timers_shown.append(timer_name)
+
+
+# A clock with its display and buttons, in virtual time. Button presses are scheduled at virtual times and go through
+# the debouncing, with bouncing contacts, the same as real presses. Nothing runs on other threads - ticks, presses and
+# frames happen in time order.
+class Simulation:
+    def __init__(self, start=None, lazy_timers=False, display_class=RecordingDisplay, **display_args):
+        if start is None:
+            self.timebase = timebase.VirtualTimebase()
+        else:
+            self.timebase = timebase.VirtualTimebase(start)
+
+        self.history = history.SessionHistory(':memory:', clock=self.timebase.monotonic,
+                                              wall_clock=self.timebase.time)
+        self.clock = clock.Clock(lazy_timers=lazy_timers, displays=[], history=self.history, timebase=self.timebase)
+
+        self.display = display_class(*self.clock.return_control_functions(), timebase=self.timebase, **display_args)
+        self.clock.publisher.subscribe(self.display)
+        self.display.publish(self.clock.current_data)
+
+        functions = {'A': self.display.change_mode,
+                     'B': self.display.restart_function,
+                     'X': self.display.toggle_pause_function,
+                     'Y': self.display.next_function}
+
+        self.pins_down = set()
+        self.buttons = buttons.ButtonInput(PINS, lambda pin, gesture: functions[pin] if gesture == 'short' else None,
+                                           lambda pin: pin in self.pins_down, on_action=self.show_action,
+                                           clock=self.timebase.monotonic)
+        self.buttons.edge_sink = self.handle_edge
+        self.display.button_input = self.buttons
+
+        self.presses = {pin: 0 for pin in PINS}
+        self.clock.scheduler.start()
+        self.render()
+
+    # Render the latest data published to the display, if there is any.
+    def render(self):
+        taken = self.display.current_data_slot.wait_for_new(timeout=0)
+
+        if taken is not None:
+            self.display.render(*taken)
+
+    # Apply the ticks that are due and show the result.
+    def tick(self):
+        ticks = self.clock.scheduler.take_due_ticks()
+
+        if ticks:
+            self.clock.publish_current_data(ticks)
+            self.render()
+
+    # Run a callback after delay seconds, once any ticks due before it have been applied.
+    def schedule(self, delay, callback):
+        def run():
+            self.tick()
+            callback()
+            self.render()
+
+        self.timebase.call_later(delay, run)
+
+    # As LcdDisplay, show the latest data again after a button press so a mode change is rendered.
+    def show_action(self, pin, gesture):
+        self.display.publish(self.display.current_data_slot.peek())
+
+    # Handle an edge straight away, and come back when the gesture it starts has to be decided.
+    def handle_edge(self, edge):
+        self.buttons.handle_edge(*edge)
+        self.update_buttons()
+
+    def update_buttons(self):
+        next_deadline = self.buttons.update(self.timebase.monotonic())
+
+        if next_deadline is not None:
+            self.timebase.call_later(next_deadline - self.timebase.monotonic(), self.update_buttons)
+
+    # Press a button after delay seconds and hold it for hold_s, with the contacts bouncing when pressed.
+    def press(self, pin, delay=0.0, hold_s=0.1, bounces=2):
+        def edge(pressed):
+            if pressed:
+                self.pins_down.add(pin)
+            else:
+                self.pins_down.discard(pin)
+
+            self.buttons.on_edge(pin)
+
+        self.presses[pin] += 1
+        self.schedule(delay, lambda: edge(True))
+
+        for bounce in range(bounces):
+            self.schedule(delay + 0.001 + 0.002 * bounce, lambda: edge(False))
+            self.schedule(delay + 0.002 + 0.002 * bounce, lambda: edge(True))
+
+        self.schedule(delay + hold_s, lambda: edge(False))
+
+    # Run for a number of virtual seconds. Every tick is run, as the real clock would, unless every_tick is False -
+    # then time jumps from one press to the next, and the ticks in between are caught up in one step.
+    def run_for(self, seconds, every_tick=True):
+        end = self.timebase.monotonic() + seconds
+        scheduler = self.clock.scheduler
+
+        if every_tick:
+            while scheduler.next_deadline <= end:
+                self.timebase.advance_to(scheduler.next_deadline)
+                self.tick()
+
+        self.timebase.advance_to(end)
+        self.tick()
+
+    # Return the state at the end of the run, to check or compare with other runs.
+    def return_state(self):
+        current_timer = self.clock.current_timer_seq.current_timer
+
+        return {'now': self.timebase.now().isoformat(),
+                'timer': current_timer.return_state_str(),
+                'sequence': [timer.name for timer in self.clock.current_timer_seq.timer_seq],
+                'mode': self.display._curr_mode,
+                'presses': dict(self.presses),
+                'gestures': dict(self.buttons.gesture_counts),
+                'pomodoros_per_day': self.history.pomodoros_per_day(),
+                'events': self.history.event_counts_per_timer()}
+
+
+# Schedule a random, but repeatable, day of use - starting the first timer, then moving to the next timer, pausing
+# and restarting at random times.
+def schedule_day(simulation, hours=24.0, seed=1):
+    rng = random.Random(seed)
+    at = 1.0
+    end = hours * 60 * 60
+
+    simulation.press('X', at)
+
+    while True:
+        at += rng.uniform(60, 30 * 60)
+        if at >= end:
+            break
+
+        action = rng.random()
+
+        if action < 0.6:
+            simulation.press('Y', at)
+        elif action < 0.85:
+            simulation.press('X', at)
+            at += rng.uniform(10, 5 * 60)
+            simulation.press('X', at)
+        elif action < 0.95:
+            simulation.press('B', at)
+        else:
+            simulation.press('A', at)
+
+
+# Run a simulated day and return the final state with the real time it took.
+def run_day(hours=24.0, seed=1, lazy_timers=False, every_tick=True):
+    start = time.perf_counter()
+
+    simulation = Simulation(lazy_timers=lazy_timers)
+    schedule_day(simulation, hours, seed)
+    simulation.run_for(hours * 60 * 60, every_tick)
+
+    return simulation.return_state(), simulation, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    from timers.test import Test
+
+    parser = argparse.ArgumentParser(description="Run the clock through simulated days of use in virtual time.")
+    parser.add_argument('--hours', type=float, default=24.0, help="virtual hours to run")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the random button presses")
+    args = parser.parse_args()
+
+    tests = []
+    final_states = {}
+
+    for lazy_timers in (False, True):
+        kind = 'lazy' if lazy_timers else 'eager'
+        ticked, ticked_sim, ticked_s = run_day(args.hours, args.seed, lazy_timers, every_tick=True)
+        jumped, jumped_sim, jumped_s = run_day(args.hours, args.seed, lazy_timers, every_tick=False)
+        repeated, repeated_sim, repeated_s = run_day(args.hours, args.seed, lazy_timers, every_tick=True)
+
+        final_states[kind] = ticked
+        timings = f"every tick {ticked_s * 1000:.0f}ms, jumping {jumped_s * 1000:.0f}ms, " \
+                  f"{ticked_sim.display.frames_rendered} frames"
+
+        # Catching ticks up in one step ends in the same state as running each of them.
+        if ticked == jumped:
+            tests.append(Test(__file__, f"{kind} ticks caught up", "passed", timings))
+        else:
+            tests.append(Test(__file__, f"{kind} ticks caught up", "failed", f"{ticked} != {jumped}"))
+
+        if ticked == repeated:
+            tests.append(Test(__file__, f"{kind} repeatable", "passed", f"{ticked['timer']}"))
+        else:
+            tests.append(Test(__file__, f"{kind} repeatable", "failed", f"{ticked} != {repeated}"))
+
+        # Every next timer and restart press is recorded once, as a completed, skipped or restarted timer, and the
+        # bouncing contacts never made an extra press.
+        recorded = sum(events.get('complete', 0) + events.get('skip', 0) + events.get('restart', 0)
+                       for events in ticked['events'].values())
+
+        if recorded == ticked['presses']['Y'] + ticked['presses']['B'] and \
+                ticked['gestures']['short'] == sum(ticked['presses'].values()):
+            tests.append(Test(__file__, f"{kind} presses recorded", "passed", f"{ticked['pomodoros_per_day']}"))
+        else:
+            tests.append(Test(__file__, f"{kind} presses recorded", "failed", f"{recorded} {ticked['presses']}"))
+
+    # Lazy timers count the same seconds as decremented ones, through every start, pause and restart.
+    if final_states['eager'] == final_states['lazy']:
+        tests.append(Test(__file__, "Lazy matches eager", "passed"))
+    else:
+        tests.append(Test(__file__, "Lazy matches eager", "failed", f"{final_states}"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,110 @@
+# Snapshots of the clock's state, sent from the clock to the displays. Kept apart from the displays, so the clock can
+# make them without importing the drawing libraries.
+
+
+# Base class for the immutable snapshots sent from the clock to the displays. Snapshots use __slots__ and can't be
+# changed once made, so a display thread can never see one half updated, and they can be shared by reference.
+class Snapshot:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable, can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable, can't delete {name}")
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and (other is self or other._values() == self._values())
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+# The parts of a timer that don't change as it counts down. Made once per timer and reused by every snapshot of it.
+class TimerInfo(Snapshot):
+    __slots__ = ('name', 'description', 'length_sec', 'timer_colour', 'timer_type')
+
+    def __init__(self, name, description, length_sec, colour, timer_type=None):
+        super().__init__(name, description, length_sec, colour, timer_type)
+
+    # Make the info for a timer.
+    @classmethod
+    def from_timer(cls, timer_to_show):
+        return cls(timer_to_show.name, timer_to_show.description, timer_to_show.length_sec,
+                   timer_to_show.return_colour(), timer_to_show.return_type())
+
+
+# Class used to transmit timer data to the diplays.
+class CurrentTimerData(Snapshot):
+    __slots__ = ('timer_info', 'remaining_timer_s')
+
+    def __init__(self, timer_info, remaining_timer_s=None):
+        super().__init__(timer_info, remaining_timer_s)
+
+    @property
+    def name(self):
+        return self.timer_info.name
+
+    @property
+    def description(self):
+        return self.timer_info.description
+
+    @property
+    def length_sec(self):
+        return self.timer_info.length_sec
+
+    @property
+    def timer_colour(self):
+        return self.timer_info.timer_colour
+
+    @property
+    def timer_type(self):
+        return self.timer_info.timer_type
+
+
+# Class to transmit timer and current timer to displays.
+class CurrentData(Snapshot):
+    __slots__ = ('current_datetime', 'current_timer_data')
+
+    def __init__(self, current_datetime=None, current_timer_data=None):
+        super().__init__(current_datetime, current_timer_data)
+
+
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+    timer_info = TimerInfo('Work', 'Work description', 1500, (255, 0, 0), 'work')
+    timer_data = CurrentTimerData(timer_info, 1200)
+
+    # Snapshots can't be changed or have attributes added or removed, so can be shared between threads.
+    for name, change in (('Set', lambda: setattr(timer_data, 'remaining_timer_s', 0)),
+                         ('Add', lambda: setattr(timer_data, 'extra', 0)),
+                         ('Delete', lambda: delattr(timer_info, 'name'))):
+        try:
+            change()
+            tests.append(Test(__file__, f"{name} attribute refused", "failed"))
+        except AttributeError:
+            tests.append(Test(__file__, f"{name} attribute refused", "passed"))
+
+    # Snapshots with the same values are equal, and hash the same.
+    same_data = CurrentTimerData(TimerInfo('Work', 'Work description', 1500, (255, 0, 0), 'work'), 1200)
+
+    if timer_data == same_data and hash(timer_data) == hash(same_data) and \
+            timer_data != CurrentTimerData(timer_info, 1199) and timer_data.name == 'Work':
+        tests.append(Test(__file__, "Equal by value", "passed"))
+    else:
+        tests.append(Test(__file__, "Equal by value", "failed", f"{timer_data} {same_data}"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,314 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger('raspidoroLogger')
+
+# When this module was imported - the clock imports it first, so this is as near to the start as Python can measure.
+IMPORT_TIME = time.perf_counter()
+
+# The first frame shown last time, as the bytes sent to the panel. Shown before anything else is loaded. Kept beside
+# this module, so it is found whatever directory the clock is run from.
+FRAME_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'first_frame.rgb565')
+
+# Seconds allowed from starting up to the clock's own first frame being shown.
+STARTUP_BUDGET_S = 3.0
+
+# Seconds to wait for the display's first frame, to save it, before carrying on without it (e.g. if rendering failed).
+FIRST_FRAME_TIMEOUT_S = 30.0
+
+
+# Times the phases of starting up, and when milestones (e.g. the first frame) are reached, from the start.
+class StartupTimer:
+    def __init__(self, start=IMPORT_TIME, clock=time.perf_counter, budget_s=STARTUP_BUDGET_S):
+        self.start = start
+        self.clock = clock
+        self.budget_s = budget_s
+
+        # (name, seconds) in the order the phases ended. Phases run on the main and loading threads.
+        self.phases = []
+        self.milestones = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases.append((name, seconds))
+
+    # Record a phase that started at phase_start. Returns the time now, to start the next phase.
+    def end_phase(self, name, phase_start):
+        now = self.clock()
+        self.add_phase(name, now - phase_start)
+        return now
+
+    # Record that a milestone has been reached, in seconds from the start.
+    def mark(self, name):
+        with self._lock:
+            self.milestones[name] = self.clock() - self.start
+
+    # Return True if the first frame took longer than the budget, or hasn't been shown.
+    def over_budget(self):
+        return self.milestones.get('first_frame', float('inf')) > self.budget_s
+
+    def return_stats(self):
+        with self._lock:
+            return {'phases': dict(self.phases),
+                    'milestones': dict(self.milestones),
+                    'budget_s': self.budget_s,
+                    'over_budget': self.over_budget()}
+
+    def return_report(self):
+        stats = self.return_stats()
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in stats['phases'].items())
+        milestones = ', '.join(f"{name} at {seconds:.2f}s" for name, seconds in stats['milestones'].items())
+
+        return f"Startup: {milestones} (budget {self.budget_s:.2f}s). Phases: {phases}"
+
+    # Add the phases and milestones to the metrics.
+    def register_metrics(self, registry):
+        for name, seconds in self.return_stats()['phases'].items():
+            registry.gauge(f"startup.{name}_s", lambda seconds=seconds: seconds)
+
+        for name, seconds in self.return_stats()['milestones'].items():
+            registry.gauge(f"startup.{name}_at_s", lambda seconds=seconds: seconds)
+
+
+# Starts the LCD in stages, so something is on the panel straight away. The panel driver is set up first and shows the
+# first frame from the last run, then the displays are imported, the fonts loaded and the display started on a
+# background thread while the clock runs. Once the clock's own first frame is shown it is saved for next time, and the
+# rest of the background images are decoded.
+class LcdStartup:
+    def __init__(self, clock_to_run, frame_cache_path=FRAME_CACHE_PATH, startup_timer=None, hat_class=None,
+                 **display_args):
+        self.clock = clock_to_run
+        self.frame_cache_path = frame_cache_path
+        self.timer = startup_timer if startup_timer is not None else StartupTimer()
+
+        # The Display HAT Mini driver class, can be replaced (e.g. by a stand in for timing without the hardware).
+        self.hat_class = hat_class
+        self.display_args = display_args
+
+        self.hat = None
+        self.lcd_display = None
+        self._first_frame_bytes = None
+        self._first_frame_shown = threading.Event()
+
+        # Set once everything has been loaded, or loading has failed.
+        self.ready = threading.Event()
+
+    # Set up the panel and show the cached first frame, if there is one. Returns True if it was shown.
+    def show_cached_frame(self):
+        phase_start = self.timer.clock()
+
+        if self.hat_class is None:
+            from displayhatmini import DisplayHATMini
+            self.hat_class = DisplayHATMini
+
+        # The buffer to draw from is given to the driver by the display once it is loaded.
+        self.hat = self.hat_class(None, backlight_pwm=True)
+        phase_start = self.timer.end_phase('driver', phase_start)
+
+        frame_bytes = self.load_frame_cache()
+
+        if frame_bytes is None:
+            return False
+
+        self.hat.st7789.set_window()
+        self.hat.st7789.data(frame_bytes)
+        self.timer.end_phase('cached_frame', phase_start)
+        self.timer.mark('cached_frame')
+
+        return True
+
+    # Return the cached frame, or None if there isn't one for this panel.
+    def load_frame_cache(self):
+        try:
+            with open(self.frame_cache_path, 'rb') as cache_file:
+                frame_bytes = cache_file.read()
+        except OSError:
+            return None
+
+        if len(frame_bytes) != self.hat_class.WIDTH * self.hat_class.HEIGHT * 2:
+            return None
+
+        return frame_bytes
+
+    # Replace the cached frame in one go, so a crash while writing can't leave half a frame.
+    def save_frame_cache(self, frame_bytes):
+        temp_path = f"{self.frame_cache_path}.tmp"
+
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(frame_bytes)
+
+        os.replace(temp_path, self.frame_cache_path)
+
+    # Load and start the display on a background thread.
+    def start(self):
+        threading.Thread(target=self.load, name='startup', daemon=True).start()
+
+    def load(self):
+        try:
+            self.load_display()
+        finally:
+            self.ready.set()
+
+    def load_display(self):
+        phase_start = self.timer.clock()
+
+        import display
+        phase_start = self.timer.end_phase('import_display', phase_start)
+
+        # The display reports how long its fonts, images, etc. take to load as stages.
+        load_stages = []
+        self.lcd_display = display.LcdDisplay(*self.clock.return_control_functions(),
+                                              on_stage=lambda stage, seconds: load_stages.append((stage, seconds)),
+                                              timebase=self.clock.timebase, hat=self.hat, preload_images=False,
+                                              **self.display_args)
+        self.lcd_display.on_stage = None
+
+        for stage, seconds in load_stages:
+            self.timer.add_phase(stage, seconds)
+        self.timer.add_phase('create_display',
+                             self.timer.clock() - phase_start - sum(seconds for stage, seconds in load_stages))
+
+        self.lcd_display.add_render_listener(self.on_render)
+        self.clock.lcd_display = self.lcd_display
+
+        # Made on the loading thread, so it would be a daemon like it - it keeps the clock running, as when the display
+        # is made on the main thread.
+        self.lcd_display.daemon = False
+        self.clock.add_display(self.lcd_display)
+
+        if not self._first_frame_shown.wait(FIRST_FRAME_TIMEOUT_S):
+            logger.warning(f"No first frame shown after {FIRST_FRAME_TIMEOUT_S:.0f}s, so it can't be saved")
+        phase_start = self.timer.clock()
+
+        if self._first_frame_bytes is not None:
+            try:
+                self.save_frame_cache(self._first_frame_bytes)
+            except OSError as error:
+                logger.warning(f"Can't save the first frame to {self.frame_cache_path}: {error}")
+        phase_start = self.timer.end_phase('save_frame_cache', phase_start)
+
+        self.lcd_display.image_manager.preload()
+        self.timer.end_phase('preload_images', phase_start)
+        self.timer.mark('ready')
+
+        self.timer.register_metrics(metrics.get_registry())
+
+        if self.timer.over_budget():
+            logger.warning(self.timer.return_report())
+        else:
+            logger.info(self.timer.return_report())
+
+    # On the display's first frame, keep it to save for next time. Called on the display's thread, before the next
+    # frame is drawn over it.
+    def on_render(self, rendered_display):
+        if self._first_frame_shown.is_set():
+            return
+
+        self.timer.mark('first_frame')
+        self._first_frame_bytes = rendered_display.return_panel_bytes()
+        self._first_frame_shown.set()
+
+
+# Tests
+if __name__ == '__main__':
+    import subprocess
+    import sys
+    import tempfile
+
+    import clock
+    import timers.history as history
+    from benchmarks.stubs import StubDisplayHATMini
+    from timers.test import Test
+
+    tests = []
+    font_path = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_path = os.path.join(temp_dir, os.path.basename(FRAME_CACHE_PATH))
+        runs = []
+
+        # The first start has no cached frame, the second shows the frame the first saved.
+        for run in range(2):
+            clock_to_run = clock.Clock(displays=[], history=history.SessionHistory(':memory:'))
+            lcd_startup = LcdStartup(clock_to_run, cache_path, StartupTimer(time.perf_counter(), budget_s=30.0),
+                                     StubDisplayHATMini, font_path=font_path)
+            cached_frame_shown = lcd_startup.show_cached_frame()
+            lcd_startup.start()
+            lcd_startup.ready.wait(30)
+
+            runs.append((cached_frame_shown, lcd_startup))
+
+        (first_cached, first_startup), (second_cached, second_startup) = runs
+
+        if not first_cached and second_cached and os.path.getsize(cache_path) == 320 * 240 * 2 and \
+                second_startup.hat.st7789.bytes_sent >= 2 * 320 * 240 * 2:
+            tests.append(Test(__file__, "Cached first frame", "passed"))
+        else:
+            tests.append(Test(__file__, "Cached first frame", "failed", f"{first_cached} {second_cached}"))
+
+        stats = second_startup.timer.return_stats()
+
+        if {'driver', 'cached_frame', 'import_display', 'load_fonts', 'load_images', 'create_display',
+                'preload_images'} <= set(stats['phases']) and \
+                stats['milestones']['cached_frame'] < stats['milestones']['first_frame'] <= \
+                stats['milestones']['ready'] and not stats['over_budget']:
+            tests.append(Test(__file__, "Startup phases", "passed", second_startup.timer.return_report()))
+        else:
+            tests.append(Test(__file__, "Startup phases", "failed", f"{stats}"))
+
+        if second_startup.lcd_display.image_manager.return_cache_stats()['frames'] + \
+                second_startup.lcd_display.image_manager.return_cache_stats()['mapped_frames'] >= 24:
+            tests.append(Test(__file__, "Images preloaded", "passed"))
+        else:
+            tests.append(Test(__file__, "Images preloaded", "failed",
+                              f"{second_startup.lcd_display.image_manager.return_cache_stats()}"))
+
+        # Started as the clock is, in a new process whose main thread ends once the display is ready - the display
+        # should keep it running.
+        child_code = """
+import sys
+import clock
+import startup
+import timers.history as history
+from benchmarks.stubs import StubDisplayHATMini
+
+clock_to_run = clock.Clock(displays=[], history=history.SessionHistory(':memory:'))
+lcd_startup = startup.LcdStartup(clock_to_run, sys.argv[1], None, StubDisplayHATMini, font_path=sys.argv[2])
+lcd_startup.show_cached_frame()
+lcd_startup.start()
+lcd_startup.ready.wait()
+print('ready', flush=True)
+"""
+        child = subprocess.Popen([sys.executable, '-c', child_code, cache_path, font_path],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True)
+        child_ready = None
+
+        for line in child.stdout:
+            if line.strip() == 'ready':
+                child_ready = 'ready'
+                break
+
+        try:
+            child.wait(2.0)
+        except subprocess.TimeoutExpired:
+            pass
+
+        if child_ready == 'ready' and child.poll() is None:
+            tests.append(Test(__file__, "Running after ready", "passed"))
+        else:
+            tests.append(Test(__file__, "Running after ready", "failed", f"{child_ready} {child.poll()}"))
+
+        child.kill()
+        child.wait()
+
+    for test in tests:
+        print(test.return_result())
+
+    # The LCD displays started by the tests run until the process ends.
+    sys.stdout.flush()
+    os._exit(0)
@@ -0,0 +1,408 @@
+import collections
+import contextlib
+import curses
+import os
+import selectors
+import sys
+
+import display
+import logsetup
+
+# Keys for the Display HAT Mini buttons - A changes mode, X pauses, B restarts and Y goes to the next timer.
+KEYS = {ord('a'): 'A', ord('b'): 'B', ord('x'): 'X', ord('y'): 'Y'}
+QUIT_KEYS = (ord('q'),)
+
+# Large digits for the countdown, five rows high.
+BLOCK = '█'
+BLOCK_GLYPHS = {'0': ('####', '#  #', '#  #', '#  #', '####'),
+                '1': ('  # ', ' ## ', '  # ', '  # ', ' ###'),
+                '2': ('####', '   #', '####', '#   ', '####'),
+                '3': ('####', '   #', ' ###', '   #', '####'),
+                '4': ('#  #', '#  #', '####', '   #', '   #'),
+                '5': ('####', '#   ', '####', '   #', '####'),
+                '6': ('####', '#   ', '####', '#  #', '####'),
+                '7': ('####', '   #', '  # ', ' #  ', ' #  '),
+                '8': ('####', '#  #', '####', '#  #', '####'),
+                '9': ('####', '#  #', '####', '   #', '####'),
+                ':': (' ', '#', ' ', '#', ' '),
+                '-': ('    ', '    ', '####', '    ', '    ')}
+BLOCK_HEIGHT = 5
+
+# Unchanged cells shorter than this between two changed ones are written again, rather than moving the cursor past them.
+MIN_SKIP_CELLS = 4
+
+# The colours a terminal is sure to have, as (curses colour, red, green, blue).
+TERMINAL_COLOURS = ((curses.COLOR_BLACK, 0, 0, 0), (curses.COLOR_RED, 1, 0, 0), (curses.COLOR_GREEN, 0, 1, 0),
+                    (curses.COLOR_YELLOW, 1, 1, 0), (curses.COLOR_BLUE, 0, 0, 1), (curses.COLOR_MAGENTA, 1, 0, 1),
+                    (curses.COLOR_CYAN, 0, 1, 1), (curses.COLOR_WHITE, 1, 1, 1))
+
+
+# Keeps the last text written to it (e.g. by print or a console log handler), to be written out later.
+class HeldOutput:
+    def __init__(self, max_writes=200):
+        self.writes = collections.deque(maxlen=max_writes)
+
+    def write(self, text):
+        self.writes.append(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def write_to(self, stream):
+        stream.write(''.join(self.writes))
+        stream.flush()
+        self.writes.clear()
+
+
+# Return the text in block digits, as one string per row.
+def block_text(text):
+    rows = []
+
+    for row in range(BLOCK_HEIGHT):
+        rows.append(' '.join(BLOCK_GLYPHS[char][row] for char in text).replace('#', BLOCK))
+
+    return rows
+
+
+# Return the curses colour nearest to a colour given as '#RRGGBB' or a name.
+def terminal_colour(colour):
+    if colour.startswith('#') and len(colour) == 7:
+        rgb = tuple(int(colour[index:index + 2], 16) >= 0x80 for index in (1, 3, 5))
+    else:
+        rgb = {'red': (1, 0, 0), 'green': (0, 1, 0), 'blue': (0, 0, 1), 'yellow': (1, 1, 0),
+               'black': (0, 0, 0)}.get(colour.lower(), (1, 1, 1))
+
+    for curses_colour, red, green, blue in TERMINAL_COLOURS:
+        if (red, green, blue) == rgb:
+            return curses_colour
+
+
+# Return the runs of cells that differ between two rows, as (column, text) - the text to write there.
+def changed_runs(old_row, new_row):
+    runs = []
+    run_start = None
+    last_changed = None
+
+    for column, char in enumerate(new_row):
+        if column < len(old_row) and old_row[column] == char:
+            continue
+
+        if run_start is not None and column - last_changed > MIN_SKIP_CELLS:
+            runs.append((run_start, new_row[run_start:last_changed + 1]))
+            run_start = None
+
+        if run_start is None:
+            run_start = column
+        last_changed = column
+
+    if run_start is not None:
+        runs.append((run_start, new_row[run_start:last_changed + 1]))
+
+    return runs
+
+
+# Display in a terminal with curses, e.g. over SSH or on a machine without the HAT. Shows the date, time, countdown in
+# block digits, and the timer name and description, as the LCD does. Each frame is laid out as rows of text, and only
+# the cells that changed since the last frame are written, so little is sent over a slow link. Keys a, b, x and y are
+# the A, B, X and Y buttons, and q quits.
+#
+# Curses can only be used from one thread, so the display thread both renders and reads the keys - it waits on the
+# keyboard and on data being published together.
+class TerminalDisplay(display.Display):
+    def __init__(self, toggle_pause_function, restart_function, next_function, timebase=None):
+        super().__init__(80, 24, toggle_pause_function, restart_function, next_function, list(KEYS.values()),
+                         timebase)
+        self.change_mode()
+
+        # Mapping to mode to keys and functions, as the LCD's buttons.
+        self.function_dict = {'clock': {'A': self.change_mode,
+                                        'X': self.toggle_pause_function,
+                                        'B': self.restart_function,
+                                        'Y': self.next_function},
+                              'pomodoro': {'A': self.change_mode,
+                                           'X': self.toggle_pause_function,
+                                           'B': self.restart_function,
+                                           'Y': self.next_function}}
+
+        self.screen = None
+        self._colour_pairs = {}
+
+        # The rows shown on the screen, as (text, colour). None until the screen has been drawn, or after it is
+        # cleared, so the whole frame is drawn.
+        self._shown_rows = None
+
+        # Written to when data is published, to wake the display thread from waiting on the keyboard. Never waits to
+        # write, as nothing reads it once the display has quit.
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_write, False)
+        self.current_data_slot.add_listener(self.wake)
+
+        self.running = True
+        self.cells_written = 0
+
+    def change_mode(self):
+        super().change_mode()
+
+    # Wake the display thread. If the pipe is full it is already due to wake.
+    def wake(self):
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            pass
+
+    # Quit, e.g. when the clock is stopped, as if q was pressed.
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    # Lay out the frame as rows of text with their colours, to fit the terminal.
+    def compose_frame(self):
+        timer_data = self.current_data.current_timer_data
+        width = self.width
+        blank = (' ' * width, 'white')
+
+        # Room below the screen for what doesn't fit on a small terminal, cut off at the end.
+        rows = [blank] * (self.height + BLOCK_HEIGHT + 8)
+
+        def centre(text):
+            return text[:width].center(width)
+
+        disp_date = self.current_data.current_datetime.strftime("%d-%m-%Y")
+        disp_time = self.current_data.current_datetime.strftime("%H:%M:%S")
+        rows[0] = ((disp_date + disp_time.rjust(width - len(disp_date)))[:width], 'white')
+
+        pomodoro_time_str = display.format_countdown(timer_data.remaining_timer_s)
+        countdown_rows = block_text(pomodoro_time_str)
+
+        # Plain text when the terminal is too small for block digits.
+        if self.height < BLOCK_HEIGHT + 6 or len(countdown_rows[0]) > width:
+            countdown_rows = [pomodoro_time_str]
+
+        top = max((self.height - len(countdown_rows) - 4) // 2, 2)
+
+        for index, countdown_row in enumerate(countdown_rows):
+            rows[top + index] = (centre(countdown_row), timer_data.timer_colour)
+
+        below = top + len(countdown_rows) + 1
+        rows[below] = (centre(timer_data.name), timer_data.timer_colour)
+        rows[below + 1] = (centre(timer_data.description), timer_data.timer_colour)
+
+        return rows[:self.height]
+
+    def update_display(self):
+        self.draw_frame(self.compose_frame())
+
+    # Write the cells that changed since the last frame. A row in a new colour is written whole.
+    def draw_frame(self, rows):
+        if self.screen is None:
+            return
+
+        for row_index, (text, colour) in enumerate(rows):
+            if self._shown_rows is None or self._shown_rows[row_index][1] != colour:
+                runs = [(0, text)]
+            else:
+                runs = changed_runs(self._shown_rows[row_index][0], text)
+
+            for column, run_text in runs:
+                self.screen.addstr(row_index, column, run_text, self.colour_attribute(colour))
+                self.cells_written += len(run_text)
+
+        self._shown_rows = rows
+        self.screen.refresh()
+
+    # Return the curses attribute for a colour, making a colour pair for it the first time.
+    def colour_attribute(self, colour):
+        if colour not in self._colour_pairs:
+            if not curses.has_colors():
+                self._colour_pairs[colour] = curses.A_BOLD
+            else:
+                pair_number = len(self._colour_pairs) + 1
+                curses.init_pair(pair_number, terminal_colour(colour), -1)
+                self._colour_pairs[colour] = curses.color_pair(pair_number) | curses.A_BOLD
+
+        return self._colour_pairs[colour]
+
+    # Fit the frame to the terminal, and draw it all again.
+    def resize(self):
+        height, width = self.screen.getmaxyx()
+
+        # The bottom right cell can't be written without scrolling, so it is left out.
+        self.height = height
+        self.width = width - 1
+        self.screen.clear()
+        self._shown_rows = None
+        self._rendered_key = None
+
+    # Return the function for a key in the current mode, or None if it isn't a button.
+    def action_for(self, key):
+        pin = KEYS.get(key)
+
+        if pin is None:
+            return None
+
+        return self.function_dict[self._curr_mode].get(pin)
+
+    # Run the key's function, and show the latest data again so a mode change is shown straight away.
+    def handle_key(self, key):
+        if key in QUIT_KEYS:
+            self.running = False
+            return
+
+        if key == curses.KEY_RESIZE:
+            self.resize()
+        else:
+            action = self.action_for(key)
+
+            if action is None:
+                return
+            action()
+
+        latest_data = self.current_data_slot.peek()
+        if latest_data is not None:
+            self.publish(latest_data)
+
+    def run_screen(self, screen):
+        self.screen = screen
+        curses.curs_set(0)
+        curses.use_default_colors()
+        screen.nodelay(True)
+        screen.keypad(True)
+        self.resize()
+
+        selector = selectors.DefaultSelector()
+        selector.register(sys.stdin, selectors.EVENT_READ)
+        selector.register(self._wake_read, selectors.EVENT_READ)
+
+        while self.running:
+            taken = self.current_data_slot.wait_for_new(timeout=0)
+            if taken is not None:
+                self.render(*taken)
+
+            for key, events in selector.select():
+                if key.fileobj == self._wake_read:
+                    os.read(self._wake_read, 4096)
+
+            key = screen.getch()
+            while key != -1 and self.running:
+                self.handle_key(key)
+                key = screen.getch()
+
+    # Anything else written to the terminal while curses is drawing on it (prints, console logging) would be left over
+    # the clock, as only changed cells are drawn again. So it is held until curses has finished, then written out.
+    @contextlib.contextmanager
+    def hold_output(self):
+        held_output = HeldOutput()
+
+        try:
+            with logsetup.redirect_console(held_output), contextlib.redirect_stdout(held_output), \
+                    contextlib.redirect_stderr(held_output):
+                yield held_output
+        finally:
+            held_output.write_to(sys.stdout)
+
+    def run(self):
+        with self.hold_output():
+            curses.wrapper(self.run_screen)
+
+
+# Tests
+if __name__ == '__main__':
+    import datetime
+    from timers.test import Test
+
+    tests = []
+    calls = []
+
+    # Stands in for the curses screen, keeping what is written where.
+    class FakeScreen:
+        def __init__(self, height, width):
+            self.cells = [[' '] * width for row in range(height)]
+            self.writes = []
+
+        def addstr(self, row, column, text, attribute):
+            self.writes.append((row, column, text))
+            self.cells[row][column:column + len(text)] = list(text)
+
+        def refresh(self):
+            pass
+
+    curses.has_colors = lambda: False
+
+    terminal_display = TerminalDisplay(lambda: calls.append('toggle_pause'), lambda: calls.append('restart'),
+                                       lambda: calls.append('next'))
+    terminal_display.width = 79
+    terminal_display.screen = FakeScreen(24, 79)
+
+    timer_info = display.TimerInfo('Work 1', 'Work', 25 * 60, '#FF0000', 'Work')
+    start = datetime.datetime(2026, 1, 1, 9, 0, 0)
+    terminal_display.render(display.CurrentData(start, display.CurrentTimerData(timer_info, 1500)), 0.0)
+    first_frame_cells = terminal_display.cells_written
+    shown = [''.join(row) for row in terminal_display.screen.cells]
+
+    if shown[0].startswith('01-01-2026') and shown[0].endswith('09:00:00') and \
+            BLOCK in ''.join(shown) and any('Work 1' in row for row in shown):
+        tests.append(Test(__file__, "Frame", "passed"))
+    else:
+        tests.append(Test(__file__, "Frame", "failed", '\n'.join(shown)))
+
+    # A second later only the seconds of the time and the last digit of the countdown change.
+    terminal_display.screen.writes = []
+    terminal_display.render(display.CurrentData(start + datetime.timedelta(seconds=1),
+                                                display.CurrentTimerData(timer_info, 1499)), 0.0)
+    second_frame_cells = terminal_display.cells_written - first_frame_cells
+    changed = [''.join(row) for row in terminal_display.screen.cells]
+
+    # Drawing the whole frame on a clear screen shows the same.
+    terminal_display.screen = FakeScreen(24, 79)
+    terminal_display._shown_rows = None
+    terminal_display.draw_frame(terminal_display.compose_frame())
+    redrawn = [''.join(row) for row in terminal_display.screen.cells]
+
+    if second_frame_cells < first_frame_cells / 20 and changed == redrawn:
+        tests.append(Test(__file__, "Only changed cells written", "passed",
+                          f"{first_frame_cells} then {second_frame_cells} cells"))
+    else:
+        tests.append(Test(__file__, "Only changed cells written", "failed",
+                          f"{first_frame_cells} then {second_frame_cells} cells"))
+
+    for key in (ord('x'), ord('y'), ord('b'), ord('z')):
+        terminal_display.handle_key(key)
+    terminal_display.handle_key(ord('a'))
+
+    if calls == ['toggle_pause', 'next', 'restart'] and terminal_display._curr_mode == 'pomodoro':
+        tests.append(Test(__file__, "Keys", "passed"))
+    else:
+        tests.append(Test(__file__, "Keys", "failed", f"{calls} {terminal_display._curr_mode}"))
+
+    # Printing and console logging while curses is running are held, and written out once it has finished.
+    import io
+    import logging
+
+    console = io.StringIO()
+    console_handler = logging.StreamHandler(sys.stdout)
+    logging.getLogger('raspidoroLogger').addHandler(console_handler)
+
+    with contextlib.redirect_stdout(console):
+        console_handler.setStream(sys.stdout)
+
+        with terminal_display.hold_output():
+            terminal_display.handle_key(ord('a'))
+            logging.getLogger('raspidoroLogger').warning("Warning while curses is running")
+            held = console.getvalue()
+
+    logging.getLogger('raspidoroLogger').removeHandler(console_handler)
+
+    if held == '' and 'Current mode' in console.getvalue() and 'Warning while curses' in console.getvalue() and \
+            console_handler.stream is console:
+        tests.append(Test(__file__, "Output held", "passed"))
+    else:
+        tests.append(Test(__file__, "Output held", "failed", f"{held!r} {console.getvalue()!r}"))
+
+    # Publishing never waits on the wake pipe, even once the display isn't reading it.
+    for wake in range(100000):
+        terminal_display.wake()
+    tests.append(Test(__file__, "Wake without reading", "passed"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,77 @@
+import datetime
+import heapq
+import threading
+import time
+
+
+# Where the clock, timers, buttons and displays get the time from. The real timebase is the system clocks. The
+# virtual one only moves when told to, so whole days of the clock can be run through the real code in a moment and
+# always give the same result.
+class RealTimebase:
+    # Monotonic seconds, for measuring intervals and deadlines.
+    def monotonic(self):
+        return time.monotonic()
+
+    # Wall clock seconds since the epoch.
+    def time(self):
+        return time.time()
+
+    # Local date and time, as shown on the displays.
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    # Run a callback on its own thread once delay seconds have passed.
+    def call_later(self, delay, callback):
+        timer = threading.Timer(max(delay, 0.0), callback)
+        timer.daemon = True
+        timer.start()
+
+
+REAL_TIMEBASE = RealTimebase()
+
+
+# Virtual time, starting at a given local date and time. Sleeping moves time on straight away, running any callbacks
+# scheduled in that time, in order, at the time they were scheduled for.
+class VirtualTimebase:
+    def __init__(self, start=datetime.datetime(2026, 1, 1, 9, 0, 0), monotonic_start=1000.0):
+        self._wall_start = start.timestamp()
+        self._monotonic_start = monotonic_start
+        self._monotonic = monotonic_start
+
+        # (monotonic time, order scheduled, callback)
+        self._scheduled = []
+        self._schedule_count = 0
+
+    def monotonic(self):
+        return self._monotonic
+
+    def time(self):
+        return self._wall_start + (self._monotonic - self._monotonic_start)
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+    # Move time on by the seconds, running the callbacks that are due on the way.
+    def sleep(self, seconds):
+        self.advance_to(self._monotonic + max(seconds, 0.0))
+
+    def advance_to(self, monotonic_time):
+        while self._scheduled and self._scheduled[0][0] <= monotonic_time:
+            due, order, callback = heapq.heappop(self._scheduled)
+            self._monotonic = max(self._monotonic, due)
+            callback()
+
+        self._monotonic = max(self._monotonic, monotonic_time)
+
+    # Run a callback once time has moved on by delay seconds. Callbacks due at the same time run in the order they
+    # were scheduled.
+    def call_later(self, delay, callback):
+        heapq.heappush(self._scheduled, (self._monotonic + delay, self._schedule_count, callback))
+        self._schedule_count += 1
+
+    # Return the monotonic time of the next scheduled callback, or None if there isn't one.
+    def next_scheduled(self):
+        return self._scheduled[0][0] if self._scheduled else None
@@ -0,0 +1,199 @@
+import heapq
+import time
+
+import timers.timer_seq as timer_seq
+
+# How long to wait before checking a timer again that wasn't complete when due, e.g. through rounding in the timer's
+# own count of whole seconds.
+RECHECK_DELAY_S = 1e-6
+
+
+# Runs the timer sequences of many tenants (e.g. everyone in a team) in one process. The timers are lazy, timing
+# themselves from the time source, so nothing is done for a timer while it counts down. The only change a timer makes
+# by itself is completing, so each tenant's running timer has an entry in a heap keyed by when it will complete, and a
+# tick only looks at the timers that are due - the cost of a tick doesn't depend on the number of tenants.
+class SequenceEngine:
+    def __init__(self, time_source=time.monotonic, speed=1, history=None, on_complete=None, auto_advance=False):
+        self.time_source = time_source
+        self.speed = speed
+        self.history = history
+
+        # Called with (tenant, timer) when a tenant's timer completes.
+        self.on_complete = on_complete
+
+        # Go straight to the next timer when one completes, rather than waiting for next_timer().
+        self.auto_advance = auto_advance
+
+        self.sequences = {}
+
+        # Heap of (completion time, order added, tenant, generation). A tenant's generation goes up whenever its timer
+        # changes, so entries for timers that have since been paused, restarted, etc. are skipped when they come up.
+        self._heap = []
+        self._generations = {}
+        self._push_count = 0
+
+        self.completed_count = 0
+        self.stale_count = 0
+
+    # Add a tenant with its own timer sequence, and start its first timer if asked to.
+    def add_sequence(self, tenant, start=False):
+        if tenant in self.sequences:
+            raise ValueError(f"Tenant {tenant} already has a timer sequence")
+
+        self.sequences[tenant] = timer_seq.TimerSequence(self.speed, self.time_source, self.history)
+        self._generations[tenant] = 0
+
+        if start:
+            self.sequences[tenant].current_timer.start()
+            self._schedule(tenant)
+
+        return self.sequences[tenant]
+
+    def remove_sequence(self, tenant):
+        del self.sequences[tenant]
+        del self._generations[tenant]
+
+    # Return the tenant's current timer.
+    def return_current_timer(self, tenant):
+        return self.sequences[tenant].current_timer
+
+    # Controls, as the buttons of a tenant's display.
+    def toggle_pause(self, tenant):
+        self.sequences[tenant].toggle_pause_current_timer()
+        self._schedule(tenant)
+
+    def restart(self, tenant):
+        self.sequences[tenant].restart_current_timer()
+        self._schedule(tenant)
+
+    def next_timer(self, tenant):
+        self.sequences[tenant].next_timer()
+        self._schedule(tenant)
+
+    # Replace the tenant's entry in the heap with one for when its timer will now complete, if it is running. Not before
+    # not_before, if given.
+    def _schedule(self, tenant, not_before=None):
+        generation = self._generations[tenant] + 1
+        self._generations[tenant] = generation
+
+        completion_time = self.sequences[tenant].current_timer.completion_time()
+
+        if completion_time is not None:
+            if not_before is not None:
+                completion_time = max(completion_time, not_before)
+
+            heapq.heappush(self._heap, (completion_time, self._push_count, tenant, generation))
+            self._push_count += 1
+
+    # Return the time of the next completion, or None if no timers are running. Lets the caller sleep until then.
+    def next_transition_time(self):
+        while self._heap and self._generations.get(self._heap[0][2]) != self._heap[0][3]:
+            heapq.heappop(self._heap)
+            self.stale_count += 1
+
+        return self._heap[0][0] if self._heap else None
+
+    # Handle the timers that have completed by now. Returns the number that completed.
+    def tick(self, now=None):
+        if now is None:
+            now = self.time_source()
+
+        completed = 0
+
+        while self._heap and self._heap[0][0] <= now:
+            due, order, tenant, generation = heapq.heappop(self._heap)
+
+            if self._generations.get(tenant) != generation:
+                self.stale_count += 1
+                continue
+
+            current_timer = self.sequences[tenant].current_timer
+
+            if current_timer.return_state() != 'complete':
+                # Not complete after all (e.g. the time source is behind now), so check again later.
+                self._schedule(tenant, now + RECHECK_DELAY_S)
+                continue
+
+            completed += 1
+
+            if self.on_complete is not None:
+                self.on_complete(tenant, current_timer)
+
+            if self.auto_advance:
+                self.next_timer(tenant)
+            else:
+                self._generations[tenant] += 1
+
+        self.completed_count += completed
+        return completed
+
+    # Return the number of tenants, running timers and heap entries waiting to be skipped.
+    def return_stats(self):
+        return {'sequences': len(self.sequences),
+                'heap_entries': len(self._heap),
+                'completed': self.completed_count,
+                'stale_skipped': self.stale_count}
+
+
+# Tests
+if __name__ == '__main__':
+    from timers.test import Test
+
+    tests = []
+
+    class FakeTime:
+        def __init__(self):
+            self.now = 0.0
+
+        def time_source(self):
+            return self.now
+
+    fake = FakeTime()
+    completions = []
+    engine = SequenceEngine(fake.time_source,
+                            on_complete=lambda tenant, timer: completions.append((tenant, timer.name)))
+
+    engine.add_sequence('alice', start=True)
+    fake.now = 100.0
+    engine.add_sequence('bob', start=True)
+
+    fake.now = 25 * 60 - 1
+    engine.tick()
+    completed_early = list(completions)
+
+    fake.now = 25 * 60
+    engine.tick()
+
+    if completed_early == [] and completions == [('alice', 'Work 1')] and engine.next_transition_time() > 25 * 60 + 99:
+        tests.append(Test(__file__, "Completes on time", "passed"))
+    else:
+        tests.append(Test(__file__, "Completes on time", "failed", f"{completions}"))
+
+    # Pausing bob for 50s moves his completion back by 50s.
+    engine.toggle_pause('bob')
+    fake.now += 50
+    engine.toggle_pause('bob')
+    fake.now = 25 * 60 + 100 + 49
+    engine.tick()
+    paused_completions = len(completions)
+    fake.now = 25 * 60 + 100 + 50
+    engine.tick()
+
+    if paused_completions == 1 and completions[-1] == ('bob', 'Work 1') and \
+            engine.return_current_timer('bob').overrun_time == 0:
+        tests.append(Test(__file__, "Pause moves completion", "passed"))
+    else:
+        tests.append(Test(__file__, "Pause moves completion", "failed", f"{completions}"))
+
+    # Going to the next timer schedules its completion, the old entry is skipped.
+    engine.next_timer('alice')
+    fake.now += 5 * 60
+    engine.tick()
+
+    if completions[-1] == ('alice', 'Break 1') and engine.return_stats()['heap_entries'] == 0:
+        tests.append(Test(__file__, "Next timer", "passed", f"{engine.return_stats()}"))
+    else:
+        tests.append(Test(__file__, "Next timer", "failed", f"{completions} {engine.return_stats()}"))
+
+    for test in tests:
+        print(test.return_result())
@@ -0,0 +1,232 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Events recorded for a timer. Complete and skip are recorded when the sequence moves on from the timer - complete
+# with the seconds it was overrun by, skip with the seconds it had left. Restart is recorded with the seconds lost.
+EVENTS = ('complete', 'skip', 'pause', 'resume', 'restart')
+
+# The database beside the clock, in the directory above this package, so it is found whatever directory the clock is
+# run from.
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'history.db')
+
+
+# Append only history of the timers used, in SQLite. The database is in WAL mode and events are written in batches, so
+# the SD card isn't written and synced for every event. Indexes cover the summary queries so they stay fast over years
+# of history.
+class SessionHistory:
+    def __init__(self, path=HISTORY_PATH, batch_size=50, flush_interval_s=300.0, clock=time.monotonic,
+                 wall_clock=time.time):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.clock = clock
+
+        # Events are timestamped from the wall clock, so they can be grouped by day and week.
+        self.wall_clock = wall_clock
+
+        # Events are recorded from the clock and button threads.
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = self.clock()
+        metrics.get_registry().gauge('history.pending_events', lambda: len(self._pending))
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS events ('
+                                     'id INTEGER PRIMARY KEY, '
+                                     'ts REAL NOT NULL, '
+                                     'day TEXT NOT NULL, '
+                                     'week TEXT NOT NULL, '
+                                     'event TEXT NOT NULL, '
+                                     'timer_name TEXT NOT NULL, '
+                                     'timer_type TEXT, '
+                                     'value INTEGER)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS events_by_day '
+                                     'ON events (event, timer_type, day, value)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS events_by_week '
+                                     'ON events (event, timer_type, week)')
+
+    # Record an event for a timer. The event is written with the next batch.
+    def record(self, event, timer, value=None, timestamp=None):
+        if event not in EVENTS:
+            raise ValueError(f"Unrecognised history event {event}")
+
+        if timestamp is None:
+            timestamp = self.wall_clock()
+
+        local_time = datetime.datetime.fromtimestamp(timestamp)
+        iso_year, iso_week, iso_day = local_time.isocalendar()
+
+        with self._lock:
+            self._pending.append((timestamp, local_time.strftime('%Y-%m-%d'), f"{iso_year}-W{iso_week:02}", event,
+                                  timer.name, timer.return_type(), value))
+
+            if len(self._pending) >= self.batch_size or self.clock() - self._last_flush >= self.flush_interval_s:
+                self._flush()
+
+    # Write any pending events in one transaction.
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    # Write any pending events if the flush interval has passed since the last write. Called regularly (e.g. on each
+    # tick), so events are written within the interval even when no more are recorded.
+    def flush_if_due(self):
+        with self._lock:
+            if self._pending and self.clock() - self._last_flush >= self.flush_interval_s:
+                self._flush()
+
+    def _flush(self):
+        # Events recorded after closing (e.g. by the clock while the process ends) aren't written.
+        if self._pending and self._connection is not None:
+            with self._connection:
+                self._connection.executemany('INSERT INTO events (ts, day, week, event, timer_name, timer_type, value) '
+                                             'VALUES (?, ?, ?, ?, ?, ?, ?)', self._pending)
+            self._pending = []
+
+        self._last_flush = self.clock()
+
+    # Run a query, after writing pending events so they are included.
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            self._flush()
+            return self._connection.execute(sql, parameters).fetchall()
+
+    # Return [(day, count)] of completed work timers (pomodoros) per day, for days from start_day to end_day
+    # ('YYYY-MM-DD', inclusive).
+    def pomodoros_per_day(self, start_day='0000-00-00', end_day='9999-99-99'):
+        return self._query("SELECT day, COUNT(*) FROM events "
+                           "WHERE event = 'complete' AND timer_type = 'Work' AND day BETWEEN ? AND ? "
+                           "GROUP BY day ORDER BY day", (start_day, end_day))
+
+    # Return [(week, count)] of completed work timers per ISO week ('YYYY-Www').
+    def pomodoros_per_week(self, start_week='0000-W00', end_week='9999-W99'):
+        return self._query("SELECT week, COUNT(*) FROM events "
+                           "WHERE event = 'complete' AND timer_type = 'Work' AND week BETWEEN ? AND ? "
+                           "GROUP BY week ORDER BY week", (start_week, end_week))
+
+    # Return the average seconds completed timers were overrun by, optionally for one type of timer.
+    def average_overrun(self, timer_type=None, start_day='0000-00-00', end_day='9999-99-99'):
+        if timer_type is None:
+            rows = self._query("SELECT AVG(value) FROM events "
+                               "WHERE event = 'complete' AND day BETWEEN ? AND ?", (start_day, end_day))
+        else:
+            rows = self._query("SELECT AVG(value) FROM events "
+                               "WHERE event = 'complete' AND timer_type = ? AND day BETWEEN ? AND ?",
+                               (timer_type, start_day, end_day))
+
+        return rows[0][0] if rows[0][0] is not None else 0.0
+
+    # Return {timer name: {event: count}} for days from start_day to end_day.
+    def event_counts_per_timer(self, start_day='0000-00-00', end_day='9999-99-99'):
+        counts = {}
+
+        for timer_name, event, count in self._query("SELECT timer_name, event, COUNT(*) FROM events "
+                                                    "WHERE day BETWEEN ? AND ? GROUP BY timer_name, event",
+                                                    (start_day, end_day)):
+            counts.setdefault(timer_name, {})[event] = count
+
+        return counts
+
+    # Write pending events and close the database. Can be called again, once closed.
+    def close(self):
+        with self._lock:
+            self._flush()
+
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Tests
+if __name__ == '__main__':
+    import tempfile
+    from timers.test import Test
+    import timers.timer as timer
+
+    tests = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = SessionHistory(os.path.join(temp_dir, 'history.db'), batch_size=1000)
+        work = timer.WorkTimer('Work 1', 'Work', 25 * 60)
+        rest = timer.BreakTimer('Break 1', 'Break', 5 * 60)
+
+        day1 = datetime.datetime(2026, 3, 2, 9, 0).timestamp()
+        day2 = datetime.datetime(2026, 3, 3, 9, 0).timestamp()
+
+        history.record('complete', work, 30, day1)
+        history.record('complete', rest, 0, day1)
+        history.record('complete', work, 90, day1)
+        history.record('pause', work, None, day2)
+        history.record('complete', work, 0, day2)
+        history.record('skip', rest, 120, day2)
+
+        # Nothing written until the batch is full, or a query needs it.
+        written = history._connection.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+        if written == 0:
+            tests.append(Test(__file__, "Batched writes", "passed"))
+        else:
+            tests.append(Test(__file__, "Batched writes", "failed", f"{written} events written"))
+
+        if history.pomodoros_per_day() == [('2026-03-02', 2), ('2026-03-03', 1)]:
+            tests.append(Test(__file__, "Pomodoros per day", "passed"))
+        else:
+            tests.append(Test(__file__, "Pomodoros per day", "failed", f"{history.pomodoros_per_day()}"))
+
+        if history.pomodoros_per_week() == [('2026-W10', 3)]:
+            tests.append(Test(__file__, "Pomodoros per week", "passed"))
+        else:
+            tests.append(Test(__file__, "Pomodoros per week", "failed", f"{history.pomodoros_per_week()}"))
+
+        if history.average_overrun('Work') == 40 and history.average_overrun() == 30:
+            tests.append(Test(__file__, "Average overrun", "passed"))
+        else:
+            tests.append(Test(__file__, "Average overrun", "failed", f"{history.average_overrun('Work')}"))
+
+        if history.event_counts_per_timer()['Work 1'] == {'complete': 3, 'pause': 1}:
+            tests.append(Test(__file__, "Events per timer", "passed"))
+        else:
+            tests.append(Test(__file__, "Events per timer", "failed", f"{history.event_counts_per_timer()}"))
+
+        # Pending events are written once the flush interval has passed, without another event being recorded.
+        now = [0.0]
+        timed_history = SessionHistory(os.path.join(temp_dir, 'timed.db'), flush_interval_s=300.0,
+                                       clock=lambda: now[0])
+        timed_history.record('complete', work, 0, day1)
+        now[0] = 299.0
+        timed_history.flush_if_due()
+        before_interval = timed_history._connection.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+        now[0] = 300.0
+        timed_history.flush_if_due()
+        after_interval = timed_history._connection.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+        if (before_interval, after_interval) == (0, 1):
+            tests.append(Test(__file__, "Flush interval", "passed"))
+        else:
+            tests.append(Test(__file__, "Flush interval", "failed", f"{before_interval} {after_interval}"))
+
+        # Closing writes the pending events, and can be done more than once.
+        timed_history.record('skip', rest, 60, day2)
+        timed_history.close()
+        timed_history.close()
+        timed_history = SessionHistory(os.path.join(temp_dir, 'timed.db'))
+
+        if timed_history.event_counts_per_timer() == {'Work 1': {'complete': 1}, 'Break 1': {'skip': 1}}:
+            tests.append(Test(__file__, "Written on close", "passed"))
+        else:
+            tests.append(Test(__file__, "Written on close", "failed", f"{timed_history.event_counts_per_timer()}"))
+
+        timed_history.close()
+        history.close()
+
+    for test in tests:
+        print(test.return_result())
@@ -1,232 +1,465 @@
-#!/usr/bin/env python3
-from __future__ import annotations
-from timers.test import Test
-
-from abc import ABC
-
-
-# Timer Factory creates timers as requested.
-class TimerFactory:
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def get_timer(timer_type, name, description, length_sec) -> Timer:
-        if timer_type == 'Work':
-            return WorkTimer(name, description, length_sec)
-        elif timer_type == 'Break':
-            return BreakTimer(name, description, length_sec)
-
-        else:
-            print("Unrecognised timer type")
-
-
-# Abstract Timer class for dealing with an individual timer.
-class Timer(ABC):
-    def __init__(self, name, description, length_sec: int):
-
-        # Make sure name isn't blank.
-        if len(name) > 0:
-            self.name = name
-        else:
-            raise ValueError(f"Name can't be blank name={name}")
-
-        # Make sure timer is more than 0 sec.
-        if length_sec > 0:
-            self.length_sec = length_sec
-        else:
-            raise ValueError(f"Timer length must be greater than 0 seconds length ={length_sec}")
-
-        # Description can be anything, including blank.
-        self.description = description
-        self.time_remaining = self.length_sec
-
-        # start off with paused state.
-        self._state = "paused"
-        self.type = None
-        self.colour = '#000000'
-
-        # keep track of the overrun of a given timer.
-        self.overrun_time = 0
-
-    # Start or unpause.
-    def start(self):
-        self._state = 'running'
-
-    # Change state to be paused or un-paused. Might already be paused.
-    def toggle_pause(self):
-        print(f"state {self._state}")
-        if self._state == 'paused':
-            self._state = 'running'
-        elif self._state == 'running':
-            self._state = 'paused'
-        elif self._state == 'complete':
-            self._state = 'paused'
-        else:
-            raise ValueError
-
-    # Restart the timer - this cancels any time spent. Goes immediately to running, not paused.
-    # Overrun time is also reset as the timer should be ready for another use.
-    def restart(self):
-        self._state = 'running'
-        self.time_remaining = self.length_sec
-        self.overrun_time = 0
-
-    # Complete the timer, by setting state to complete and remaining time to 0.
-    def complete(self):
-        self._state = 'complete'
-        self.time_remaining = 0
-        # self.overrun_time = 0
-
-    # Decrement the timer by 1s, note that this might be faster than real time for testing purposes.
-    def decrement_time(self):
-        if self._state == 'running':
-            self.time_remaining -= 1  # Subtract one second from the remaining.
-
-            # Mark timer as complete if counts down to zero.
-            if self.time_remaining == 0:
-                self.complete()
-        # Keep counting even if complete - useful to know how much the timer has been overrun.
-        elif self._state == 'complete':
-            self.overrun_time -= 1
-        else:
-            pass  # Don't decrement if paused.
-            # print(f"Not decrementing as state is {self._state}")
-
-    # Print the current state of the timer
-    def return_state_str(self):
-        return f"timer name: {self.name} state: {self._state} remaining: {self.time_remaining} "\
-               f"overrun: {self.overrun_time}"
-
-    # Return the timer type
-    def return_type(self):
-        return self.type
-
-    # Return the timer's colour.
-    def return_colour(self):
-        return self.colour
-
-
-# Concrete Work Timer Class.
-class WorkTimer(Timer):
-    def __init__(self, name, description, length_sec: int):
-        super().__init__(name, description, length_sec)
-        self.type = 'Work'
-        self.colour = '#FF0000'
-
-
-# Concrete Break Timer Class.
-class BreakTimer(Timer):
-    def __init__(self, name, description, length_sec: int):
-        super().__init__(name, description, length_sec)
-        self.type = 'Break'
-        self.colour = '#00FF00'
-
-
-# Tests
-if __name__ == '__main__':
-
-    tests = []
-
-    work1 = WorkTimer("work1", 'work 1 timers', 25*60)
-
-    # cont equivalent of 30 minutes. Should not decrement as timer is paused.
-    for i in range(30*60):
-        work1.decrement_time()
-
-    if work1.time_remaining == 25 * 60:
-        tests.append(Test("Paused", "passed"))
-    else:
-        tests.append(Test("Paused", "failed"))
-
-    # Change state to running and try again.
-    work1.start()
-
-    # Cont equivalent of 30 minutes. Should not decrement as timer is paused.
-    for i in range(30*60):
-        work1.decrement_time()
-
-    if work1.overrun_time == -5*60:
-        tests.append(Test("Over-run timer", "passed"))
-    else:
-        tests.append(Test("Over-run timer", "failed",
-                          "failed test, should be 5*60, but is {work1.overrun_time}"))
-
-    break1 = BreakTimer('break1', 'break timer', 5*60)
-    print(break1.return_state_str())
-
-    # Change state to running and try again.
-    break1.start()
-
-    # Cont equivalent of 3 minutes.
-    for i in range(3 * 60):
-        break1.decrement_time()
-
-    # restart the timer.
-    break1.restart()
-    if break1.time_remaining == 5 * 60:
-        tests.append(Test("restart", "passed"))
-    else:
-        tests.append(Test("restart", "failed",
-                          f"failed test, should be 5*60, but is {break1.time_remaining}"))
-
-    for i in range(6 * 60):
-        break1.decrement_time()
-
-    if break1.overrun_time == -1 * 60:
-        tests.append(Test("restart", "passed"))
-    else:
-        tests.append(Test("restart", "failed",
-                          f"failed test, should be -1*60, but is {break1.overrun_time}"))
-
-    result_str = f"{work1.return_colour()}, {break1.return_colour()}, {work1.return_type()}, {break1.return_type()}"
-
-    if result_str == 'FF0000, 00FF00, Work, Break':
-        tests.append(Test("colour", "passed"))
-    else:
-        tests.append(Test("colour", "failed"))
-
-    try:
-        faulty_work = Timer("", "", 300)
-    except ValueError:
-        tests.append(Test("exception", "passed"))
-    else:
-        tests.append(Test("exception", "failed", "should have excepted"))
-
-    try:
-        faulty_work = Timer("except", "", 0)
-    except ValueError:
-        tests.append(Test("exception", "passed"))
-    else:
-        tests.append(Test("exception", "failed", "should have excepted"))
-
-    timer_factory = TimerFactory()
-
-    timer1 = timer_factory.get_timer("Work", "Work from Factory", "work timer", 120)
-    timer2 = timer_factory.get_timer("Break", "Break from Factory", "break timer", 120)
-    print(timer1)
-    print(timer2)
-
-    timer1.start()
-    for i in range(125):
-        timer1.decrement_time()
-
-    if timer1.return_state_str() == 'timer name: Work from Factory state: complete remaining: 0 overrun: -5':
-        tests.append(Test("Factory Work", "passed"))
-    else:
-        tests.append(Test("Factory Work", "failed"))
-
-    print(timer1.return_state_str())
-
-    timer2.start()
-    for i in range(100):
-        timer2.decrement_time()
-
-    print(timer2.return_state_str())
-    if timer2.return_state_str() == 'timer name: Break from Factory state: running remaining: 20 overrun: 0':
-        tests.append(Test("Factory Break", "passed"))
-    else:
-        tests.append(Test("Factory Break", "failed"))
-
-    for i in range(len(tests)):
-        print(tests[i].return_result())
+#!/usr/bin/env python3
+from __future__ import annotations
+from timers.test import Test
+
+from abc import ABC
+
+# Colours the timers are shown in.
+WORK_COLOUR = '#FF0000'
+BREAK_COLOUR = '#00FF00'
+TIMER_COLOURS = [WORK_COLOUR, BREAK_COLOUR]
+
+
+# Timer Factory creates timers as requested.
+class TimerFactory:
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def get_timer(timer_type, name, description, length_sec) -> Timer:
+        if timer_type == 'Work':
+            return WorkTimer(name, description, length_sec)
+        elif timer_type == 'Break':
+            return BreakTimer(name, description, length_sec)
+
+        else:
+            print("Unrecognised timer type")
+
+
+# Abstract Timer class for dealing with an individual timer.
+class Timer(ABC):
+    def __init__(self, name, description, length_sec: int):
+
+        # Make sure name isn't blank.
+        if len(name) > 0:
+            self.name = name
+        else:
+            raise ValueError(f"Name can't be blank name={name}")
+
+        # Make sure timer is more than 0 sec.
+        if length_sec > 0:
+            self.length_sec = length_sec
+        else:
+            raise ValueError(f"Timer length must be greater than 0 seconds length ={length_sec}")
+
+        # Description can be anything, including blank.
+        self.description = description
+        self._time_remaining = self.length_sec
+
+        # start off with paused state.
+        self._state = "paused"
+        self.type = None
+        self.colour = '#000000'
+
+        # keep track of the overrun of a given timer.
+        self._overrun_time = 0
+
+        # Lazy mode - when a time source is set, the timer isn't decremented. Instead it keeps the time it started
+        # counting (running or complete) and how many seconds of that have been applied, and works out the remaining
+        # and overrun time when they are read. Time spent paused is never counted, so a paused timer costs nothing.
+        self._time_source = None
+        self._speed = 1
+        self._count_start = None
+        self._counted_sec = 0
+
+        # The part of a second counted before the timer was paused, counted again when it is resumed.
+        self._uncounted_s = 0.0
+
+    # Remaining time, brought up to date first if the timer is lazy.
+    @property
+    def time_remaining(self):
+        self._settle()
+        return self._time_remaining
+
+    @time_remaining.setter
+    def time_remaining(self, value):
+        self._settle()
+        self._time_remaining = value
+
+    # Overrun time (zero or negative), brought up to date first if the timer is lazy.
+    @property
+    def overrun_time(self):
+        self._settle()
+        return self._overrun_time
+
+    @overrun_time.setter
+    def overrun_time(self, value):
+        self._settle()
+        self._overrun_time = value
+
+    # Switch the timer to lazy mode, timing itself from time_source (e.g. time.monotonic) rather than being
+    # decremented. Speed allows faster than real time for testing/demo purposes.
+    def set_time_source(self, time_source, speed=1):
+        self._settle()
+        self._time_source = time_source
+        self._speed = speed
+        self._count_start = None
+        self._uncounted_s = 0.0
+        self._update_counting()
+
+    # Return True if the timer times itself rather than being decremented.
+    def is_lazy(self):
+        return self._time_source is not None
+
+    # Apply any whole seconds that have passed since the timer started counting. Does nothing if not lazy or paused.
+    def _settle(self):
+        if self._count_start is None:
+            return
+
+        counted_sec = int((self._time_source() - self._count_start) * self._speed)
+        if counted_sec > self._counted_sec:
+            seconds = counted_sec - self._counted_sec
+            self._counted_sec = counted_sec
+            self.advance(seconds)
+
+    # Return the time, from the time source, that a running lazy timer will count down to zero and complete, or None
+    # if it won't complete by itself (not lazy, paused, complete or already counted below zero).
+    def completion_time(self):
+        self._settle()
+
+        if self._count_start is None or self._state != 'running' or self._time_remaining <= 0:
+            return None
+
+        return self._count_start + (self._counted_sec + self._time_remaining) / self._speed
+
+    # Start or stop counting from the time source to match the state. Running and complete both count.
+    def _update_counting(self):
+        if self._time_source is None:
+            return
+
+        if self._state == 'paused':
+            if self._count_start is not None:
+                self._uncounted_s = self._time_source() - self._count_start - self._counted_sec / self._speed
+            self._count_start = None
+        elif self._count_start is None:
+            # Carry on from the part of a second counted before pausing, as a decremented timer would.
+            self._count_start = self._time_source() - self._uncounted_s
+            self._counted_sec = 0
+            self._uncounted_s = 0.0
+
+    # Start or unpause.
+    def start(self):
+        self._settle()
+        self._state = 'running'
+        self._update_counting()
+
+    # Change state to be paused or un-paused. Might already be paused.
+    def toggle_pause(self):
+        self._settle()
+        print(f"state {self._state}")
+        if self._state == 'paused':
+            self._state = 'running'
+        elif self._state == 'running':
+            self._state = 'paused'
+        elif self._state == 'complete':
+            self._state = 'paused'
+        else:
+            raise ValueError
+        self._update_counting()
+
+    # Restart the timer - this cancels any time spent. Goes immediately to running, not paused.
+    # Overrun time is also reset as the timer should be ready for another use.
+    def restart(self):
+        self._state = 'running'
+        self._time_remaining = self.length_sec
+        self._overrun_time = 0
+        self._count_start = None
+        self._uncounted_s = 0.0
+        self._update_counting()
+
+    # Complete the timer, by setting state to complete and remaining time to 0.
+    def complete(self):
+        self._state = 'complete'
+        self._time_remaining = 0
+        # self._overrun_time = 0
+        self._update_counting()
+
+    # Decrement the timer by 1s, note that this might be faster than real time for testing purposes.
+    def decrement_time(self):
+        if self._state == 'running':
+            self._time_remaining -= 1  # Subtract one second from the remaining.
+
+            # Mark timer as complete if counts down to zero.
+            if self._time_remaining == 0:
+                self.complete()
+        # Keep counting even if complete - useful to know how much the timer has been overrun.
+        elif self._state == 'complete':
+            self._overrun_time -= 1
+        else:
+            pass  # Don't decrement if paused.
+            # print(f"Not decrementing as state is {self._state}")
+
+    # Advance the timer by a number of seconds in one step. Gives the same result as calling decrement_time() that many
+    # times, including the move from running to complete and into overrun, but takes the same time for any number.
+    def advance(self, seconds: int):
+        if seconds <= 0:
+            return
+
+        if self._state == 'running':
+            # decrement_time() only completes the timer when it reaches exactly zero, so a running timer that is
+            # already at or below zero (e.g. un-paused after completing) just keeps counting down.
+            if 0 < self._time_remaining <= seconds:
+                seconds -= self._time_remaining
+                self.complete()
+                self._overrun_time -= seconds
+            else:
+                self._time_remaining -= seconds
+        elif self._state == 'complete':
+            self._overrun_time -= seconds
+        else:
+            pass  # Don't decrement if paused.
+
+    # Print the current state of the timer
+    def return_state_str(self):
+        self._settle()
+        return f"timer name: {self.name} state: {self._state} remaining: {self.time_remaining} "\
+               f"overrun: {self.overrun_time}"
+
+    # Return the timer state - paused, running or complete.
+    def return_state(self):
+        self._settle()
+        return self._state
+
+    # Return the timer type
+    def return_type(self):
+        return self.type
+
+    # Return the timer's colour.
+    def return_colour(self):
+        return self.colour
+
+
+# Concrete Work Timer Class.
+class WorkTimer(Timer):
+    def __init__(self, name, description, length_sec: int):
+        super().__init__(name, description, length_sec)
+        self.type = 'Work'
+        self.colour = WORK_COLOUR
+
+
+# Concrete Break Timer Class.
+class BreakTimer(Timer):
+    def __init__(self, name, description, length_sec: int):
+        super().__init__(name, description, length_sec)
+        self.type = 'Break'
+        self.colour = BREAK_COLOUR
+
+
+# Tests
+if __name__ == '__main__':
+
+    tests = []
+
+    work1 = WorkTimer("work1", 'work 1 timers', 25*60)
+
+    # cont equivalent of 30 minutes. Should not decrement as timer is paused.
+    for i in range(30*60):
+        work1.decrement_time()
+
+    if work1.time_remaining == 25 * 60:
+        tests.append(Test(__file__, "Paused", "passed"))
+    else:
+        tests.append(Test(__file__, "Paused", "failed"))
+
+    # Change state to running and try again.
+    work1.start()
+
+    # Cont equivalent of 30 minutes. Should not decrement as timer is paused.
+    for i in range(30*60):
+        work1.decrement_time()
+
+    if work1.overrun_time == -5*60:
+        tests.append(Test(__file__, "Over-run timer", "passed"))
+    else:
+        tests.append(Test(__file__, "Over-run timer", "failed",
+                          "failed test, should be 5*60, but is {work1.overrun_time}"))
+
+    break1 = BreakTimer('break1', 'break timer', 5*60)
+    print(break1.return_state_str())
+
+    # Change state to running and try again.
+    break1.start()
+
+    # Cont equivalent of 3 minutes.
+    for i in range(3 * 60):
+        break1.decrement_time()
+
+    # restart the timer.
+    break1.restart()
+    if break1.time_remaining == 5 * 60:
+        tests.append(Test(__file__, "restart", "passed"))
+    else:
+        tests.append(Test(__file__, "restart", "failed",
+                          f"failed test, should be 5*60, but is {break1.time_remaining}"))
+
+    for i in range(6 * 60):
+        break1.decrement_time()
+
+    if break1.overrun_time == -1 * 60:
+        tests.append(Test(__file__, "restart", "passed"))
+    else:
+        tests.append(Test(__file__, "restart", "failed",
+                          f"failed test, should be -1*60, but is {break1.overrun_time}"))
+
+    result_str = f"{work1.return_colour()}, {break1.return_colour()}, {work1.return_type()}, {break1.return_type()}"
+
+    if result_str == 'FF0000, 00FF00, Work, Break':
+        tests.append(Test(__file__, "colour", "passed"))
+    else:
+        tests.append(Test(__file__, "colour", "failed"))
+
+    try:
+        faulty_work = Timer("", "", 300)
+    except ValueError:
+        tests.append(Test(__file__, "exception", "passed"))
+    else:
+        tests.append(Test(__file__, "exception", "failed", "should have excepted"))
+
+    try:
+        faulty_work = Timer("except", "", 0)
+    except ValueError:
+        tests.append(Test(__file__, "exception", "passed"))
+    else:
+        tests.append(Test(__file__, "exception", "failed", "should have excepted"))
+
+    timer_factory = TimerFactory()
+
+    timer1 = timer_factory.get_timer("Work", "Work from Factory", "work timer", 120)
+    timer2 = timer_factory.get_timer("Break", "Break from Factory", "break timer", 120)
+    print(timer1)
+    print(timer2)
+
+    timer1.start()
+    for i in range(125):
+        timer1.decrement_time()
+
+    if timer1.return_state_str() == 'timer name: Work from Factory state: complete remaining: 0 overrun: -5':
+        tests.append(Test(__file__, "Factory Work", "passed"))
+    else:
+        tests.append(Test(__file__, "Factory Work", "failed"))
+
+    print(timer1.return_state_str())
+
+    timer2.start()
+    for i in range(100):
+        timer2.decrement_time()
+
+    print(timer2.return_state_str())
+    if timer2.return_state_str() == 'timer name: Break from Factory state: running remaining: 20 overrun: 0':
+        tests.append(Test(__file__, "Factory Break", "passed"))
+    else:
+        tests.append(Test(__file__, "Factory Break", "failed"))
+
+    # Bulk advancement must match the one second at a time decrement, in every state.
+    for steps in [[1], [60, 59, 1], [1499, 1, 1], [1500], [1501], [2000, 7], [3 * 60, 20 * 60, 10 * 60]]:
+        stepped = WorkTimer("stepped", "stepped", 25 * 60)
+        advanced = WorkTimer("advanced", "advanced", 25 * 60)
+        stepped.start()
+        advanced.start()
+
+        for step in steps:
+            for i in range(step):
+                stepped.decrement_time()
+            advanced.advance(step)
+
+        if (stepped.time_remaining, stepped.overrun_time, stepped._state) == \
+                (advanced.time_remaining, advanced.overrun_time, advanced._state):
+            tests.append(Test(__file__, f"Advance {steps}", "passed"))
+        else:
+            tests.append(Test(__file__, f"Advance {steps}", "failed",
+                              f"{stepped.return_state_str()} vs {advanced.return_state_str()}"))
+
+    # Paused, and un-paused after completion.
+    stepped = BreakTimer("stepped", "stepped", 60)
+    advanced = BreakTimer("advanced", "advanced", 60)
+    for timer in [stepped, advanced]:
+        timer.start()
+    for i in range(70):
+        stepped.decrement_time()
+    advanced.advance(70)
+    for timer in [stepped, advanced]:
+        timer.toggle_pause()
+    for i in range(10):
+        stepped.decrement_time()
+    advanced.advance(10)
+    for timer in [stepped, advanced]:
+        timer.toggle_pause()
+    for i in range(10):
+        stepped.decrement_time()
+    advanced.advance(10)
+
+    if (stepped.time_remaining, stepped.overrun_time, stepped._state) == \
+            (advanced.time_remaining, advanced.overrun_time, advanced._state):
+        tests.append(Test(__file__, "Advance paused", "passed"))
+    else:
+        tests.append(Test(__file__, "Advance paused", "failed",
+                          f"{stepped.return_state_str()} vs {advanced.return_state_str()}"))
+
+    # Lazy timer driven from a fake time source, should match the decremented timer.
+    class FakeTime:
+        def __init__(self):
+            self.now = 1000.0
+
+        def time_source(self):
+            return self.now
+
+    fake_time = FakeTime()
+    stepped = WorkTimer("stepped", "stepped", 25 * 60)
+    lazy = WorkTimer("lazy", "lazy", 25 * 60)
+    lazy.set_time_source(fake_time.time_source)
+
+    for timer in [stepped, lazy]:
+        timer.start()
+    for i in range(20 * 60):
+        stepped.decrement_time()
+    fake_time.now += 20 * 60 + 0.5
+
+    # Paused for an hour, which shouldn't count.
+    for timer in [stepped, lazy]:
+        timer.toggle_pause()
+    fake_time.now += 60 * 60
+    for timer in [stepped, lazy]:
+        timer.toggle_pause()
+
+    for i in range(7 * 60):
+        stepped.decrement_time()
+    fake_time.now += 7 * 60
+
+    if (stepped.time_remaining, stepped.overrun_time) == (lazy.time_remaining, lazy.overrun_time) and \
+            lazy.return_state_str().endswith('state: complete remaining: 0 overrun: -120'):
+        tests.append(Test(__file__, "Lazy timer", "passed"))
+    else:
+        tests.append(Test(__file__, "Lazy timer", "failed",
+                          f"{stepped.return_state_str()} vs {lazy.return_state_str()}"))
+
+    # Lazy timer at 10x speed.
+    lazy = BreakTimer("lazy", "lazy", 5 * 60)
+    lazy.set_time_source(fake_time.time_source, speed=10)
+    lazy.start()
+    fake_time.now += 31
+
+    if lazy.return_state_str().endswith('state: complete remaining: 0 overrun: -10'):
+        tests.append(Test(__file__, "Lazy timer speed", "passed"))
+    else:
+        tests.append(Test(__file__, "Lazy timer speed", "failed", lazy.return_state_str()))
+
+    # The part of a second counted before each pause isn't lost - ten pauses 0.6s into a second, each followed by 0.4s
+    # more running, count ten seconds.
+    lazy = WorkTimer("lazy", "lazy", 25 * 60)
+    lazy.set_time_source(fake_time.time_source)
+    lazy.start()
+
+    for pause in range(10):
+        fake_time.now += 0.6
+        lazy.toggle_pause()
+        fake_time.now += 30
+        lazy.toggle_pause()
+        fake_time.now += 0.4
+
+    if lazy.time_remaining == 25 * 60 - 10:
+        tests.append(Test(__file__, "Lazy timer paused part way through a second", "passed"))
+    else:
+        tests.append(Test(__file__, "Lazy timer paused part way through a second", "failed", lazy.return_state_str()))
+
+    for i in range(len(tests)):
+        print(tests[i].return_result())
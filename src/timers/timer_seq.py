@@ -1,127 +1,193 @@
-import timers.timer as timer
-from timers.test import Test
-import logging.config
-
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger('raspidoroLogger')
-
-
-# Class to manage the available timer sequences. This is just a shell at the moment.
-# ToDo: add more sequences and the necessary functions to manage them.
-class TimerSequenceManager:
-    def __init__(self, speed=1):
-        self.speed = speed
-        self.timer_seq = TimerSequence(self.speed)
-
-
-# Class to manage the current sequence.
-class TimerSequence:
-    def __init__(self, speed=1):
-        self.timer_factory = timer.TimerFactory()
-        self.timer_seq = []
-        self.current_timer = None
-        self.create_sequence()
-
-        # Allows for faster than real time for testing/demo purposes.
-        self.speed = speed
-
-    # Create the timer sequence.
-    def create_sequence(self):
-        # Initial timer list ToDo: make more flexible by adding more timer sequences.
-        timer_list = [
-            ['Work', 'Work 1', 'Work', 25 * 60],
-            ['Break', 'Break 1', 'Short Break - Stretch', 5 * 60],
-            ['Work', 'Work 2', 'Standing Work', 25 * 60],
-            ['Break', 'Break 2', 'Short Break - Water', 5 * 60],
-            ['Work', 'Work 3', 'Work', 25 * 60],
-            ['Break', 'Break 3', 'Long Break - Exercise', 15 * 60]
-        ]
-
-        for item in timer_list:
-            self.timer_seq.append(self.timer_factory.get_timer(*item))
-
-        # for item in self.timer_seq:
-        #    print(item.return_state_str())
-
-        self.current_timer = self.timer_seq.pop(0)
-
-    # Decrement the current timer according to set speed, which may be different from real time.
-    def decrement_current_timer(self):
-        # Decrement the current timer in relation to the current speed, which may be different from real time.
-        for count in range(self.speed):
-            self.current_timer.decrement_time()
-
-    # Toggle the pause on the current timer.
-    def toggle_pause_current_timer(self):
-        self.current_timer.toggle_pause()
-
-    # Restart the current timer.
-    def restart_current_timer(self):
-        self.current_timer.restart()
-
-    # Restarting sequence just creates the sequence again.
-    def restart_sequence(self):
-        self.create_sequence()
-
-    # Go to the next timer.
-    def next_timer(self):  #
-        # Restart the current timer -just resetting it.
-        logger.info(f"Current timer {self.current_timer.return_state_str()}")
-        self.current_timer.restart()
-
-        # Append the current timer to the end of the timer sequence.
-        self.timer_seq.append(self.current_timer)
-        self.current_timer = self.timer_seq.pop(0)
-        self.current_timer.start()
-        logger.info(f"Current timer {self.current_timer.return_state_str()}")
-
-
-if __name__ == '__main__':
-    tests = []
-
-    timer_seq_mgr = TimerSequenceManager()
-    timer_seq = timer_seq_mgr.timer_seq
-    timer_seq.current_timer.start()
-    state = None
-
-    for i in range(30 * 60):
-        timer_seq.decrement_current_timer()
-        state = timer_seq.current_timer.return_state_str()
-        print(state)
-
-    if state == 'timer name: Work 1 state: complete remaining: 0 overrun: -300':
-        tests.append(Test(__file__, "Work 1 test", "passed"))
-    else:
-        tests.append(Test(__file__, "Work 1 test", "failed"))
-
-    # Try faster timers
-    timer_seq_mgr = TimerSequenceManager(speed=15)
-    timer_seq = timer_seq_mgr.timer_seq
-    timer_seq.current_timer.start()
-    state = None
-
-    for i in range(30 * 4):
-        timer_seq.decrement_current_timer()
-        state = timer_seq.current_timer.return_state_str()
-        print(state)
-
-    if state == 'timer name: Work 1 state: complete remaining: 0 overrun: -300':
-        tests.append(Test(__file__, "Work 1 test", "passed"))
-    else:
-        tests.append(Test(__file__, "Work 1 test", "failed"))
-
-    # Go to the next timer.
-    timer_seq.next_timer()
-
-    # print(timer_seq.current_timer.return_state_str())
-
-    if timer_seq.current_timer.return_state_str() == 'timer name: Break 1 state: paused remaining: 300 overrun: 0':
-        tests.append(Test(__file__, "Next Timer", "passed"))
-    else:
-        tests.append(Test(__file__, "Next Timer", "failed"))
-
-    for timer in timer_seq.timer_seq:
-        print(timer.return_state_str())
-
-    for test in tests:
-        print(test.return_result())
+import timers.timer as timer
+from timers.test import Test
+import logging
+
+# Logging is configured by the program using the timers (see logsetup), not on import.
+logger = logging.getLogger('raspidoroLogger')
+
+
+# Class to manage the available timer sequences. This is just a shell at the moment.
+# ToDo: add more sequences and the necessary functions to manage them.
+class TimerSequenceManager:
+    def __init__(self, speed=1, time_source=None, history=None):
+        self.speed = speed
+        self.timer_seq = TimerSequence(self.speed, time_source, history)
+
+
+# Class to manage the current sequence.
+class TimerSequence:
+    def __init__(self, speed=1, time_source=None, history=None):
+        self.timer_factory = timer.TimerFactory()
+
+        # Optional history.SessionHistory that completions, overruns, pauses and restarts are recorded in.
+        self.history = history
+        self.timer_seq = []
+        self.current_timer = None
+
+        # Allows for faster than real time for testing/demo purposes.
+        self.speed = speed
+
+        # If a time source (e.g. time.monotonic) is given, the timers are lazy and time themselves, so they don't need
+        # to be decremented.
+        self.time_source = time_source
+
+        self.create_sequence()
+
+    # Create the timer sequence.
+    def create_sequence(self):
+        # Initial timer list ToDo: make more flexible by adding more timer sequences.
+        timer_list = [
+            ['Work', 'Work 1', 'Work', 25 * 60],
+            ['Break', 'Break 1', 'Short Break - Stretch', 5 * 60],
+            ['Work', 'Work 2', 'Standing Work', 25 * 60],
+            ['Break', 'Break 2', 'Short Break - Water', 5 * 60],
+            ['Work', 'Work 3', 'Work', 25 * 60],
+            ['Break', 'Break 3', 'Long Break - Exercise', 15 * 60]
+        ]
+
+        for item in timer_list:
+            self.timer_seq.append(self.timer_factory.get_timer(*item))
+
+            if self.time_source is not None:
+                self.timer_seq[-1].set_time_source(self.time_source, self.speed)
+
+        # for item in self.timer_seq:
+        #    print(item.return_state_str())
+
+        self.current_timer = self.timer_seq.pop(0)
+
+    # Decrement the current timer according to set speed, which may be different from real time.
+    def decrement_current_timer(self):
+        # Decrement the current timer in relation to the current speed, which may be different from real time.
+        self.advance(1)
+
+    # Advance the current timer by a number of real seconds in one step, scaled by the set speed.
+    # Lazy timers keep their own time, so there is nothing to do.
+    def advance(self, seconds):
+        if self.time_source is None:
+            self.current_timer.advance(seconds * self.speed)
+
+    # Record an event for a timer in the history, if there is one.
+    def record_history(self, event, timer_to_record, value=None):
+        if self.history is not None:
+            self.history.record(event, timer_to_record, value)
+
+    # Toggle the pause on the current timer.
+    def toggle_pause_current_timer(self):
+        self.current_timer.toggle_pause()
+        self.record_history('resume' if self.current_timer.return_state() == 'running' else 'pause', self.current_timer)
+
+    # Restart the current timer. A timer that had counted down is recorded as completed, as when going to the next
+    # timer, otherwise as restarted with the seconds lost.
+    def restart_current_timer(self):
+        time_remaining = self.current_timer.time_remaining
+
+        if time_remaining <= 0:
+            self.record_complete(time_remaining)
+        else:
+            self.record_history('restart', self.current_timer, self.current_timer.length_sec - time_remaining)
+
+        self.current_timer.restart()
+
+    # Record the current timer as completed, with the seconds it was overrun by. A completed timer that was paused and
+    # un-paused counts on below zero rather than in the overrun time.
+    def record_complete(self, time_remaining):
+        self.record_history('complete', self.current_timer, -self.current_timer.overrun_time - time_remaining)
+
+    # Restarting sequence just creates the sequence again.
+    def restart_sequence(self):
+        self.create_sequence()
+
+    # Go to the next timer.
+    def next_timer(self):  #
+        # Restart the current timer -just resetting it.
+        logger.info(f"Current timer {self.current_timer.return_state_str()}")
+
+        # Record how the timer finished - completed with any overrun, or skipped with the time it had left.
+        time_remaining = self.current_timer.time_remaining
+
+        if time_remaining <= 0:
+            self.record_complete(time_remaining)
+        else:
+            self.record_history('skip', self.current_timer, time_remaining)
+
+        self.current_timer.restart()
+
+        # Append the current timer to the end of the timer sequence.
+        self.timer_seq.append(self.current_timer)
+        self.current_timer = self.timer_seq.pop(0)
+
+        # Restarted rather than just started - a lazy timer counts from its time source while it waits in the
+        # sequence, and that time mustn't count towards it.
+        self.current_timer.restart()
+        logger.info(f"Current timer {self.current_timer.return_state_str()}")
+
+
+if __name__ == '__main__':
+    tests = []
+
+    timer_seq_mgr = TimerSequenceManager()
+    timer_seq = timer_seq_mgr.timer_seq
+    timer_seq.current_timer.start()
+    state = None
+
+    for i in range(30 * 60):
+        timer_seq.decrement_current_timer()
+        state = timer_seq.current_timer.return_state_str()
+        print(state)
+
+    if state == 'timer name: Work 1 state: complete remaining: 0 overrun: -300':
+        tests.append(Test(__file__, "Work 1 test", "passed"))
+    else:
+        tests.append(Test(__file__, "Work 1 test", "failed"))
+
+    # Try faster timers
+    timer_seq_mgr = TimerSequenceManager(speed=15)
+    timer_seq = timer_seq_mgr.timer_seq
+    timer_seq.current_timer.start()
+    state = None
+
+    for i in range(30 * 4):
+        timer_seq.decrement_current_timer()
+        state = timer_seq.current_timer.return_state_str()
+        print(state)
+
+    if state == 'timer name: Work 1 state: complete remaining: 0 overrun: -300':
+        tests.append(Test(__file__, "Work 1 test", "passed"))
+    else:
+        tests.append(Test(__file__, "Work 1 test", "failed"))
+
+    # Go to the next timer, which is started with its full length.
+    timer_seq.next_timer()
+
+    # print(timer_seq.current_timer.return_state_str())
+
+    if timer_seq.current_timer.return_state_str() == 'timer name: Break 1 state: running remaining: 300 overrun: 0':
+        tests.append(Test(__file__, "Next Timer", "passed"))
+    else:
+        tests.append(Test(__file__, "Next Timer", "failed"))
+
+    for sequence_timer in timer_seq.timer_seq:
+        print(sequence_timer.return_state_str())
+
+    # Restarting a timer that has counted down records it as completed, so it counts as a pomodoro.
+    import timers.history as history
+
+    session_history = history.SessionHistory(':memory:')
+    timer_seq = TimerSequenceManager(history=session_history).timer_seq
+    timer_seq.current_timer.start()
+    timer_seq.advance(25 * 60 + 30)
+    timer_seq.restart_current_timer()
+    timer_seq.advance(60)
+    timer_seq.restart_current_timer()
+
+    if [count for day, count in session_history.pomodoros_per_day()] == [1] and \
+            session_history.event_counts_per_timer() == {'Work 1': {'complete': 1, 'restart': 1}} and \
+            session_history.average_overrun('Work') == 30:
+        tests.append(Test(__file__, "Restart after completing", "passed"))
+    else:
+        tests.append(Test(__file__, "Restart after completing", "failed",
+                          f"{session_history.event_counts_per_timer()}"))
+
+    for test in tests:
+        print(test.return_result())
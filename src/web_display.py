@@ -0,0 +1,464 @@
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import urllib.parse
+
+import display
+
+# Key from the WebSocket standard, used in the handshake.
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC11B85'
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+# Largest message accepted from a browser - control messages are tiny.
+MAX_CLIENT_MESSAGE_BYTES = 4096
+
+# A client with more than this waiting to be sent is too slow to keep up. It is sent nothing more until it has caught
+# up, then sent the full state rather than the changes it missed.
+MAX_CLIENT_BUFFER_BYTES = 64 * 1024
+
+# State sent to the browsers, with the short keys used in the messages.
+STATE_KEYS = {'name': 'n', 'description': 'd', 'colour': 'c', 'type': 'k', 'length': 'l', 'remaining': 'r',
+              'mode': 'm'}
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Pomodoro clock</title>
+<style>
+body { background: #000; color: #fff; font-family: sans-serif; text-align: center; }
+#remaining { font-size: 6em; font-weight: bold; margin: 0.2em 0; }
+#description { font-size: 1.5em; }
+button { font-size: 1.2em; margin: 0.3em; padding: 0.4em 1em; }
+</style>
+</head>
+<body>
+<div id="clock"></div>
+<div id="name"></div>
+<div id="remaining"></div>
+<div id="description"></div>
+<div>
+<button data-action="toggle_pause">Pause</button>
+<button data-action="restart">Restart</button>
+<button data-action="next">Next</button>
+<button data-action="mode">Mode</button>
+</div>
+<script>
+let state = {};
+let socket;
+
+function pad(value) { return String(value).padStart(2, '0'); }
+
+function show() {
+    const remaining = state.r || 0;
+    const sign = remaining < 0 ? '-' : '';
+    document.getElementById('remaining').textContent =
+        sign + pad(Math.trunc(Math.abs(remaining) / 60)) + ':' + pad(Math.abs(remaining) % 60);
+    document.getElementById('remaining').style.color = state.c || '#fff';
+    document.getElementById('name').textContent = state.n || '';
+    document.getElementById('description').textContent = state.d || '';
+}
+
+function connect() {
+    socket = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+    socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        state = message.full ? message : Object.assign(state, message);
+        show();
+    };
+    socket.onclose = () => setTimeout(connect, 1000);
+}
+
+document.querySelectorAll('button').forEach((button) => {
+    button.onclick = () => socket.send(JSON.stringify({action: button.dataset.action}));
+});
+
+setInterval(() => {
+    const now = new Date();
+    document.getElementById('clock').textContent =
+        now.toLocaleDateString() + ' ' +
+        pad(now.getHours()) + ':' + pad(now.getMinutes()) + ':' + pad(now.getSeconds());
+}, 1000);
+
+connect();
+</script>
+</body>
+</html>
+"""
+
+
+# Encode a WebSocket frame. Frames from the server aren't masked.
+def encode_frame(payload, opcode=OPCODE_TEXT):
+    length = len(payload)
+
+    if length < 126:
+        header = bytes([0x80 | opcode, length])
+    elif length < 65536:
+        header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, 'big')
+    else:
+        header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, 'big')
+
+    return header + payload
+
+
+# Read a WebSocket frame from a client, returning (opcode, payload). Frames from clients are always masked.
+async def read_frame(reader):
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), 'big')
+
+    if length > MAX_CLIENT_MESSAGE_BYTES:
+        raise ValueError(f"WebSocket message too long length={length}")
+
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = await reader.readexactly(length)
+
+    return opcode, bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+
+# A browser connected over WebSocket.
+class WebClient:
+    def __init__(self, writer):
+        self.writer = writer
+
+        # Set when changes were held back because the client was too slow - it is sent the full state next.
+        self.needs_full_state = True
+
+    def send(self, frame):
+        self.writer.write(frame)
+
+    def buffered_bytes(self):
+        return self.writer.transport.get_write_buffer_size()
+
+
+# Display that serves a page showing the clock to browsers, and streams the state to them over WebSocket. Only the
+# changes to the timer, countdown and mode are sent, encoded once for every browser - browsers show the date and time
+# from their own clock. The buttons on the page send control messages that go to the clock's control functions.
+#
+# Run as a display thread, the server has its own asyncio loop on that thread, so hundreds of browsers don't slow the
+# LCD. With the asyncio runtime, serve(render=False) is run on the runtime's loop as well.
+class WebDisplay(display.Display):
+    def __init__(self, toggle_pause_function, restart_function, next_function, host='0.0.0.0', port=8080,
+                 timebase=None):
+        super().__init__(display.PANEL_WIDTH, display.PANEL_HEIGHT, toggle_pause_function, restart_function,
+                         next_function, timebase=timebase)
+        self.daemon = True
+        self.host = host
+        self.port = port
+
+        self.change_mode()
+
+        self.control_functions = {'toggle_pause': self.toggle_pause_function,
+                                  'restart': self.restart_function,
+                                  'next': self.next_function,
+                                  'mode': self.change_mode_and_show}
+
+        self._loop = None
+        self._server = None
+        self._clients = set()
+        self._state = {}
+
+        # Set once the server is listening - port is then the port it is on (e.g. if 0 was asked for).
+        self.ready = threading.Event()
+
+        self.messages_sent = 0
+        self.clients_resynced = 0
+
+    def change_mode(self):
+        super().change_mode()
+
+    # Change mode from the page, and show it straight away.
+    def change_mode_and_show(self):
+        self.change_mode()
+
+        latest_data = self.current_data_slot.peek()
+        if latest_data is not None:
+            self.publish(latest_data)
+
+    # Only the timer data and mode change what is sent, not the time of day.
+    def render_key(self, current_data):
+        return current_data.current_timer_data, self._curr_mode
+
+    # Work out what has changed and send it to the browsers.
+    def update_display(self):
+        timer_data = self.current_data.current_timer_data
+        state = {'n': timer_data.name,
+                 'd': timer_data.description,
+                 'c': timer_data.timer_colour,
+                 'k': timer_data.timer_type,
+                 'l': timer_data.length_sec,
+                 'r': timer_data.remaining_timer_s,
+                 'm': self._curr_mode}
+
+        changes = {key: value for key, value in state.items() if self._state.get(key) != value}
+        self._state = state
+
+        if changes and self._loop is not None:
+            # Rendered on another thread when run by the asyncio runtime.
+            self._loop.call_soon_threadsafe(self.broadcast, changes)
+
+    # Return the frame with the full state, for new and resynced clients.
+    def full_state_frame(self):
+        return encode_frame(json.dumps(dict(self._state, full=True), separators=(',', ':')).encode())
+
+    # Send changes to every client. A client that has fallen behind is skipped, then sent the full state once it has
+    # caught up.
+    def broadcast(self, changes):
+        frame = encode_frame(json.dumps(changes, separators=(',', ':')).encode())
+        full_frame = None
+
+        for client in self._clients:
+            if client.buffered_bytes() > MAX_CLIENT_BUFFER_BYTES:
+                client.needs_full_state = True
+                continue
+
+            if client.needs_full_state:
+                if full_frame is None:
+                    full_frame = self.full_state_frame()
+                client.send(full_frame)
+                client.needs_full_state = False
+                self.clients_resynced += 1
+            else:
+                client.send(frame)
+
+        self.messages_sent += 1
+
+    # Serve the page and WebSocket. If render is True, also render the data published to the display - not when the
+    # asyncio runtime renders it.
+    async def serve(self, render=True):
+        self._loop = asyncio.get_running_loop()
+        published = asyncio.Event()
+
+        if render:
+            self.current_data_slot.add_listener(lambda: self._loop.call_soon_threadsafe(published.set))
+
+            # Render what has already been published, so the first browsers are sent the full state.
+            published.set()
+
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        if not render:
+            self.ready.set()
+            await self._server.serve_forever()
+            return
+
+        async with self._server:
+            while True:
+                await published.wait()
+                published.clear()
+
+                taken = self.current_data_slot.wait_for_new(timeout=0)
+                if taken is not None:
+                    self.render(*taken)
+
+                self.ready.set()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    # Handle an HTTP request - the page, or the upgrade to a WebSocket.
+    async def handle_connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            request_line, *header_lines = request.decode('latin-1').split('\r\n')
+            method, path, version = request_line.split(' ', 2)
+            headers = {name.strip().lower(): value.strip()
+                       for name, value in (line.split(':', 1) for line in header_lines if ':' in line)}
+
+            if method != 'GET':
+                self.send_response(writer, '405 Method Not Allowed', b'')
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                if 'sec-websocket-key' not in headers:
+                    self.send_response(writer, '400 Bad Request', b'')
+                elif not self.same_origin(headers):
+                    self.send_response(writer, '403 Forbidden', b'')
+                else:
+                    await self.handle_websocket(reader, writer, headers)
+            elif path in ('/', '/index.html'):
+                self.send_response(writer, '200 OK', PAGE.encode(), 'text/html; charset=utf-8')
+            else:
+                self.send_response(writer, '404 Not Found', b'')
+
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Return True unless the WebSocket was opened from another site's page. Browsers send the origin of the page, which
+    # must be this server, so a page on any other site can't pause or skip the timers. Clients that aren't browsers
+    # send no origin.
+    @staticmethod
+    def same_origin(headers):
+        origin = headers.get('origin')
+
+        if origin is None:
+            return True
+
+        return urllib.parse.urlsplit(origin).netloc.lower() == headers.get('host', '').lower()
+
+    @staticmethod
+    def send_response(writer, status, body, content_type='text/plain'):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+
+    # Complete the WebSocket handshake, send the full state, then handle control messages until the client goes.
+    async def handle_websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(headers['sec-websocket-key'].encode() + WEBSOCKET_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+        client = WebClient(writer)
+        client.send(self.full_state_frame())
+        client.needs_full_state = False
+        self._clients.add(client)
+
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+
+                if opcode == OPCODE_TEXT:
+                    self.handle_message(payload)
+                elif opcode == OPCODE_PING:
+                    client.send(encode_frame(payload, OPCODE_PONG))
+                elif opcode == OPCODE_CLOSE:
+                    client.send(encode_frame(b'', OPCODE_CLOSE))
+                    break
+        finally:
+            self._clients.discard(client)
+
+    # Run the control function a message asks for. Anything unrecognised is ignored.
+    def handle_message(self, payload):
+        try:
+            action = json.loads(payload).get('action')
+        except (ValueError, AttributeError):
+            return
+
+        control_function = self.control_functions.get(action)
+        if control_function is not None:
+            control_function()
+
+    # Return the number of clients connected and messages sent.
+    def return_client_stats(self):
+        return {'clients': len(self._clients),
+                'messages_sent': self.messages_sent,
+                'clients_resynced': self.clients_resynced}
+
+
+# Tests
+if __name__ == '__main__':
+    import datetime
+    import os
+    import time
+    from timers.test import Test
+
+    tests = []
+    calls = []
+
+    web_display = WebDisplay(lambda: calls.append('toggle_pause'), lambda: calls.append('restart'),
+                             lambda: calls.append('next'), host='127.0.0.1', port=0)
+    web_display.start()
+    web_display.ready.wait(5)
+
+    timer_info = display.TimerInfo('Work 1', 'Work', 25 * 60, '#FF0000', 'Work')
+    start = datetime.datetime(2026, 1, 1, 9, 0, 0)
+    web_display.publish(display.CurrentData(start, display.CurrentTimerData(timer_info, 1500)))
+
+    # Browsers, connected over WebSocket, that keep the messages they are sent.
+    async def run_clients(count):
+        async def connect():
+            reader, writer = await asyncio.open_connection('127.0.0.1', web_display.port)
+            key = base64.b64encode(os.urandom(16))
+            writer.write(b'GET /ws HTTP/1.1\r\nHost: localhost:8080\r\nOrigin: http://localhost:8080\r\n'
+                         b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Key: ' + key + b'\r\nSec-WebSocket-Version: 13\r\n\r\n')
+            await reader.readuntil(b'\r\n\r\n')
+            return reader, writer
+
+        async def receive(reader, messages):
+            while True:
+                opcode, payload = await read_frame(reader)
+                messages.append(json.loads(payload))
+
+        connections = await asyncio.gather(*(connect() for index in range(count)))
+        received = [[] for index in range(count)]
+        receivers = [asyncio.ensure_future(receive(reader, messages))
+                     for (reader, writer), messages in zip(connections, received)]
+        await asyncio.sleep(0.2)
+
+        # The time of day changing alone sends nothing, the countdown changing sends only the countdown.
+        web_display.publish(display.CurrentData(start + datetime.timedelta(seconds=1),
+                                                display.CurrentTimerData(timer_info, 1500)))
+        await asyncio.sleep(0.1)
+        web_display.publish(display.CurrentData(start + datetime.timedelta(seconds=2),
+                                                display.CurrentTimerData(timer_info, 1499)))
+        await asyncio.sleep(0.5)
+
+        # A masked control message from one browser.
+        mask = os.urandom(4)
+        payload = json.dumps({'action': 'next'}).encode()
+        connections[0][1].write(bytes([0x81, 0x80 | len(payload)]) + mask +
+                                bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload)))
+        await asyncio.sleep(0.2)
+
+        for receiver in receivers:
+            receiver.cancel()
+        for reader, writer in connections:
+            writer.close()
+
+        return received
+
+    client_count = 300
+    start_time = time.perf_counter()
+    received = asyncio.run(run_clients(client_count))
+    elapsed = time.perf_counter() - start_time
+
+    expected = [{'n': 'Work 1', 'd': 'Work', 'c': '#FF0000', 'k': 'Work', 'l': 1500, 'r': 1500, 'm': 'clock',
+                 'full': True}, {'r': 1499}]
+
+    if all(messages == expected for messages in received):
+        tests.append(Test(__file__, "Full state then changes", "passed",
+                          f"{client_count} clients in {elapsed:.2f}s {web_display.return_client_stats()}"))
+    else:
+        wrong = [messages for messages in received if messages != expected]
+        tests.append(Test(__file__, "Full state then changes", "failed", f"{len(wrong)} wrong, e.g. {wrong[0]}"))
+
+    if calls == ['next']:
+        tests.append(Test(__file__, "Control message", "passed"))
+    else:
+        tests.append(Test(__file__, "Control message", "failed", f"{calls}"))
+
+    # A handshake without a key, or from another site's page, is refused.
+    async def return_status(extra_headers):
+        reader, writer = await asyncio.open_connection('127.0.0.1', web_display.port)
+        writer.write(b'GET /ws HTTP/1.1\r\nHost: localhost:8080\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n' +
+                     extra_headers + b'\r\n')
+        status_line = await reader.readline()
+        writer.close()
+        return status_line.split(b' ')[1]
+
+    key_header = b'Sec-WebSocket-Key: ' + base64.b64encode(os.urandom(16)) + b'\r\n'
+    statuses = [asyncio.run(return_status(extra_headers))
+                for extra_headers in (b'', key_header + b'Origin: http://example.com\r\n',
+                                      key_header + b'Origin: http://localhost:8080\r\n')]
+
+    if statuses == [b'400', b'403', b'101']:
+        tests.append(Test(__file__, "Refused handshakes", "passed"))
+    else:
+        tests.append(Test(__file__, "Refused handshakes", "failed", f"{statuses}"))
+
+    for test in tests:
+        print(test.return_result())